@@ -0,0 +1,62 @@
+"""Fixed question concurrency against the adaptive (AIMD) limiter.
+
+Runs one task x setting on the simulated backend with a provider rate limit
+(`--rps`, rejected calls are 429s) and a server that slows down beyond
+`--capacity` concurrent requests, once per fixed worker count and once with
+`--adaptive-concurrency`. The adaptive run should land near the best fixed
+setting without knowing it in advance:
+
+    python3 benchmarks/adaptive_concurrency.py --rps 100 --capacity 8 --workers 1 2 4 8 16 32
+"""
+import argparse
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from benchmarks.suite import SETTINGS, TASK_DATASETS, run_isolated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--task", type=str, default="multispanqa", choices=list(TASK_DATASETS))
+    parser.add_argument("--setting", type=str, default="factored", choices=SETTINGS)
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", help="Fixed concurrencies to compare.", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--max-in-flight", type=int, help="Upper bound of the adaptive limit.", default=32)
+    parser.add_argument("--latency-mean", type=float, default=0.05)
+    parser.add_argument("--rps", type=float, help="Simulated provider rate limit (requests/sec).", default=150.0)
+    parser.add_argument("--capacity", type=int, help="Requests the simulated server serves at full speed.", default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = {
+        "latency_mean": args.latency_mean,
+        "requests_per_second": args.rps,
+        "capacity": args.capacity,
+        "seed": args.seed,
+    }
+    scenario_args = {
+        "model": "gemini2.5_flash_lite",
+        "questions": args.questions,
+        "no_checkpoint": True,
+        "no_dedupe": False,
+        "stream": False,
+        "call_timeout": None,
+        "hedge_quantile": None,
+        "max_in_flight": args.max_in_flight,
+    }
+    runs = [(f"fixed {workers}", {"workers": workers, "adaptive_concurrency": False}) for workers in args.workers]
+    runs.append(("adaptive", {"workers": 1, "adaptive_concurrency": True}))
+
+    print(f"{'concurrency':<14}{'q/s':>8}{'req/q':>8}{'429s':>7}{'limit':>7}")
+    for name, overrides in runs:
+        row = run_isolated(args.task, args.setting, {**scenario_args, **overrides}, config)
+        if "error" in row:
+            print(f"{name:<14}❌ {row['error']}")
+            continue
+        print(
+            f"{name:<14}{row['questions_per_second']:>8.2f}{row['requests_per_question']:>8.2f}"
+            f"{row['rate_limited']:>7}{row['final_limit']:>7}"
+        )
@@ -0,0 +1,120 @@
+"""Calls saved vs. accuracy delta of adaptive (early-exit) CoVe.
+
+Replays the early-exit decision offline on result files from full runs that
+recorded a baseline confidence (main.py --confidence-method ... without
+--confidence-threshold), one per bundled dataset, e.g.:
+
+    python3 main.py --model=llama2 --task=wikidata --setting=factored --confidence-method=logprob
+    python3 benchmarks/adaptive_early_exit.py \
+        -r wikidata=result/llama2_wikidata_factored_results.json \
+           wikidata_category=result/llama2_wikidata_category_factored_results.json \
+           multispanqa=result/llama2_multispanqa_factored_results.json
+"""
+import argparse
+import os
+import sys
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from src.data.data_processor import (
+    read_json,
+    get_items_from_answer,
+    get_cleaned_final_answer,
+    get_answers_from_list,
+)
+from src.evaluate import compute_metrics_for_list_answer, compute_metrics_for_open_answer
+
+DATASET_PATHS = {
+    "wikidata": "dataset/wikidata_questions.json",
+    "wikidata_category": "dataset/wikidata_category_dataset.json",
+    "multispanqa": "dataset/multispanqa_dataset.json",
+}
+VERIFICATION_CALLS = {"two_step": 3, "joint": 2}
+
+
+def get_setting(result_path: str) -> str:
+    name = os.path.basename(result_path)
+    for setting in ["two_step", "joint", "factored"]:
+        if f"_{setting}" in name:
+            return setting
+    raise ValueError(f"Cannot tell the CoVe setting of {result_path} from its file name.")
+
+
+def verification_calls(result: Dict[str, str], setting: str) -> int:
+    if setting == "factored":
+        # plan + one execute per verification question + verify
+        return 2 + len(get_items_from_answer(result["Verification Questions"]))
+    return VERIFICATION_CALLS[setting]
+
+
+def score(task: str, answers: List[str], true_answers: List) -> float:
+    if task == "multispanqa":
+        return compute_metrics_for_open_answer(answers, true_answers)["f1_score"]
+    cleaned = get_cleaned_final_answer([{"answer": answer} for answer in answers], "answer")
+    return compute_metrics_for_list_answer(cleaned, true_answers)["precision"]
+
+
+def benchmark(task: str, result_path: str, thresholds: List[float], scoring_calls: int):
+    results = read_json(result_path)
+    if not results or "Baseline Confidence" not in results[0]:
+        raise ValueError(f"{result_path} has no 'Baseline Confidence', rerun with --confidence-method.")
+    setting = get_setting(result_path)
+
+    dataset = read_json(os.path.join(REPO_ROOT, DATASET_PATHS[task]))
+    true_answers = list(dataset.values()) if task == "wikidata" else get_answers_from_list(dataset)
+    true_answers = [true_answers[result.get("Index", i)] for i, result in enumerate(results)]
+
+    full_answers = [result["Final Refined Answer"] for result in results]
+    full_calls = sum(1 + scoring_calls + verification_calls(r, setting) for r in results)
+    full_metric = score(task, full_answers, true_answers)
+    metric_name = "f1" if task == "multispanqa" else "precision"
+
+    print(f"\n{task} ({setting}, {len(results)} questions) — full CoVe {metric_name}: {full_metric:.3f}, "
+          f"{full_calls / len(results):.2f} calls/question")
+    print(f"{'threshold':>10} {'exit %':>8} {'calls/q':>8} {'saved %':>8} {metric_name:>10} {'delta':>8}")
+    for threshold in thresholds:
+        exits = [r["Baseline Confidence"] >= threshold for r in results]
+        answers = [
+            r["Baseline Answer"] if exit else r["Final Refined Answer"] for r, exit in zip(results, exits)
+        ]
+        calls = sum(
+            1 + scoring_calls + (0 if exit else verification_calls(r, setting))
+            for r, exit in zip(results, exits)
+        )
+        metric = score(task, answers, true_answers)
+        print(
+            f"{threshold:>10.2f} {sum(exits) / len(results) * 100:>8.1f} {calls / len(results):>8.2f} "
+            f"{(1 - calls / full_calls) * 100:>8.1f} {metric:>10.3f} {metric - full_metric:>+8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "-r",
+        "--results",
+        type=str,
+        nargs="+",
+        help="TASK=RESULT_PATH pairs, one per dataset.",
+        required=True,
+    )
+    argParser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs="+",
+        help="Confidence thresholds to evaluate.",
+        default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95],
+    )
+    argParser.add_argument(
+        "--scoring-calls",
+        type=int,
+        help="Extra calls per question spent on scoring (0 for logprob, --consistency-samples for self_consistency).",
+        default=0,
+    )
+    args = argParser.parse_args()
+
+    for pair in args.results:
+        task, result_path = pair.split("=", 1)
+        benchmark(task, result_path, args.thresholds, args.scoring_calls)
@@ -0,0 +1,92 @@
+"""Cost and effect of constraining list stages to numbered lists while decoding.
+
+Builds a randomly initialised Llama (no download needed) over the vocabulary
+of `--tokenizer` and samples list-stage responses with and without
+`NumberedListLogitsProcessor`. Reports decode speed, generated tokens and the
+share of non-empty lines that parse as "k. item". Random weights ramble
+like nothing real does, so the token counts only bound the saving; the
+per-token overhead of the processor is what carries over to real models:
+
+    python3 benchmarks/constrained_lists.py --tokenizer hf-internal-testing/llama-tokenizer
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+import torch
+from transformers import AutoTokenizer, LlamaConfig, LlamaForCausalLM, LogitsProcessorList, set_seed
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from src.prompt_optim.cove.constrained_decoding import ListVocabulary, NumberedListLogitsProcessor
+
+NUMBERED_LINE = re.compile(r"\s*\d+\. \S")
+
+
+def run(model, tokenizer, prompt_ids, requests: int, max_tokens: int, processor_factory=None, eos_token_id=None):
+    generated, parsed, lines = 0, 0, 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        kwargs = {}
+        if processor_factory is not None:
+            kwargs["logits_processor"] = LogitsProcessorList([processor_factory()])
+        output = model.generate(
+            input_ids=prompt_ids,
+            max_new_tokens=max_tokens,
+            do_sample=True,
+            temperature=1.0,
+            pad_token_id=eos_token_id,
+            eos_token_id=eos_token_id,
+            **kwargs,
+        )
+        new_tokens = output[0, prompt_ids.shape[1]:]
+        generated += len(new_tokens)
+        text = tokenizer.decode(new_tokens, skip_special_tokens=True)
+        for line in text.split("\n"):
+            if line.strip():
+                lines += 1
+                parsed += bool(NUMBERED_LINE.match(line))
+    return time.perf_counter() - start, generated, parsed / lines if lines else 1.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokenizer", type=str, help="Tokenizer whose vocabulary the model uses.", default="hf-internal-testing/llama-tokenizer")
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--max-tokens", type=int, help="Token limit of each response, like max_tokens_plan.", default=300)
+    parser.add_argument("--max-items", type=int, default=10)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    torch.manual_seed(args.seed)
+    model = LlamaForCausalLM(LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=args.hidden_size,
+        intermediate_size=args.hidden_size * 4,
+        num_hidden_layers=args.layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+    )).eval()
+    prompt_ids = tokenizer("[INST] Who are some politicians who were born in Boston? [/INST]", return_tensors="pt").input_ids
+
+    start = time.perf_counter()
+    vocabulary = ListVocabulary(tokenizer, model.config.vocab_size)
+    print(f"List vocabulary of {len(tokenizer)} tokens built in {time.perf_counter() - start:.2f}s (once per model)")
+
+    print(f"{'decoding':<14}{'tok/s':>9}{'tokens/req':>12}{'parsed lines':>14}")
+    for name, factory in [
+        ("free", None),
+        ("constrained", lambda: NumberedListLogitsProcessor(vocabulary, prompt_ids.shape[1], args.max_items)),
+    ]:
+        set_seed(args.seed)
+        with torch.inference_mode():
+            seconds, generated, parsed = run(
+                model, tokenizer, prompt_ids, args.requests, args.max_tokens, factory, vocabulary.eos_token_id
+            )
+        print(f"{name:<14}{generated / seconds:>9.1f}{generated / args.requests:>12.1f}{parsed:>14.0%}")
@@ -0,0 +1,127 @@
+"""Load time, decode speed and memory of each model-loading profile.
+
+Loads the model once per profile (see LOAD_PROFILES in src/utils.py), each in
+a fresh process, and greedily generates `--new-tokens` tokens after a random
+prompt. Profiles the machine cannot run (no GPU, missing quantized checkpoint
+or kernel package) are reported as skipped or failed rather than falling back,
+so the table shows what each deployment actually supports:
+
+    python3 benchmarks/load_profiles.py --model llama2 --profiles nf4 8bit fp16 fp16_flash gptq awq
+    python3 benchmarks/load_profiles.py --model-path /path/to/local/model --profiles cpu bf16
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Dict, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from src.utils import LOAD_PROFILES, MODEL_MAPPING, ModelConfig, STD_PROMPT_FORMAT
+
+
+def benchmark_profile(model_config: ModelConfig, profile_name: str, access_token: Optional[str], args: Dict) -> Dict:
+    import torch
+    from src.utils import load_model
+
+    profile = LOAD_PROFILES[profile_name]
+    if profile.needs_cuda and not torch.cuda.is_available():
+        return {"profile": profile_name, "status": "skipped: needs a CUDA GPU"}
+    if profile.quantization in ["gptq", "awq"] and profile.quantization not in model_config.quantized_ids:
+        return {"profile": profile_name, "status": f"skipped: no {profile.quantization} checkpoint"}
+
+    start = time.perf_counter()
+    model = load_model(model_config, access_token, profile_name).eval()
+    load_seconds = time.perf_counter() - start
+
+    device = next(model.parameters()).device
+    generator = torch.Generator().manual_seed(0)
+    input_ids = torch.randint(
+        1, model.config.vocab_size, (args["batch_size"], args["prompt_tokens"]), generator=generator
+    ).to(device)
+    generate_kwargs = dict(
+        max_new_tokens=args["new_tokens"],
+        min_new_tokens=args["new_tokens"],
+        do_sample=False,
+        pad_token_id=model.config.eos_token_id or 0,
+    )
+    with torch.inference_mode():
+        # Warm-up, so kernels compiled or autotuned on first use are not timed
+        model.generate(input_ids=input_ids, **{**generate_kwargs, "max_new_tokens": 2, "min_new_tokens": 2})
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        start = time.perf_counter()
+        model.generate(input_ids=input_ids, **generate_kwargs)
+        if device.type == "cuda":
+            torch.cuda.synchronize()
+        decode_seconds = time.perf_counter() - start
+
+    if device.type == "cuda":
+        peak_memory_mb = torch.cuda.max_memory_allocated() / 2**20
+    else:
+        peak_memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "profile": profile_name,
+        "status": "ok",
+        "device": str(device),
+        "load_seconds": round(load_seconds, 2),
+        "tokens_per_second": round(args["batch_size"] * args["new_tokens"] / decode_seconds, 1),
+        "peak_memory_mb": round(peak_memory_mb),
+    }
+
+
+def _profile_process(model_config, profile_name, access_token, args, queue):
+    try:
+        queue.put(benchmark_profile(model_config, profile_name, access_token, args))
+    except BaseException as e:
+        queue.put({"profile": profile_name, "status": f"failed: {type(e).__name__}: {str(e)[:80]}"})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default="llama2", choices=[
+        model_id for model_id, config in MODEL_MAPPING.items() if config.backend == "hf"
+    ])
+    parser.add_argument("--model-path", type=str, help="Benchmark a local model directory instead.", default=None)
+    parser.add_argument("--profiles", type=str, nargs="+", default=list(LOAD_PROFILES), choices=list(LOAD_PROFILES))
+    parser.add_argument("--prompt-tokens", type=int, default=256)
+    parser.add_argument("--new-tokens", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.model_path:
+        model_config = ModelConfig(id=args.model_path, prompt_format=STD_PROMPT_FORMAT)
+        access_token = None
+    else:
+        from dotenv import dotenv_values
+        from src.utils import get_absolute_path
+
+        model_config = MODEL_MAPPING[args.model]
+        access_token = dotenv_values(get_absolute_path(".env")).get("HF_API_KEY")
+
+    bench_args = {
+        "prompt_tokens": args.prompt_tokens,
+        "new_tokens": args.new_tokens,
+        "batch_size": args.batch_size,
+    }
+    context = multiprocessing.get_context("spawn")
+    print(f"{'profile':<12}{'device':<10}{'load s':>9}{'tokens/s':>10}{'peak MB':>9}")
+    for profile_name in args.profiles:
+        queue = context.Queue()
+        process = context.Process(
+            target=_profile_process, args=(model_config, profile_name, access_token, bench_args, queue)
+        )
+        process.start()
+        row = queue.get()
+        process.join()
+        if row["status"] != "ok":
+            print(f"{profile_name:<12}{row['status']}")
+            continue
+        print(
+            f"{profile_name:<12}{row['device']:<10}{row['load_seconds']:>9.2f}"
+            f"{row['tokens_per_second']:>10.1f}{row['peak_memory_mb']:>9}"
+        )
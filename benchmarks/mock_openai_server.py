@@ -0,0 +1,98 @@
+"""Local stand-in for an OpenAI-compatible chat completions server.
+
+Answers every `/v1/chat/completions` request with a short numbered list after
+a configurable latency, and fails a configurable fraction of requests with
+429/503 to exercise the client's retries. Useful to test main.py's gpt3 path
+and to measure client throughput without a GPU or an API key:
+
+    python3 benchmarks/mock_openai_server.py --port 8000 --latency 0.2 --failure-rate 0.05
+    python3 main.py --model=gpt3 --task=wikidata --setting=factored --limit=20 \
+        --base-url=http://127.0.0.1:8000/v1 --max-concurrency=16
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "1. Alice Smith\n2. Bob Jones\n3. Carol White"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like real inference servers
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+        if self.path.rstrip("/") not in ["/v1/chat/completions", "/chat/completions"]:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        time.sleep(random.uniform(0.5, 1.5) * server.latency)
+        if random.random() < server.failure_rate:
+            status = random.choice([429, 503])
+            self.send_json(status, {"error": {"message": "mock failure"}}, {"Retry-After": "0"})
+            return
+
+        prompt = request["messages"][-1]["content"]
+        self.send_json(200, {
+            "id": "mock",
+            "object": "chat.completion",
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": ANSWER},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(ANSWER) // 4,
+                "total_tokens": (len(prompt) + len(ANSWER)) // 4,
+            },
+        })
+
+
+def serve(port: int = 0, latency: float = 0.0, failure_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Start the mock server on a background thread; port 0 picks a free port."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.connections = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, help="Mean seconds per request.", default=0.2)
+    parser.add_argument("--failure-rate", type=float, help="Fraction of requests failed with 429/503.", default=0.0)
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.failure_rate)
+    print(f"🧪 Mock OpenAI server on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(f"\n{server.requests} requests over {len(server.connections)} connections")
@@ -0,0 +1,76 @@
+"""Throughput of the OpenAI-compatible backend against the local mock server.
+
+Runs the same questions through ChainOfVerificationOpenAI at several
+concurrency levels and reports questions per second, HTTP requests, retries
+and the number of TCP connections the server saw (connection reuse):
+
+    python3 benchmarks/openai_backend.py --questions 32 --latency 0.1 --concurrency 1 4 16
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from benchmarks.mock_openai_server import serve
+from src.data.data_processor import read_json, get_questions_from_dict
+from src.prompt_optim.cove.cove_chains_openai import ChainOfVerificationOpenAI
+
+
+def run(questions, base_url, server, setting: str, concurrency: int):
+    server.requests = 0
+    server.connections = set()
+    chain = ChainOfVerificationOpenAI(
+        "gpt3", 0.07, 0.9, "wikidata", setting, questions,
+        base_url=base_url, max_concurrency=concurrency,
+    )
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        chain.run_chain()
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "q/s": len(questions) / elapsed,
+        "requests": server.requests,
+        "retries": chain.backend.retries,
+        "connections": len(server.connections),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=32)
+    parser.add_argument("--setting", type=str, default="factored", choices=["joint", "two_step", "factored", "fused"])
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    questions = get_questions_from_dict(
+        read_json(os.path.join(REPO_ROOT, "dataset/wikidata_questions.json"))
+    )[: args.questions]
+    server = serve(latency=args.latency, failure_rate=args.failure_rate)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    # Results and usage files go to a scratch directory
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        print(f"{'concurrency':>12}{'q/s':>10}{'requests':>10}{'retries':>9}{'connections':>13}")
+        for concurrency in args.concurrency:
+            row = run(questions, base_url, server, args.setting, concurrency)
+            print(
+                f"{row['concurrency']:>12}{row['q/s']:>10.2f}{row['requests']:>10}"
+                f"{row['retries']:>9}{row['connections']:>13}"
+            )
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+        server.shutdown()
@@ -0,0 +1,233 @@
+"""A configurable fake LLM backend for benchmarking the chains on a CPU box.
+
+`SimulatedBackend` answers every stage with a plausibly shaped response
+(numbered entity lists, verification questions, short answers) derived from
+a hash of the prompt, so runs are repeatable and identical prompts get
+identical answers. It sleeps a latency drawn from a configurable
+distribution, enforces a requests-per-second limit with a token bucket and
+injects transient failures and stalled calls; failures surface as the same `RateLimitError` /
+`TransientError` real backends raise, and are retried by `LLMBackend`.
+Streamed calls receive the response line by line over the call's latency.
+A `LocalCacheProvider` stands in for the provider's context cache: a call
+naming a cached content is answered as if its prefix were sent in full.
+"""
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from src.prompt_optim.cove.backends import Completion, LLMBackend, RateLimitError, TransientError
+from src.prompt_optim.cove.checkpoint import CheckpointMixin
+from src.prompt_optim.cove.context_cache import CacheNotFoundError, LocalCacheProvider
+from src.prompt_optim.cove.cove_chains import ChainOfVerification
+from src.utils import MODEL_MAPPING
+
+# A small pool, so verification questions repeat across questions like real ones do
+NAMES = [
+    "Sergio Ramos", "Marcos Alonso", "David De Gea", "Fernando Torres", "Iker Casillas",
+    "Xabi Alonso", "Raul Gonzalez", "Koke", "Saul Niguez", "Isco", "Alvaro Morata",
+    "Dani Carvajal", "Lucas Vazquez", "Rodri", "Marco Asensio", "Nacho Fernandez",
+    "Jose Callejon", "Juanfran", "Diego Costa", "Pepe Reina", "Michel Salgado",
+    "Fernando Hierro", "Emilio Butragueno", "Santiago Bernabeu", "Paco Gento",
+]
+PLACES = ["Madrid, Spain", "Camas, Spain", "Seville, Spain", "Fuenlabrada, Spain", "Malaga, Spain"]
+LATENCY_DISTRIBUTIONS = ["constant", "exponential", "lognormal"]
+
+
+@dataclass
+class SimulationConfig:
+    latency_distribution: str = "lognormal"
+    # Mean seconds of a call, plus per generated token
+    latency_mean: float = 0.02
+    latency_per_token: float = 0.0
+    # Spread of the lognormal distribution (sigma of the underlying normal)
+    latency_sigma: float = 0.5
+    # Requests per second the simulated provider accepts, 0 for unlimited
+    requests_per_second: float = 0.0
+    failure_rate: float = 0.0
+    # Fraction of calls that hang for `stall_seconds`, like a stuck connection
+    stall_rate: float = 0.0
+    stall_seconds: float = 10.0
+    # Requests served at full speed at once, 0 for unlimited; beyond it latency grows with the load
+    capacity: int = 0
+    seed: int = 0
+
+
+class SimulatedBackend(LLMBackend):
+    def __init__(self, config: SimulationConfig, max_retries: int = 10, backoff: float = 0.05):
+        super().__init__(max_retries=max_retries, backoff=backoff)
+        if config.latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Invalid latency distribution, use one of {LATENCY_DISTRIBUTIONS}")
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._bucket = max(1.0, config.requests_per_second)
+        self._bucket_time = time.monotonic()
+        self.in_flight = 0
+        self.caches = LocalCacheProvider()
+
+    def latency(self, completion_tokens: int) -> float:
+        config = self.config
+        with self._lock:
+            if config.latency_distribution == "constant":
+                scale = 1.0
+            elif config.latency_distribution == "exponential":
+                scale = self._rng.expovariate(1.0)
+            else:
+                # Unit-mean lognormal
+                scale = self._rng.lognormvariate(-config.latency_sigma ** 2 / 2, config.latency_sigma)
+        return config.latency_mean * scale + config.latency_per_token * completion_tokens
+
+    def admit(self):
+        """Token bucket of `requests_per_second`, with a one second burst."""
+        rate = self.config.requests_per_second
+        if rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._bucket = min(rate, self._bucket + (now - self._bucket_time) * rate)
+            self._bucket_time = now
+            if self._bucket < 1:
+                raise RateLimitError("simulated rate limit", retry_after=(1 - self._bucket) / rate)
+            self._bucket -= 1
+
+    def send(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        stage: str = "baseline",
+        setting: str = "joint",
+        on_text: Optional[Callable[[str], None]] = None,
+        cached_content: Optional[str] = None,
+        **params
+    ) -> Completion:
+        self.admit()
+        prefix = self.caches.resolve(cached_content) if cached_content else ""
+        with self._lock:
+            self.in_flight += 1
+            load = self.in_flight / self.config.capacity if self.config.capacity else 1.0
+        try:
+            return self._respond(prefix, prompt, max_tokens, stage, setting, on_text, max(1.0, load))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _respond(self, prefix, prompt, max_tokens, stage, setting, on_text, load: float) -> Completion:
+        with self._lock:
+            failed = self._rng.random() < self.config.failure_rate
+            # Drawn only when enabled, so runs without stalls keep their random sequence
+            stalled = self.config.stall_rate > 0 and self._rng.random() < self.config.stall_rate
+        text = simulated_response(stage, setting, prefix + prompt)
+        completion_tokens = min(max_tokens, math.ceil(len(text) / 4))
+        latency = self.latency(completion_tokens) * load + (self.config.stall_seconds if stalled else 0.0)
+        if failed or on_text is None:
+            time.sleep(latency)
+        else:
+            # Lines arrive spread over the latency, in proportion to their length
+            for line in text.splitlines(keepends=True):
+                time.sleep(latency * len(line) / len(text))
+                on_text(line)
+        if failed:
+            raise TransientError("simulated server error")
+        return Completion(
+            text, math.ceil(len(prefix + prompt) / 4), completion_tokens, math.ceil(len(prefix) / 4)
+        )
+
+
+def simulated_response(stage: str, setting: str, prompt: str) -> str:
+    rng = random.Random(zlib.crc32(f"{stage}\0{prompt}".encode()))
+    names = rng.sample(NAMES, rng.randint(3, 8))
+    if stage == "baseline":
+        return "\n".join(f"{i + 1}. {name}" for i, name in enumerate(names))
+    if stage == "plan":
+        return "\n".join(f"{i + 1}. Where was {name} born?" for i, name in enumerate(names))
+    if stage == "execute":
+        if setting == "factored":
+            return rng.choice(PLACES)
+        return "\n".join(f"{i + 1}. {rng.choice(PLACES)}" for i in range(len(names)))
+    if stage == "plan_and_execute":
+        questions = "\n".join(f"{i + 1}. Where was {name} born?" for i, name in enumerate(names))
+        answers = "\n".join(f"{i + 1}. {rng.choice(PLACES)}" for i in range(len(names)))
+        return f"{questions}\n\n{answers}"
+    if stage == "fused":
+        verification = [{"question": f"Where was {name} born?", "answer": rng.choice(PLACES)} for name in names]
+        verified = [name for name, pair in zip(names, verification) if pair["answer"] == PLACES[0]]
+        return json.dumps({"baseline_answer": names, "verification": verification, "verified_answer": verified})
+    kept = names[: rng.randint(1, len(names))]
+    return ", ".join(f"{i + 1}. {name}" for i, name in enumerate(kept))
+
+
+class ChainOfVerificationSimulated(CheckpointMixin, ChainOfVerification):
+    """A chain over `SimulatedBackend` that checkpoints like the Gemini chain.
+
+    Questions run `question_workers` at a time and a checkpoint is written
+    after every completed question (in order), unless `checkpoint` is False.
+    """
+
+    supports_streaming = True
+    supports_context_cache = True
+
+    def __init__(
+        self,
+        model_id,
+        task,
+        setting,
+        questions,
+        config: SimulationConfig,
+        question_workers=1,
+        checkpoint=True,
+        **kwargs,
+    ):
+        super().__init__(model_id, task, setting, questions, **kwargs)
+        self.set_backend(SimulatedBackend(config))
+        self.cache = self.new_context_cache(self.backend.caches) if self.context_cache else None
+        self.question_workers = question_workers
+        self.checkpoint = checkpoint
+        self.init_checkpoint()
+
+    def call_llm(self, prompt: str, max_tokens: int, model_id: Optional[str] = None) -> str:
+        return self.stream_llm(prompt, max_tokens, None, model_id)
+
+    def stream_llm(
+        self, prompt: str, max_tokens: int, on_text: Optional[Callable[[str], None]], model_id: Optional[str] = None
+    ) -> str:
+        model_id = model_id or self.model_id
+        handle, contents = self.split_cached_prompt(self.cache, prompt, model_id) if self.cache else (None, prompt)
+        params = dict(stage=self._call_usage.stage, setting=self.setting, on_text=on_text)
+        try:
+            completion = self.backend.complete(
+                model_id, contents, max_tokens, cached_content=handle.name if handle else None, **params
+            )
+        except CacheNotFoundError:
+            # Expired between the lookup and the request: sent in full, as the Gemini chain does
+            self.cache.invalidate(handle)
+            completion = self.backend.complete(model_id, prompt, max_tokens, **params)
+        self.report_usage(completion.prompt_tokens, completion.completion_tokens, completion.cached_tokens)
+        return completion.text
+
+    def process_prompt(self, prompt, command, model_id: Optional[str] = None) -> str:
+        model_config = MODEL_MAPPING[model_id or self.model_id]
+        return model_config.prompt_format.format(prompt=prompt, command=command)
+
+    def run_chain(self) -> List[Dict[str, str]]:
+        all_results = []
+        with ThreadPoolExecutor(max_workers=self.concurrent_questions()) as executor:
+            results = executor.map(self.run_question, self.question_indices, self.questions)
+            for i, result in enumerate(results):
+                all_results.append(result)
+                if self.checkpoint:
+                    self.save_checkpoint(i, all_results)
+        self.close()
+        self.save_results(all_results)
+        return all_results
@@ -0,0 +1,116 @@
+"""Decode speed of speculative decoding against plain `generate`.
+
+Builds a randomly initialised Llama target (no download needed) and a draft
+made of its embeddings, first `--draft-layers` layers and head. Random
+layers share nothing a draft could predict, so the target's remaining
+layers are scaled down by `--residual-scale` to only refine the draft's
+residual stream, the way a 70B model mostly agrees with a 13B one of the
+same family; the scale sets the acceptance rate. Reports tokens/sec,
+acceptance and tokens per target forward pass for each draft length:
+
+    python3 benchmarks/speculative_decoding.py --draft-tokens 2 4 6
+    python3 benchmarks/speculative_decoding.py --temperature 0  # greedy, checks the outputs are identical
+"""
+import argparse
+import os
+import sys
+import time
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM, set_seed
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from src.prompt_optim.cove.speculative import SpeculativeDecoder
+
+
+def build_models(args):
+    torch.manual_seed(args.seed)
+    config = LlamaConfig(
+        vocab_size=args.vocab_size,
+        hidden_size=args.hidden_size,
+        intermediate_size=args.hidden_size * 4,
+        num_hidden_layers=args.layers,
+        num_attention_heads=8,
+        num_key_value_heads=8,
+    )
+    model = LlamaForCausalLM(config).eval()
+    with torch.no_grad():
+        for layer in model.model.layers[args.draft_layers:]:
+            layer.self_attn.o_proj.weight.mul_(args.residual_scale)
+            layer.mlp.down_proj.weight.mul_(args.residual_scale)
+    draft_config = LlamaConfig(**{**config.to_dict(), "num_hidden_layers": args.draft_layers})
+    draft_model = LlamaForCausalLM(draft_config).eval()
+    draft_model.load_state_dict({
+        name: weight
+        for name, weight in model.state_dict().items()
+        if not name.startswith("model.layers.") or int(name.split(".")[2]) < args.draft_layers
+    })
+    return model, draft_model
+
+
+def run(generate, prompts, max_tokens: int):
+    outputs = []
+    start = time.perf_counter()
+    for prompt_ids in prompts:
+        outputs.append(generate(prompt_ids, max_tokens))
+    seconds = time.perf_counter() - start
+    generated = sum(output.shape[1] - prompt_ids.shape[1] for output, prompt_ids in zip(outputs, prompts))
+    return generated / seconds, outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=4)
+    parser.add_argument("--prompt-tokens", type=int, default=64)
+    parser.add_argument("--max-tokens", type=int, help="Tokens generated per request.", default=128)
+    parser.add_argument("--draft-tokens", type=int, nargs="+", help="Draft lengths k to compare.", default=[2, 4, 6])
+    parser.add_argument("--temperature", type=float, help="0 decodes greedily.", default=0.7)
+    parser.add_argument("--top-p", type=float, default=0.9)
+    parser.add_argument("--vocab-size", type=int, default=8000)
+    parser.add_argument("--hidden-size", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=16)
+    parser.add_argument("--draft-layers", type=int, default=2)
+    parser.add_argument("--residual-scale", type=float, help="Scale of the layers the draft lacks.", default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    model, draft_model = build_models(args)
+    prompts = [torch.randint(3, args.vocab_size, (1, args.prompt_tokens)) for _ in range(args.requests)]
+    greedy = args.temperature <= 0
+
+    def plain(prompt_ids, max_tokens):
+        with torch.inference_mode():
+            return model.generate(
+                input_ids=prompt_ids,
+                max_new_tokens=max_tokens,
+                min_new_tokens=max_tokens,
+                do_sample=not greedy,
+                temperature=args.temperature if not greedy else 1.0,
+                top_p=args.top_p,
+                pad_token_id=0,
+            )
+
+    print(f"{'decoding':<14}{'tok/s':>9}{'speedup':>9}{'accepted':>10}{'tok/pass':>10}")
+    set_seed(args.seed)
+    baseline, reference = run(plain, prompts, args.max_tokens)
+    print(f"{'plain':<14}{baseline:>9.1f}{1.0:>8.2f}x{'':>10}{1.0:>10.2f}")
+    for draft_tokens in args.draft_tokens:
+        decoder = SpeculativeDecoder(
+            model,
+            draft_model,
+            draft_tokens=draft_tokens,
+            temperature=args.temperature,
+            top_p=args.top_p,
+            top_k=model.generation_config.top_k,
+        )
+        set_seed(args.seed)
+        speed, outputs = run(decoder.generate, prompts, args.max_tokens)
+        identical = ""
+        if greedy:
+            identical = "  identical" if all(map(torch.equal, outputs, reference)) else "  DIFFERENT"
+        print(
+            f"{f'k={draft_tokens}':<14}{speed:>9.1f}{speed / baseline:>8.2f}x"
+            f"{decoder.acceptance_rate:>10.1%}{decoder.tokens_per_pass:>10.2f}{identical}"
+        )
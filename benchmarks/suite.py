@@ -0,0 +1,250 @@
+"""End-to-end benchmark of every task x setting against the simulated backend.
+
+Each scenario runs ChainOfVerificationSimulated on the first questions of a
+task's dataset in a fresh process (so peak RSS is per scenario) and reports
+questions/sec, LLM calls and backend requests per question, retries and rate
+limits, duplicate prompts saved and checkpoint I/O. Runs on a plain CPU box
+(no torch, model or network needed):
+
+    python3 benchmarks/suite.py --questions 20 --workers 4 --rps 100 --failure-rate 0.02
+
+As a regression guard, compare against a saved baseline and exit non-zero
+when a scenario gets slower, makes more calls or writes more checkpoint data
+than the tolerance allows:
+
+    python3 benchmarks/suite.py --save-baseline benchmarks/baseline.json   # on main
+    python3 benchmarks/suite.py --baseline benchmarks/baseline.json         # on a branch
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+sys.path.append(REPO_ROOT)
+
+TASK_DATASETS = {
+    "wikidata": "dataset/wikidata_questions.json",
+    "wikidata_category": "dataset/wikidata_category_dataset.json",
+    "multispanqa": "dataset/multispanqa_dataset.json",
+}
+SETTINGS = ["joint", "two_step", "factored"]
+# Benchmarked on request, outside the default scenarios the baseline covers
+OPTIONAL_SETTINGS = ["fused"]
+# Metric -> direction that counts as a regression
+GUARDED_METRICS = {
+    "questions_per_second": "lower",
+    "calls_per_question": "higher",
+    "checkpoint_bytes": "higher",
+    "peak_rss_mb": "higher",
+}
+
+
+def load_questions(task: str, n: int) -> List[str]:
+    from src.data.data_processor import read_json, get_questions_from_dict, get_questions_from_list
+
+    data = read_json(os.path.join(REPO_ROOT, TASK_DATASETS[task]))
+    questions = get_questions_from_dict(data) if task == "wikidata" else get_questions_from_list(data)
+    return questions[:n]
+
+
+def run_scenario(task: str, setting: str, args: Dict, config: Dict) -> Dict:
+    from benchmarks.simulated_backend import ChainOfVerificationSimulated, SimulationConfig
+    from src.utils import STAGES
+
+    questions = load_questions(task, args["questions"])
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            chain = ChainOfVerificationSimulated(
+                args["model"], task, setting, questions,
+                config=SimulationConfig(**config),
+                question_workers=args["workers"],
+                checkpoint=not args["no_checkpoint"],
+                dedupe_prompts=not args["no_dedupe"],
+                stream=args["stream"] and setting == "factored",
+                call_timeouts={stage: args["call_timeout"] for stage in STAGES} if args["call_timeout"] else None,
+                hedge_quantile=args["hedge_quantile"],
+                adaptive_concurrency=args["adaptive_concurrency"],
+                max_in_flight=args["max_in_flight"],
+                context_cache=args["context_cache"],
+                cache_min_tokens=args["cache_min_tokens"],
+            )
+            start = time.perf_counter()
+            chain.run_chain()
+            seconds = time.perf_counter() - start
+
+    n = len(questions)
+    usage_rows = chain.usage.rows()
+    calls = sum(row["calls"] for row in usage_rows)
+    prompt_tokens = sum(row["prompt_tokens"] for row in usage_rows)
+    return {
+        "scenario": f"{task}/{setting}",
+        "questions": n,
+        "seconds": round(seconds, 3),
+        "questions_per_second": round(n / seconds, 3),
+        "calls_per_question": round(calls / n, 3),
+        "requests_per_question": round(chain.backend.requests / n, 3),
+        "retries": chain.backend.retries,
+        "rate_limited": chain.backend.rate_limited,
+        "duplicate_hits": chain.coalescer.duplicate_hits if chain.coalescer else 0,
+        "hedges": chain.hedging.total("hedges") if chain.hedging else 0,
+        "timeouts": chain.hedging.total("timeouts") if chain.hedging else 0,
+        "final_limit": chain.limiter.limit if chain.limiter else args["workers"],
+        "cached_input_share": round(sum(row["cached_tokens"] for row in usage_rows) / max(1, prompt_tokens), 3),
+        "checkpoint_writes": chain.checkpoint_writes,
+        "checkpoint_bytes": chain.checkpoint_bytes,
+        "checkpoint_seconds": round(chain.checkpoint_seconds, 4),
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _scenario_process(task, setting, args, config, queue):
+    try:
+        queue.put(run_scenario(task, setting, args, config))
+    except BaseException as e:
+        queue.put({"scenario": f"{task}/{setting}", "error": f"{type(e).__name__}: {e}"})
+
+
+def run_isolated(task: str, setting: str, args: Dict, config: Dict) -> Dict:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_scenario_process, args=(task, setting, args, config, queue))
+    process.start()
+    row = queue.get()
+    process.join()
+    return row
+
+
+def check_regressions(rows: List[Dict], baseline: Dict, tolerance: float, rss_tolerance: float) -> List[str]:
+    regressions = []
+    for row in rows:
+        reference = baseline.get(row["scenario"])
+        if reference is None or "error" in reference or "error" in row:
+            continue
+        for metric, direction in GUARDED_METRICS.items():
+            allowed = rss_tolerance if metric == "peak_rss_mb" else tolerance
+            old, new = reference[metric], row[metric]
+            if direction == "lower" and new < old * (1 - allowed):
+                regressions.append(f"{row['scenario']}: {metric} dropped from {old} to {new}")
+            if direction == "higher" and new > old * (1 + allowed):
+                regressions.append(f"{row['scenario']}: {metric} rose from {old} to {new}")
+    return regressions
+
+
+def print_table(rows: List[Dict]):
+    print(
+        f"{'scenario':<30}{'q/s':>8}{'calls/q':>9}{'req/q':>8}{'retries':>9}{'429s':>6}"
+        f"{'dupes':>7}{'hedges':>8}{'t/o':>5}{'limit':>7}{'cached':>8}{'ckpt KB':>10}{'ckpt s':>8}{'RSS MB':>8}"
+    )
+    for row in rows:
+        if "error" in row:
+            print(f"{row['scenario']:<30}❌ {row['error']}")
+            continue
+        print(
+            f"{row['scenario']:<30}{row['questions_per_second']:>8.2f}{row['calls_per_question']:>9.2f}"
+            f"{row['requests_per_question']:>8.2f}{row['retries']:>9}{row['rate_limited']:>6}"
+            f"{row['duplicate_hits']:>7}{row['hedges']:>8}{row['timeouts']:>5}{row['final_limit']:>7}"
+            f"{row['cached_input_share']:>8.0%}"
+            f"{row['checkpoint_bytes'] / 1024:>10.1f}"
+            f"{row['checkpoint_seconds']:>8.3f}{row['peak_rss_mb']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=str, nargs="+", default=list(TASK_DATASETS), choices=list(TASK_DATASETS))
+    parser.add_argument("--settings", type=str, nargs="+", default=SETTINGS, choices=SETTINGS + OPTIONAL_SETTINGS)
+    parser.add_argument("--model", type=str, help="Model config whose prompt format is used.", default="gemini2.5_flash_lite")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--workers", type=int, help="Questions run at once.", default=4)
+    parser.add_argument("--latency-distribution", type=str, default="lognormal", choices=["constant", "exponential", "lognormal"])
+    parser.add_argument("--latency-mean", type=float, help="Mean seconds per call.", default=0.02)
+    parser.add_argument("--latency-per-token", type=float, help="Extra seconds per generated token.", default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--rps", type=float, help="Simulated provider rate limit (requests/sec), 0 for none.", default=0.0)
+    parser.add_argument("--failure-rate", type=float, help="Fraction of calls failing transiently.", default=0.02)
+    parser.add_argument("--stall-rate", type=float, help="Fraction of calls that hang for --stall-seconds.", default=0.0)
+    parser.add_argument("--stall-seconds", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-dedupe", action="store_true")
+    parser.add_argument("--no-checkpoint", action="store_true")
+    parser.add_argument("--stream", action="store_true", help="Stream factored plans and execute questions as they arrive.")
+    parser.add_argument("--call-timeout", type=float, help="Deadline in seconds of every call.", default=None)
+    parser.add_argument("--hedge-quantile", type=float, help="Hedge calls slower than this latency quantile.", default=None)
+    parser.add_argument("--adaptive-concurrency", action="store_true", help="Let an AIMD limiter pick the calls in flight.")
+    parser.add_argument("--max-in-flight", type=int, help="Upper bound of the adaptive limit.", default=32)
+    parser.add_argument("--context-cache", action="store_true", help="Send static prompt prefixes as cached contents.")
+    parser.add_argument("--cache-min-tokens", type=int, help="Shortest prefix worth caching.", default=1024)
+    parser.add_argument("--capacity", type=int, help="Simulated requests served at full speed at once, 0 for unlimited.", default=0)
+    parser.add_argument("--json", type=str, help="Write the results to this JSON file.", default=None)
+    parser.add_argument("--save-baseline", type=str, help="Save the results as a regression baseline.", default=None)
+    parser.add_argument("--baseline", type=str, help="Fail if results regress against this baseline.", default=None)
+    parser.add_argument("--tolerance", type=float, help="Allowed relative regression.", default=0.2)
+    parser.add_argument("--rss-tolerance", type=float, help="Allowed relative peak RSS growth.", default=0.5)
+    args = parser.parse_args()
+
+    scenario_args = {
+        "model": args.model,
+        "questions": args.questions,
+        "workers": args.workers,
+        "no_checkpoint": args.no_checkpoint,
+        "no_dedupe": args.no_dedupe,
+        "stream": args.stream,
+        "call_timeout": args.call_timeout,
+        "hedge_quantile": args.hedge_quantile,
+        "adaptive_concurrency": args.adaptive_concurrency,
+        "max_in_flight": args.max_in_flight,
+        "context_cache": args.context_cache,
+        "cache_min_tokens": args.cache_min_tokens,
+    }
+    config = {
+        "latency_distribution": args.latency_distribution,
+        "latency_mean": args.latency_mean,
+        "latency_per_token": args.latency_per_token,
+        "latency_sigma": args.latency_sigma,
+        "requests_per_second": args.rps,
+        "failure_rate": args.failure_rate,
+        "stall_rate": args.stall_rate,
+        "stall_seconds": args.stall_seconds,
+        "capacity": args.capacity,
+        "seed": args.seed,
+    }
+
+    rows = [
+        run_isolated(task, setting, scenario_args, config)
+        for task in args.tasks
+        for setting in args.settings
+    ]
+    print_table(rows)
+
+    report = {"options": {**scenario_args, **config}, "results": rows}
+    for path in [args.json, args.save_baseline]:
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            print(f"📁 Results saved to: {path}")
+
+    failed = any("error" in row for row in rows)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["options"] != report["options"]:
+            print("⚠️ Baseline was recorded with different options; comparison may not be meaningful")
+        regressions = check_regressions(
+            rows, {row["scenario"]: row for row in baseline["results"]}, args.tolerance, args.rss_tolerance
+        )
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if not regressions:
+            print(f"✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
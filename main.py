@@ -3,11 +3,18 @@ import os
 import sys
 from dotenv import dotenv_values
 
-from src.utils import get_absolute_path
+from src.utils import get_absolute_path, DEFAULT_EMBEDDING_MODEL, LOAD_PROFILES, MODEL_MAPPING, SETTINGS, STAGES
 from src.data.data_processor import (
     read_json,
+    read_packed,
     get_questions_from_list,
     get_questions_from_dict,
+    get_questions_from_packed,
+    parse_count,
+    parse_fraction,
+    parse_shard,
+    select_questions,
+    get_selection_tag,
 )
 
 
@@ -15,6 +22,10 @@ CONFIG = dotenv_values(get_absolute_path(".env"))
 hf_access_token = CONFIG.get("HF_API_KEY")
 openai_access_token = CONFIG.get("OPENAI_API_KEY")
 google_access_token = CONFIG.get("GOOGLE_API_KEY")
+# Several project keys, comma-separated, pool their quotas
+google_access_tokens = [
+    key.strip() for key in (CONFIG.get("GOOGLE_API_KEYS") or "").split(",") if key.strip()
+]
 
 file_path_mapping = {
     "wikidata": get_absolute_path("dataset/wikidata_questions.json"),
@@ -22,6 +33,25 @@ file_path_mapping = {
     "wikidata_category": get_absolute_path("dataset/wikidata_category_dataset.json"),
 }
 
+packed_file_path_mapping = {
+    task: os.path.splitext(path)[0] + ".bin" for task, path in file_path_mapping.items()
+}
+
+
+def stage_option(convert=str):
+    """argparse type of a `stage=value` option, e.g. --prompt-budget verify=1500."""
+
+    def parse(option: str):
+        stage, separator, value = option.partition("=")
+        if not separator or not stage or not value:
+            raise argparse.ArgumentTypeError(f"expected the form stage=value, got '{option}'")
+        try:
+            return stage, convert(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid {convert.__name__} value '{value}' for stage {stage}")
+
+    return parse
+
 if __name__ == "__main__":
     argParser = argparse.ArgumentParser()
     argParser.add_argument(
@@ -46,7 +76,7 @@ if __name__ == "__main__":
         type=str,
         help="Setting.",
         default="joint",
-        choices=["joint", "two_step", "factored"],
+        choices=SETTINGS,
     )
     argParser.add_argument(
         "-temp", "--temperature", type=float, help="Temperature.", default=0.07
@@ -57,28 +87,377 @@ if __name__ == "__main__":
         action="store_true",
         help="Force start fresh experiment, ignoring any existing checkpoint.",
     )
+    argParser.add_argument(
+        "--packed",
+        action="store_true",
+        help="Read questions lazily from the packed (.bin) dataset instead of the JSON file.",
+    )
+    argParser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Run only shard i of N (0-based, e.g. 0/4) of the selected questions.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--offset", type=parse_count, help="Skip the first OFFSET questions.", default=0
+    )
+    argParser.add_argument(
+        "--limit", type=parse_count, help="Run at most LIMIT questions.", default=None
+    )
+    argParser.add_argument(
+        "--sample-seed",
+        type=int,
+        help="Run a deterministic random sample of the questions with this seed.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--sample-fraction",
+        type=parse_fraction,
+        help="Fraction of questions kept by --sample-seed.",
+        default=0.05,
+    )
+    argParser.add_argument(
+        "--no-dedupe",
+        action="store_true",
+        help="Issue one LLM call per prompt even when an identical prompt was already sent.",
+    )
+    argParser.add_argument(
+        "--confidence-method",
+        type=str,
+        help="Score each baseline answer and record its confidence in the results.",
+        default=None,
+        choices=["logprob", "self_consistency"],
+    )
+    argParser.add_argument(
+        "--confidence-threshold",
+        type=float,
+        help="Adaptive mode: skip verification for baselines scored at or above this confidence.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--consistency-samples",
+        type=int,
+        help="Extra baseline samples drawn by the self_consistency confidence method.",
+        default=2,
+    )
+    argParser.add_argument(
+        "--stage-model",
+        type=stage_option(),
+        action="append",
+        help="Route a stage to another model of the same backend, e.g. --stage-model verify=llama2_70b. "
+        f"Stages: {', '.join(STAGES)}. Can be repeated.",
+        default=[],
+    )
+    argParser.add_argument(
+        "--adaptive-concurrency",
+        action="store_true",
+        help="Run questions concurrently and let an AIMD controller set the LLM calls in flight from latency and rate limits.",
+    )
+    argParser.add_argument(
+        "--max-in-flight",
+        type=int,
+        help="Upper bound of the --adaptive-concurrency limit.",
+        default=32,
+    )
+    argParser.add_argument(
+        "--context-cache",
+        action="store_true",
+        help="Gemini: cache each stage's static prompt prefix provider-side and send only the rest of the prompt.",
+    )
+    argParser.add_argument(
+        "--cache-ttl",
+        type=float,
+        help="Lifetime in seconds of a --context-cache cached content, refreshed while the run uses it.",
+        default=3600.0,
+    )
+    argParser.add_argument(
+        "--cache-min-tokens",
+        type=int,
+        help="Shortest prefix --context-cache caches; the provider rejects shorter ones.",
+        default=1024,
+    )
+    argParser.add_argument(
+        "--constrained-lists",
+        action="store_true",
+        help="Constrain list stages (baseline, plan, verify) to numbered lists of at most TaskConfig.max_list_items "
+        "items: a logits processor for HuggingFace models, a JSON response schema for Gemini and OpenAI.",
+    )
+    argParser.add_argument(
+        "--fact-store",
+        type=str,
+        help="Factored setting: answer templated verification questions from this SQLite fact store, "
+        "falling back to the LLM on a miss.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--semantic-cache",
+        action="store_true",
+        help="Factored setting: answer a verification question from the stored answer of a similar one.",
+    )
+    argParser.add_argument(
+        "--semantic-cache-path",
+        type=str,
+        help="File the semantic cache persists to across runs, .semantic_cache/<model>_<task>.npz by default.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--semantic-threshold",
+        type=float,
+        help="Cosine similarity at or above which a stored answer is reused.",
+        default=0.9,
+    )
+    argParser.add_argument(
+        "--semantic-cache-size",
+        type=int,
+        help="Verification questions kept in the semantic cache; the least recently used are evicted.",
+        default=10000,
+    )
+    argParser.add_argument(
+        "--embedding-model",
+        type=str,
+        help="Sentence embedding model of the semantic cache, run on the CPU.",
+        default=DEFAULT_EMBEDDING_MODEL,
+    )
+    argParser.add_argument(
+        "--call-timeout",
+        type=float,
+        help="Deadline in seconds of every LLM call; a call that misses it is abandoned and retried once.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--stage-timeout",
+        type=stage_option(float),
+        action="append",
+        help="Deadline of one stage's calls, e.g. --stage-timeout plan=30. Overrides --call-timeout. Can be repeated.",
+        default=[],
+    )
+    argParser.add_argument(
+        "--hedge-quantile",
+        type=float,
+        help="Send a duplicate of a call still running after this quantile of its stage's recent latencies "
+        "(e.g. 0.95) and keep whichever returns first.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--prompt-budget",
+        type=stage_option(int),
+        action="append",
+        help="Cap the prompt tokens of a stage, e.g. --prompt-budget verify=1500. Intermediate CoVe "
+        "outputs are trimmed to fit. Defaults to the context window minus the stage's max tokens. Can be repeated.",
+        default=[],
+    )
+    argParser.add_argument(
+        "--base-url",
+        type=str,
+        help="OpenAI-compatible endpoint for gpt3, e.g. http://localhost:8000/v1 for a vLLM or llama.cpp server. "
+        "Defaults to the OpenAI API.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--served-model",
+        type=str,
+        help="Model name to request from --base-url, when it differs from the configured model id.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--max-concurrency",
+        type=int,
+        help="Questions and HTTP requests in flight at once on the OpenAI-compatible backend.",
+        default=8,
+    )
+    argParser.add_argument(
+        "--request-timeout",
+        type=float,
+        help="Seconds before an HTTP request to the OpenAI-compatible backend times out.",
+        default=60.0,
+    )
+    argParser.add_argument(
+        "--max-retries",
+        type=int,
+        help="Retries of a timed out, rate limited or failed HTTP request.",
+        default=3,
+    )
+    argParser.add_argument(
+        "--continuous-batching",
+        action="store_true",
+        help="HuggingFace models: run questions concurrently and batch their generations per decode step.",
+    )
+    argParser.add_argument(
+        "--max-batch-size",
+        type=int,
+        help="Sequences decoded together with --continuous-batching.",
+        default=8,
+    )
+    argParser.add_argument(
+        "--speculative",
+        action="store_true",
+        help="HuggingFace models: speculative decoding, with the draft model of the model config proposing tokens.",
+    )
+    argParser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Factored setting: stream the plan and execute each verification question as soon as its line is generated.",
+    )
+    argParser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed the sampling of HuggingFace models (and of OpenAI-compatible servers that support it).",
+        default=None,
+    )
+    argParser.add_argument(
+        "--record",
+        type=str,
+        help="Record every LLM call (stage, prompt, parameters, response, timing) to this JSONL file.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--replay",
+        type=str,
+        help="Replay a file written by --record instead of calling the model. Use the same options as the recorded run.",
+        default=None,
+    )
+    argParser.add_argument(
+        "--replay-latency",
+        type=str,
+        help="Wait the recorded latency of each call, or answer immediately.",
+        default="recorded",
+        choices=["recorded", "zero"],
+    )
+    argParser.add_argument(
+        "--replay-workers",
+        type=int,
+        help="Questions replayed at once.",
+        default=1,
+    )
+    argParser.add_argument(
+        "--load-profile",
+        type=str,
+        help="How HuggingFace models are loaded (quantization, dtype, attention, device). "
+        "Defaults to the model's ModelConfig.load_profile; falls back to cpu without a GPU.",
+        default=None,
+        choices=list(LOAD_PROFILES),
+    )
     args = argParser.parse_args()
 
-    data = read_json(file_path_mapping[args.task])
-    if args.task == "wikidata":
-        questions = get_questions_from_dict(data)
+    # Pre-quantized profiles need a checkpoint of every HuggingFace model the run loads
+    loaded_models = {args.model, *dict(args.stage_model).values()}
+    if args.speculative:
+        loaded_models |= {MODEL_MAPPING[name].draft_model for name in loaded_models if name in MODEL_MAPPING}
+    for model_name in loaded_models:
+        model_config = MODEL_MAPPING.get(model_name)
+        if model_config is None or model_config.backend != "hf":
+            continue
+        quantization = LOAD_PROFILES[args.load_profile or model_config.load_profile].quantization
+        if quantization in ["gptq", "awq"] and quantization not in model_config.quantized_ids:
+            print(f"❌ {model_name} has no pre-quantized {quantization} checkpoint (ModelConfig.quantized_ids)")
+            sys.exit(1)
+
+    if args.packed:
+        packed_path = packed_file_path_mapping[args.task]
+        if not os.path.exists(packed_path):
+            print(f"❌ Packed dataset not found: {packed_path}")
+            print(
+                f"   Create it with: python3 src/data/packed_dataset.py -i {file_path_mapping[args.task]}"
+            )
+            sys.exit(1)
+        questions = get_questions_from_packed(read_packed(packed_path))
     else:
-        questions = get_questions_from_list(data)
+        data = read_json(file_path_mapping[args.task])
+        if args.task == "wikidata":
+            questions = get_questions_from_dict(data)
+        else:
+            questions = get_questions_from_list(data)
+
+    selection = dict(
+        offset=args.offset,
+        limit=args.limit,
+        sample_seed=args.sample_seed,
+        sample_fraction=args.sample_fraction,
+        shard=args.shard,
+    )
+    question_indices, questions = select_questions(questions, **selection)
+    run_tag = get_selection_tag(**selection)
+
+    # Options shared by every ChainOfVerification backend
+    chain_kwargs = dict(
+        question_indices=question_indices,
+        run_tag=run_tag,
+        dedupe_prompts=not args.no_dedupe,
+        confidence_method=args.confidence_method,
+        confidence_threshold=args.confidence_threshold,
+        consistency_samples=args.consistency_samples,
+        stage_models=dict(args.stage_model),
+        prompt_budgets=dict(args.prompt_budget),
+        seed=args.seed,
+    )
 
     # Handle fresh start flag for Google models
     if args.model == "gemini2.5_flash_lite" and args.fresh_start:
         # Remove existing checkpoint for fresh start - use current working directory
         checkpoint_dir = os.path.join(os.getcwd(), "checkpoints")
         checkpoint_file = os.path.join(
-            checkpoint_dir, f"{args.model}_{args.task}_{args.setting}_checkpoint.json"
+            checkpoint_dir,
+            f"{args.model}_{args.task}_{args.setting}{run_tag}_checkpoint.json",
         )
         if os.path.exists(checkpoint_file):
             os.remove(checkpoint_file)
             print(f"🗑️ Removed existing checkpoint for fresh start")
 
+    if args.replay:
+        # Replays answer each recorded call once, so they are never hedged
+        from src.prompt_optim.cove.cove_chains_replay import ChainOfVerificationReplay
+        chain_replay = ChainOfVerificationReplay(
+            model_id=args.model,
+            task=args.task,
+            setting=args.setting,
+            questions=questions,
+            replay_path=args.replay,
+            latency=args.replay_latency,
+            question_workers=args.replay_workers,
+            **chain_kwargs,
+        )
+        chain_replay.run_chain()
+        sys.exit(0)
+    chain_kwargs["record_path"] = args.record
+    chain_kwargs["stream"] = args.stream
+    chain_kwargs["call_timeouts"] = {
+        **({stage: args.call_timeout for stage in STAGES} if args.call_timeout else {}),
+        **dict(args.stage_timeout),
+    }
+    chain_kwargs["hedge_quantile"] = args.hedge_quantile
+    chain_kwargs["adaptive_concurrency"] = args.adaptive_concurrency
+    chain_kwargs["max_in_flight"] = args.max_in_flight
+    chain_kwargs["context_cache"] = args.context_cache
+    chain_kwargs["cache_ttl"] = args.cache_ttl
+    chain_kwargs["cache_min_tokens"] = args.cache_min_tokens
+    chain_kwargs["semantic_cache"] = args.semantic_cache
+    chain_kwargs["semantic_cache_path"] = args.semantic_cache_path or os.path.join(
+        ".semantic_cache", f"{args.model}_{args.task}.npz"
+    )
+    chain_kwargs["semantic_threshold"] = args.semantic_threshold
+    chain_kwargs["semantic_cache_size"] = args.semantic_cache_size
+    chain_kwargs["embedding_model"] = args.embedding_model
+    chain_kwargs["fact_store"] = args.fact_store
+    chain_kwargs["constrained_lists"] = args.constrained_lists
+
     if args.model == "gpt3":
-        print("❌ OpenAI implementation not available")
-        sys.exit(1)
+        from src.prompt_optim.cove.cove_chains_openai import ChainOfVerificationOpenAI
+        chain_openai = ChainOfVerificationOpenAI(
+            model_id=args.model,
+            temperature=args.temperature,
+            top_p=args.top_p,
+            task=args.task,
+            setting=args.setting,
+            questions=questions,
+            openai_access_token=openai_access_token,
+            base_url=args.base_url,
+            served_model=args.served_model,
+            max_concurrency=args.max_concurrency,
+            timeout=args.request_timeout,
+            max_retries=args.max_retries,
+            **chain_kwargs,
+        )
+        chain_openai.run_chain()
     elif args.model == "gemini2.5_flash_lite":
         from src.prompt_optim.cove.cove_chains_google import ChainOfVerificationGoogle
         chain_google = ChainOfVerificationGoogle(
@@ -88,6 +467,8 @@ if __name__ == "__main__":
             setting=args.setting,
             questions=questions,
             google_access_token=google_access_token,
+            google_access_tokens=google_access_tokens,
+            **chain_kwargs,
         )
         chain_google.run_chain()
     else:
@@ -100,5 +481,10 @@ if __name__ == "__main__":
             setting=args.setting,
             questions=questions,
             hf_access_token=hf_access_token,
+            continuous_batching=args.continuous_batching,
+            max_batch_size=args.max_batch_size,
+            load_profile=args.load_profile,
+            speculative=args.speculative,
+            **chain_kwargs,
         )
         chain_hf.run_chain()
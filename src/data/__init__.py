@@ -1 +1 @@
-from .data_processor import read_json, read_jsonlines, get_questions_from_dict, get_questions_from_list, get_cleaned_final_answer, get_answers_from_dict, get_answers_from_list
+from .data_processor import read_json, read_jsonlines, read_packed, get_questions_from_dict, get_questions_from_list, get_questions_from_packed, get_cleaned_final_answer, get_answers_from_dict, get_answers_from_list, get_answers_from_packed
\ No newline at end of file
@@ -1,6 +1,8 @@
 import json
-from typing import Dict, List
+import random
+from typing import Dict, List, Optional, Sequence, Tuple
 import re
+from .packed_dataset import PackedDataset, PackedColumn
 
 def read_jsonlines(path: str) -> Dict[str, str]:
     records = []
@@ -15,6 +17,9 @@ def read_json(path: str) -> Dict[str, str]:
         data = json.load(file)
     return data
 
+def read_packed(path: str) -> PackedDataset:
+    return PackedDataset(path)
+
 def get_questions_from_dict(data: Dict[str, str]) -> List[str]:
     return list(data.keys())
 
@@ -22,17 +27,232 @@ def get_questions_from_list(data: List[Dict[str, str]]) -> List[str]:
     questions = [entry['question'] for entry in data]
     return questions
 
+def get_questions_from_packed(data: PackedDataset) -> PackedColumn:
+    return data.questions()
+
 def get_answers_from_dict(data: Dict[str, str]) -> List[str]:
-    return list(data.items())
+    return list(data.values())
 
 def get_answers_from_list(data: List[Dict[str, str]]) -> List[str]:
     answers = [entry['answer'] for entry in data]
     return answers
 
+def get_answers_from_packed(data: PackedDataset) -> PackedColumn:
+    return data.answers()
+
+def get_item_from_line(line: str) -> str:
+    return re.sub("([\d.]*\d+)\.\ ", "", line)
+
 def get_items_from_answer(result: str) -> List[str]:
     answers = result.split("\n")
-    answers = [re.sub("([\d.]*\d+)\.\ ", "", answer) for answer in answers]
+    answers = [get_item_from_line(answer) for answer in answers]
     return answers
 
+class IncrementalListParser:
+    """Items of a numbered list response as it streams in.
+
+    `feed` returns the items whose lines are complete; `finish` returns the
+    rest. Together they equal `get_items_from_answer` of the stripped
+    response, so a line is only released once non-blank text follows it
+    (until then it could be the trailing whitespace `strip` removes).
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self.buffer = (self.buffer + text) if self.buffer else text.lstrip()
+        last_newline = self.buffer.rstrip().rfind("\n")
+        if last_newline == -1:
+            return []
+        complete, self.buffer = self.buffer[:last_newline], self.buffer[last_newline + 1:]
+        return get_items_from_answer(complete)
+
+    def finish(self) -> List[str]:
+        rest, self.buffer = self.buffer.rstrip(), ""
+        return get_items_from_answer(rest) if rest else []
+
+def _close_json(text: str) -> str:
+    """Close the arrays and objects a truncated JSON document left open.
+
+    An unterminated string is left open, so the document does not parse: a
+    value cut off mid-string (e.g. half a name) is dropped, never kept.
+    """
+    closers = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "[{":
+            closers.append("]" if char == "[" else "}")
+        elif char in "]}" and closers:
+            closers.pop()
+    return text + "".join(reversed(closers))
+
+def _load_json_object(text: str) -> Tuple[Optional[dict], str]:
+    start = text.find("{")
+    if start == -1:
+        return None, "failed"
+    end = text.rfind("}")
+    try:
+        data = json.loads(text[start:end + 1])
+        if isinstance(data, dict):
+            return data, "json"
+    except ValueError:
+        pass
+    # Truncated (e.g. at max_tokens): close what is open, dropping trailing elements until it parses
+    candidate = text[start:]
+    while candidate:
+        try:
+            data = json.loads(_close_json(candidate))
+            if isinstance(data, dict):
+                return data, "repaired"
+        except ValueError:
+            pass
+        candidate = candidate[:candidate.rfind(",")] if "," in candidate else ""
+    return None, "failed"
+
+def _complete_value(text: str, key: str) -> bool:
+    """Whether the value of `key` in the JSON `text` is there in full, not cut off."""
+    match = re.search(rf'"{re.escape(key)}"\s*:\s*', text)
+    if match is None:
+        return False
+    try:
+        json.JSONDecoder().raw_decode(text, match.end())
+        return True
+    except ValueError:
+        return False
+
+def _strings(value) -> List[str]:
+    if isinstance(value, str):
+        value = get_items_from_answer(value)
+    if not isinstance(value, list):
+        return []
+    return [str(item).strip() for item in value if isinstance(item, (str, int, float)) and str(item).strip()]
+
+def parse_fused_response(response: str) -> Tuple[List[str], List[Tuple[str, str]], List[str], str]:
+    """Baseline items, verification (question, answer) pairs and verified items of a fused response.
+
+    The response is one JSON object (see FUSED_RESPONSE_SCHEMA), possibly
+    wrapped in a code fence or cut off at the token limit; a truncated
+    object is closed and its incomplete tail dropped. Without a complete,
+    non-null verified answer the baseline stands. The status is "json", "repaired" or "failed"; a
+    response without any JSON is read as a numbered list answering the question.
+    """
+    data, status = _load_json_object(response)
+    if data is None:
+        # JSON cut off before its first complete item has no answer to keep
+        items = [] if "{" in response else [item for item in get_items_from_answer(response.strip()) if item.strip()]
+        return items, [], items, status
+
+    baseline = _strings(data.get("baseline_answer"))
+    verification = []
+    for pair in data.get("verification") or []:
+        if isinstance(pair, dict) and pair.get("question"):
+            verification.append((str(pair["question"]).strip(), str(pair.get("answer") or "").strip()))
+    # A verified answer the repair shortened would be scored as if the model meant it
+    if data.get("verified_answer") is not None and (status == "json" or _complete_value(response, "verified_answer")):
+        verified = _strings(data["verified_answer"])
+    else:
+        verified = baseline
+        status = "repaired"
+    return baseline, verification, verified, status
+
+def parse_list_response(response: str) -> Tuple[List[str], str]:
+    """Items of a list stage's JSON response (see LIST_RESPONSE_SCHEMA) and its parse status.
+
+    Parsed like `parse_fused_response`; a response without any JSON is read
+    as a numbered list.
+    """
+    data, status = _load_json_object(response)
+    if data is None:
+        items = [] if "{" in response else [item for item in get_items_from_answer(response.strip()) if item.strip()]
+        return items, status
+    return _strings(data.get("items")), status
+
 def get_cleaned_final_answer(results: List[str], answer_slice: str) -> List[List[str]]:
     return [get_items_from_answer(result[answer_slice]) for result in results]
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """Parse a `i/N` shard spec (0-based shard index i out of N shards)."""
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}', expected the form i/N (e.g. 0/4).")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{shard}', need 0 <= i < N.")
+    return index, count
+
+def parse_count(value: str) -> int:
+    """Parse an --offset or --limit, a number of questions."""
+    count = int(value)
+    if count < 0:
+        raise ValueError(f"Invalid count {count}, it must be >= 0.")
+    return count
+
+def parse_fraction(value: str) -> float:
+    """Parse a --sample-fraction, the share of questions a sample keeps."""
+    fraction = float(value)
+    if not 0 < fraction <= 1:
+        raise ValueError(f"Invalid fraction {fraction}, it must be in (0, 1].")
+    return fraction
+
+def select_questions(
+    questions: Sequence[str],
+    offset: int = 0,
+    limit: Optional[int] = None,
+    sample_seed: Optional[int] = None,
+    sample_fraction: float = 0.05,
+    shard: Optional[Tuple[int, int]] = None,
+) -> Tuple[List[int], List[str]]:
+    """Select a subset of questions, returning their dataset indices and texts.
+
+    The window [offset, offset + limit) is applied first, then an optional
+    deterministic sample of `sample_fraction` of it, then a contiguous shard.
+    Only the selected questions are read, so packed datasets stay lazy.
+    """
+    # A negative offset or limit would silently count from the end
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError(f"Invalid selection offset={offset}, limit={limit}, both must be >= 0.")
+    if not 0 < sample_fraction <= 1:
+        raise ValueError(f"Invalid sample fraction {sample_fraction}, it must be in (0, 1].")
+    indices = range(len(questions))[offset:]
+    if limit is not None:
+        indices = indices[:limit]
+    if sample_seed is not None:
+        sample_size = max(1, round(len(indices) * sample_fraction)) if len(indices) else 0
+        indices = sorted(random.Random(sample_seed).sample(indices, sample_size))
+    if shard is not None:
+        shard_index, shard_count = shard
+        start = len(indices) * shard_index // shard_count
+        stop = len(indices) * (shard_index + 1) // shard_count
+        indices = indices[start:stop]
+
+    indices = list(indices)
+    return indices, [questions[i] for i in indices]
+
+def get_selection_tag(
+    offset: int = 0,
+    limit: Optional[int] = None,
+    sample_seed: Optional[int] = None,
+    sample_fraction: float = 0.05,
+    shard: Optional[Tuple[int, int]] = None,
+) -> str:
+    """File name suffix describing a selection, e.g. `_sample5pct_seed0_shard1of4`."""
+    tag = ""
+    if offset:
+        tag += f"_offset{offset}"
+    if limit is not None:
+        tag += f"_limit{limit}"
+    if sample_seed is not None:
+        tag += f"_sample{sample_fraction * 100:g}pct_seed{sample_seed}"
+    if shard is not None:
+        tag += f"_shard{shard[0]}of{shard[1]}"
+    return tag
@@ -0,0 +1,100 @@
+"""SQLite store of (subject, relation, value) facts, for answering verification questions locally.
+
+Facts are indexed by a normalised subject key (case, accents and punctuation
+removed), so a lookup is one primary-key probe. `generate_wikidata.py` writes
+the facts its SPARQL queries return (`--facts-path`); for an existing
+dataset, the facts its questions imply (every listed person was born in the
+question's city and has its profession) can be derived offline:
+
+    python3 src/data/fact_store.py -i ./dataset/wikidata_questions.json -o ./dataset/wikidata_facts.db
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# The queried city (a birthplace lies within it), the birthplace itself, the
+# birth date (YYYY-MM-DD) and the queried profession (plural, e.g. "actors")
+RELATIONS = ["born_in", "birthplace", "birthdate", "occupation"]
+
+WIKIDATA_QUESTION = re.compile(r"Who are some (?P<profession>.+) who were born in (?P<city>.+)\?")
+
+
+def entity_key(name: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w\s]", " ", stripped.casefold()).split())
+
+
+class FactStore:
+    def __init__(self, path: str):
+        self.path = path
+        # Shared by the chain's worker threads, which take turns through the lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS facts ("
+            "subject_key TEXT NOT NULL, relation TEXT NOT NULL, value TEXT NOT NULL, subject TEXT NOT NULL, "
+            "PRIMARY KEY (subject_key, relation, value)) WITHOUT ROWID"
+        )
+
+    def add_facts(self, facts: Iterable[Tuple[str, str, str]]) -> int:
+        rows = [(entity_key(subject), relation, value, subject) for subject, relation, value in facts]
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO facts VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def lookup(self, subject: str, relation: str) -> List[str]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT value FROM facts WHERE subject_key = ? AND relation = ?", (entity_key(subject), relation)
+            ).fetchall()
+        return [value for value, in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+
+def facts_from_wikidata_dataset(data: Dict[str, List[str]]) -> Iterator[Tuple[str, str, str]]:
+    for question, persons in data.items():
+        match = WIKIDATA_QUESTION.fullmatch(question)
+        if match is None:
+            continue
+        for person in persons:
+            yield person, "born_in", match["city"]
+            yield person, "occupation", match["profession"]
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "-i",
+        "--data-path",
+        type=str,
+        help="Path to a wikidata JSON dataset.",
+        default="./dataset/wikidata_questions.json",
+    )
+    argParser.add_argument(
+        "-o",
+        "--output-path",
+        type=str,
+        help="Path to the fact store, created or extended.",
+        default="./dataset/wikidata_facts.db",
+    )
+    args = argParser.parse_args()
+
+    with open(args.data_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    store = FactStore(args.output_path)
+    count = store.add_facts(facts_from_wikidata_dataset(data))
+    print(f"Stored {count} facts in {args.output_path} ({len(store)} in total, {os.path.getsize(args.output_path)} bytes)")
+    store.close()
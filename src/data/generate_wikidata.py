@@ -1,9 +1,14 @@
 import argparse
 import json
+import os
 import sys
 import pandas as pd
 from SPARQLWrapper import SPARQLWrapper, JSON
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.data.fact_store import FactStore
+
 class WikidataQuery:
     def __init__(self, csv_path, sparql_endpoint):
         self.df = pd.read_csv(csv_path, sep=';')
@@ -38,17 +43,37 @@ class WikidataQuery:
         sparql.setReturnFormat(JSON)
         return sparql.query().convert()
 
-    def create_answer_questions(self, output_path: str):
+    @staticmethod
+    def get_facts(profession, city, bindings):
+        """(person, relation, value) facts of a query's results, see src/data/fact_store.py."""
+        for result in bindings:
+            person = result['personLabel']['value']
+            yield person, "born_in", city
+            yield person, "occupation", profession
+            if 'birthplaceLabel' in result:
+                yield person, "birthplace", result['birthplaceLabel']['value']
+            if 'birthdate' in result:
+                yield person, "birthdate", result['birthdate']['value'][:10]
+
+    def create_answer_questions(self, output_path: str, facts_path: str = None):
         question_answerings = {}
+        facts = []
         for q, v in self.queries.items():
             results = self.get_results(v)
             answers = [result['personLabel']['value'] for result in results["results"]["bindings"]]
             unique_answers = list(set(answers))  # Remove duplicates
             question_answerings[f"Who are some {q[0]} who were born in {q[1]}?"] = unique_answers
+            facts.extend(self.get_facts(q[0], q[1], results["results"]["bindings"]))
 
         with open(output_path, 'w') as fp:
             json.dump(question_answerings, fp, ensure_ascii=False)
 
+        if facts_path:
+            # Kept for the fact verifier (--fact-store), which answers verification questions from them
+            store = FactStore(facts_path)
+            store.add_facts(facts)
+            store.close()
+
 if __name__ == "__main__":
     argParser = argparse.ArgumentParser()
     argParser.add_argument(
@@ -65,10 +90,16 @@ if __name__ == "__main__":
         help="Path to the output dataset.",
         default="./dataset/wikidata_dataset.json",
     )
+    argParser.add_argument(
+        "--facts-path",
+        type=str,
+        help="SQLite fact store the queried birthplaces, birth dates and professions are saved to.",
+        default="./dataset/wikidata_facts.db",
+    )
     args = argParser.parse_args()
     
     sparql_endpoint = "https://query.wikidata.org/sparql"
 
     wikidata_query = WikidataQuery(args.csv_path, sparql_endpoint)
     wikidata_query.generate_queries()
-    wikidata_query.create_answer_questions(args.output_path)
+    wikidata_query.create_answer_questions(args.output_path, args.facts_path)
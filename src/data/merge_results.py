@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Optional, Sequence
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.data.data_processor import parse_count, parse_fraction, select_questions
+
+
+def merge_results(result_paths: List[str], expected_indices: Optional[Sequence[int]] = None) -> List[Dict[str, str]]:
+    """Merge shard result files back into one list ordered by dataset index."""
+    merged = {}
+    for path in result_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            results = json.load(f)
+        for result in results:
+            if "Index" not in result:
+                raise ValueError(f"{path} has results without an 'Index' field, cannot merge.")
+            index = result["Index"]
+            if index in merged:
+                raise ValueError(f"Question index {index} appears in more than one shard ({path}).")
+            merged[index] = result
+
+    if expected_indices is not None:
+        missing = sorted(set(expected_indices) - set(merged))
+        if missing:
+            raise ValueError(f"{len(missing)} questions are missing from the shards, e.g. {missing[:10]}.")
+        unexpected = sorted(set(merged) - set(expected_indices))
+        if unexpected:
+            raise ValueError(f"{len(unexpected)} questions are outside the selection, e.g. {unexpected[:10]}.")
+
+    return [merged[index] for index in sorted(merged)]
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "-i",
+        "--result-paths",
+        type=str,
+        nargs="+",
+        help="Shard result files produced by main.py --shard.",
+        required=True,
+    )
+    argParser.add_argument(
+        "-o",
+        "--output-path",
+        type=str,
+        help="Path to the merged result file.",
+        required=True,
+    )
+    argParser.add_argument(
+        "-n",
+        "--expected-count",
+        type=int,
+        help="Number of questions in the dataset; fails if any selected index is missing.",
+        default=None,
+    )
+    # The selection the shards were run with, as passed to main.py
+    argParser.add_argument("--offset", type=parse_count, default=0)
+    argParser.add_argument("--limit", type=parse_count, default=None)
+    argParser.add_argument("--sample-seed", type=int, default=None)
+    argParser.add_argument("--sample-fraction", type=parse_fraction, default=0.05)
+    args = argParser.parse_args()
+
+    expected_indices = None
+    if args.expected_count is not None:
+        expected_indices, _ = select_questions(
+            range(args.expected_count),
+            offset=args.offset,
+            limit=args.limit,
+            sample_seed=args.sample_seed,
+            sample_fraction=args.sample_fraction,
+        )
+    merged = merge_results(args.result_paths, expected_indices)
+    with open(args.output_path, "w", encoding="utf-8") as json_file:
+        json.dump(merged, json_file, indent=2, ensure_ascii=False)
+    print(f"Merged {len(merged)} results from {len(args.result_paths)} files into {args.output_path}")
@@ -0,0 +1,178 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+# File layout (all integers little-endian):
+#   header:  magic (8 bytes) | flags (uint32) | count (uint64)
+#   index:   count + 1 uint64 offsets into the record section
+#   records: uint32 question length | question (utf-8) | answer (utf-8 JSON)
+# The index lets a reader jump straight to record i, so questions and answers
+# are decoded lazily and only when they are accessed.
+MAGIC = b"MPOPACK\x01"
+HEADER = struct.Struct("<8sIQ")
+OFFSET = struct.Struct("<Q")
+QUESTION_LENGTH = struct.Struct("<I")
+
+FLAG_LIST_ANSWERS = 1
+
+
+def _iter_records(data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> Iterable[Tuple[str, Any]]:
+    if isinstance(data, dict):
+        return data.items()
+    return ((entry["question"], entry["answer"]) for entry in data)
+
+
+def _encode_record(question: str, answer: Any) -> bytes:
+    question_bytes = question.encode("utf-8")
+    answer_bytes = json.dumps(answer, ensure_ascii=False).encode("utf-8")
+    return QUESTION_LENGTH.pack(len(question_bytes)) + question_bytes + answer_bytes
+
+
+def _write_packed(path: str, flags: int, records: List[bytes]):
+    offsets = [0]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, flags, len(records)))
+        f.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+        for record in records:
+            f.write(record)
+
+
+def pack_dataset(data: Union[Dict[str, Any], List[Dict[str, Any]]], output_path: str) -> int:
+    """Write a question -> answer dataset (dict or list of records) to the packed format."""
+    records = []
+    flags = 0
+    for question, answer in _iter_records(data):
+        if isinstance(answer, list):
+            flags |= FLAG_LIST_ANSWERS
+        records.append(_encode_record(question, answer))
+
+    _write_packed(output_path, flags, records)
+    return len(records)
+
+
+class PackedDataset:
+    """Memory-mapped, read-only view of a packed dataset file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.flags, self._count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a packed dataset file.")
+        self._index_start = HEADER.size
+        self._records_start = self._index_start + (self._count + 1) * OFFSET.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def _bounds(self, index: int) -> Tuple[int, int]:
+        if not 0 <= index < self._count:
+            raise IndexError(f"Record {index} out of range for {self._count} records.")
+        position = self._index_start + index * OFFSET.size
+        start = OFFSET.unpack_from(self._mmap, position)[0]
+        end = OFFSET.unpack_from(self._mmap, position + OFFSET.size)[0]
+        return self._records_start + start, self._records_start + end
+
+    def question(self, index: int) -> str:
+        start, _ = self._bounds(index)
+        length = QUESTION_LENGTH.unpack_from(self._mmap, start)[0]
+        start += QUESTION_LENGTH.size
+        return self._mmap[start:start + length].decode("utf-8")
+
+    def answer(self, index: int) -> Any:
+        start, end = self._bounds(index)
+        length = QUESTION_LENGTH.unpack_from(self._mmap, start)[0]
+        start += QUESTION_LENGTH.size + length
+        return json.loads(self._mmap[start:end].decode("utf-8"))
+
+    def questions(self) -> "PackedColumn":
+        return PackedColumn(self, self.question, range(self._count))
+
+    def answers(self) -> "PackedColumn":
+        return PackedColumn(self, self.answer, range(self._count))
+
+    def export_slice(self, start: int, stop: int, output_path: str) -> int:
+        """Copy records [start, stop) to a new packed file without decoding them."""
+        indices = range(self._count)[start:stop]
+        if len(indices) == 0:
+            _write_packed(output_path, self.flags, [])
+            return 0
+
+        first, _ = self._bounds(indices[0])
+        _, last = self._bounds(indices[-1])
+        base = first - self._records_start
+        offsets = [
+            OFFSET.unpack_from(self._mmap, self._index_start + i * OFFSET.size)[0] - base
+            for i in range(indices[0], indices[-1] + 2)
+        ]
+
+        with open(output_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.flags, len(indices)))
+            f.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+            f.write(self._mmap[first:last])
+        return len(indices)
+
+
+class PackedColumn(Sequence):
+    """Lazy sequence over one field of a PackedDataset; slicing returns another view."""
+
+    def __init__(self, dataset: PackedDataset, getter, indices: range):
+        self.dataset = dataset
+        self._getter = getter
+        self._indices = indices
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PackedColumn(self.dataset, self._getter, self._indices[index])
+        return self._getter(self._indices[index])
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser()
+    argParser.add_argument(
+        "-i",
+        "--data-path",
+        type=str,
+        help="Path to the input JSON dataset.",
+        default="./dataset/wikidata_questions.json",
+    )
+    argParser.add_argument(
+        "-o",
+        "--output-path",
+        type=str,
+        help="Path to the packed output dataset. Defaults to the input path with a .bin suffix.",
+        default=None,
+    )
+    args = argParser.parse_args()
+
+    output_path = args.output_path or os.path.splitext(args.data_path)[0] + ".bin"
+    with open(args.data_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    count = pack_dataset(data, output_path)
+    print(f"Packed {count} questions into {output_path} ({os.path.getsize(output_path)} bytes)")
@@ -1,16 +1,20 @@
 import argparse
 import os
 import sys
-from typing import Dict, List
+from functools import reduce
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from src.data.data_processor import (
     read_json,
+    read_packed,
     get_cleaned_final_answer,
     get_answers_from_dict,
     get_answers_from_list,
+    get_answers_from_packed,
 )
 
 
@@ -72,16 +76,223 @@ def compute_metrics_for_list_answer(
     }
 
 
-def evaluate(result_path: str, dataset_path: str, dataset_type: str):
-    if not (os.path.exists(dataset_path) and os.path.exists(result_path)):
-        raise ValueError("Dataset or results path does not exist.")
-    dataset = read_json(dataset_path)
-    results = read_json(result_path)
+def per_question_list_scores(
+    answers: List[List[str]], true_answers: List[List[str]]
+) -> Dict[str, np.ndarray]:
+    """Per-question TP/FP/FN counts and F1 for list answers, computed once per run."""
+    tp = np.zeros(len(answers))
+    fp = np.zeros(len(answers))
+    fn = np.zeros(len(answers))
+    for i, (answer, true_answer) in enumerate(zip(answers, true_answers)):
+        true_set = set(true_answer)
+        tp[i] = sum(1 for item in answer if item in true_set)
+        fp[i] = len(answer) - tp[i]
+        fn[i] = len(true_set.difference(answer))
+
+    precision = np.divide(tp, tp + fp, out=np.zeros_like(tp), where=(tp + fp) > 0)
+    recall = np.divide(tp, tp + fn, out=np.zeros_like(tp), where=(tp + fn) > 0)
+    f1 = np.divide(
+        2 * precision * recall, precision + recall, out=np.zeros_like(tp), where=tp > 0
+    )
+    return {"tp": tp, "fp": fp, "fn": fn, "precision": precision, "f1": f1}
+
+
+def per_question_open_scores(
+    answers: List[str], true_answers: List[str]
+) -> Dict[str, np.ndarray]:
+    """Per-question token precision/recall/F1 for open answers, as in compute_metrics_for_open_answer."""
+    scores = np.zeros((3, len(answers)))
+    for i, (answer, true_answer) in enumerate(zip(answers, true_answers)):
+        answer = set(answer.split(" "))
+        true_answer = set(true_answer.split(" "))
+        tp = len(answer.intersection(true_answer))
+        precision = tp / len(answer) if answer else 0
+        recall = tp / len(true_answer) if true_answer else 0
+        f1_score = 2 * precision * recall / (precision + recall) if tp > 0 else 0
+        scores[:, i] = precision, recall, f1_score
+    return {"precision": scores[0], "recall": scores[1], "f1": scores[2]}
+
+
+def metric_terms(scores: Dict[str, np.ndarray], metric: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-question numerator and denominator whose weighted sums give the metric.
+
+    List precision is micro-averaged (total TP / total predicted entities), every
+    other metric is a per-question mean, i.e. a ratio with a denominator of 1.
+    """
+    if metric == "precision" and "tp" in scores:
+        return scores["tp"], scores["tp"] + scores["fp"]
+    return scores[metric], np.ones_like(scores[metric])
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    return np.divide(
+        numerator, denominator, out=np.zeros_like(numerator, dtype=float), where=denominator > 0
+    )
+
+
+def paired_bootstrap(
+    scores_a: Dict[str, np.ndarray],
+    scores_b: Dict[str, np.ndarray],
+    metric: str,
+    weights: np.ndarray,
+    swaps: np.ndarray,
+    alpha: float = 0.05,
+) -> Dict[str, float]:
+    """Paired comparison of system b against system a on the same questions.
+
+    `weights` (resamples x questions) holds bootstrap resample counts and
+    `swaps` (permutations x questions) marks questions whose two outputs are
+    exchanged for the paired permutation test. Each resample is a row, so every
+    statistic over all resamples is a single matrix-vector product.
+    """
+    num_a, den_a = metric_terms(scores_a, metric)
+    num_b, den_b = metric_terms(scores_b, metric)
+
+    value_a = _ratio(num_a.sum(), den_a.sum())
+    value_b = _ratio(num_b.sum(), den_b.sum())
+    delta = value_b - value_a
+
+    boot_a = _ratio(weights @ num_a, weights @ den_a)
+    boot_b = _ratio(weights @ num_b, weights @ den_b)
+    boot_delta = boot_b - boot_a
+    low, high = np.percentile(boot_delta, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+
+    # Under the null hypothesis both outputs of a question are exchangeable.
+    perm_a = _ratio(num_a.sum() + swaps @ (num_b - num_a), den_a.sum() + swaps @ (den_b - den_a))
+    perm_b = _ratio(num_b.sum() - swaps @ (num_b - num_a), den_b.sum() - swaps @ (den_b - den_a))
+    p_value = (np.sum(np.abs(perm_b - perm_a) >= abs(delta) - 1e-12) + 1) / (len(swaps) + 1)
+
+    return {
+        "a": float(value_a),
+        "b": float(value_b),
+        "delta": float(delta),
+        "ci_low": float(low),
+        "ci_high": float(high),
+        "p_value": float(p_value),
+    }
+
+
+def bootstrap_confidence_interval(
+    scores: Dict[str, np.ndarray], metric: str, weights: np.ndarray, alpha: float = 0.05
+) -> Tuple[float, float, float]:
+    numerator, denominator = metric_terms(scores, metric)
+    boot = _ratio(weights @ numerator, weights @ denominator)
+    low, high = np.percentile(boot, [100 * alpha / 2, 100 * (1 - alpha / 2)])
+    return float(_ratio(numerator.sum(), denominator.sum())), float(low), float(high)
+
 
-    if dataset_type == "wikidata":
+def get_run_name(result_path: str) -> str:
+    name = os.path.basename(result_path)
+    for setting in ["two_step", "joint", "factored", "fused"]:
+        if f"_{setting}" in name:
+            return setting
+    return os.path.splitext(name)[0]
+
+
+def load_usage(result_path: str) -> Optional[Dict[str, float]]:
+    """Total calls, tokens and cost of a run, from the usage file saved next to its results."""
+    usage_path = result_path.replace("_results.json", "_usage.json")
+    if usage_path == result_path or not os.path.exists(usage_path):
+        return None
+    rows = read_json(usage_path)["usage"]
+    return {
+        field: sum(row[field] for row in rows)
+        for field in ["calls", "prompt_tokens", "completion_tokens", "cost"]
+    }
+
+
+def load_systems(
+    result_paths: List[str], dataset_path: str, dataset_type: str
+) -> Tuple[Dict[str, Dict[str, np.ndarray]], int]:
+    """Per-question scores of the baseline and of every run, on the questions all runs share."""
+    from src.evaluation_store import EvaluationStore
+
+    store = EvaluationStore(dataset_path, dataset_type)
+    runs = [store.score(result_path, get_run_name(result_path)) for result_path in result_paths]
+    shared = reduce(np.intersect1d, [run.questions["index"] for run in runs])
+    if len(shared) == 0:
+        raise ValueError("The result files have no questions in common.")
+
+    # Every run starts from its own baseline; the first one stands for all.
+    systems = {"baseline": runs[0].scores("baseline", shared)}
+    for run in runs:
+        systems[run.name] = run.scores("final", shared)
+    return systems, len(shared)
+
+
+def evaluate_with_confidence(
+    result_paths: List[str],
+    dataset_path: str,
+    dataset_type: str,
+    n_resamples: int = 10000,
+    alpha: float = 0.05,
+    seed: int = 0,
+):
+    """Bootstrap CIs for every run and paired significance tests for every pair of runs."""
+    systems, n_questions = load_systems(result_paths, dataset_path, dataset_type)
+
+    rng = np.random.default_rng(seed)
+    weights = rng.multinomial(
+        n_questions, np.full(n_questions, 1 / n_questions), size=n_resamples
+    ).astype(float)
+    swaps = (rng.random((n_resamples, n_questions)) < 0.5).astype(float)
+
+    confidence = int((1 - alpha) * 100)
+    print(f"{n_questions} shared questions, {n_resamples} resamples, {confidence}% CIs")
+    for metric in ["precision", "f1"]:
+        print(f"\n{metric}")
+        for name, scores in systems.items():
+            value, low, high = bootstrap_confidence_interval(scores, metric, weights, alpha)
+            print(f"  {name:<12} {value:.3f} [{low:.3f}, {high:.3f}]")
+        for name_a, name_b in combinations(systems, 2):
+            comparison = paired_bootstrap(
+                systems[name_a], systems[name_b], metric, weights, swaps, alpha
+            )
+            print(
+                f"  {name_b} - {name_a}: {comparison['delta']:+.3f} "
+                f"[{comparison['ci_low']:+.3f}, {comparison['ci_high']:+.3f}], p={comparison['p_value']:.4f}"
+            )
+
+    # Cost over each run's own questions, e.g. to weigh a fused run's accuracy against joint's
+    print("\ncost per question")
+    for result_path in result_paths:
+        name = get_run_name(result_path)
+        usage = load_usage(result_path)
+        if usage is None:
+            print(f"  {name:<12} no usage file")
+            continue
+        n_run = len(read_json(result_path))
+        print(
+            f"  {name:<12} {usage['calls'] / n_run:.2f} calls, "
+            f"{usage['prompt_tokens'] / n_run:.0f} prompt + {usage['completion_tokens'] / n_run:.0f} output tokens, "
+            f"${usage['cost'] / n_run:.5f}"
+        )
+
+
+def load_true_answers(dataset_path: str, dataset_type: str):
+    if dataset_path.endswith(".bin"):
+        true_answers = get_answers_from_packed(read_packed(dataset_path))
+    elif dataset_type == "wikidata":
+        dataset = read_json(dataset_path)
         true_answers = get_answers_from_dict(dataset)
     elif dataset_type == "wikidata_category" or dataset_type == "multispan_qa":
+        dataset = read_json(dataset_path)
         true_answers = get_answers_from_list(dataset)
+    return true_answers
+
+
+def align_true_answers(results: List[Dict[str, str]], true_answers) -> List:
+    # Results of a subset or shard carry the dataset index of each question.
+    if results and "Index" in results[0]:
+        return [true_answers[result["Index"]] for result in results]
+    return true_answers
+
+
+def evaluate(result_path: str, dataset_path: str, dataset_type: str):
+    if not (os.path.exists(dataset_path) and os.path.exists(result_path)):
+        raise ValueError("Dataset or results path does not exist.")
+    results = read_json(result_path)
+    true_answers = align_true_answers(results, load_true_answers(dataset_path, dataset_type))
 
     if dataset_type == "multispan_qa":
         answers = [result["Final Refined Answer"] for result in results]
@@ -108,10 +319,14 @@ if __name__ == "__main__":
     argParser = argparse.ArgumentParser()
 
     argParser.add_argument(
-        "-r", "--result-path", type=str, help="Path to the result file."
+        "-r",
+        "--result-path",
+        type=str,
+        nargs="+",
+        help="Path to the result file. With --bootstrap, one result file per setting.",
     )
     argParser.add_argument(
-        "-d", "--dataset-path", type=str, help="Path to the original dataet."
+        "-d", "--dataset-path", type=str, help="Path to the original dataet (.json, or .bin packed with src/data/packed_dataset.py)."
     )
     argParser.add_argument(
         "-t",
@@ -121,6 +336,26 @@ if __name__ == "__main__":
         choices=["wikidata", "wikidata_category", "multispan_qa"],
     )
 
+    argParser.add_argument(
+        "--bootstrap",
+        action="store_true",
+        help="Report paired bootstrap CIs and significance tests across the result files.",
+    )
+    argParser.add_argument(
+        "--n-resamples", type=int, help="Bootstrap resamples.", default=10000
+    )
+    argParser.add_argument("--seed", type=int, help="Bootstrap seed.", default=0)
+
     args = argParser.parse_args()
 
-    evaluate(args.result_path, args.dataset_path, args.dataset_type)
+    if args.bootstrap:
+        evaluate_with_confidence(
+            args.result_path,
+            args.dataset_path,
+            args.dataset_type,
+            n_resamples=args.n_resamples,
+            seed=args.seed,
+        )
+    else:
+        for result_path in args.result_path:
+            evaluate(result_path, args.dataset_path, args.dataset_type)
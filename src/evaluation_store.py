@@ -0,0 +1,211 @@
+import hashlib
+import os
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from src.data.data_processor import read_json, get_cleaned_final_answer
+from src.evaluate import (
+    load_true_answers,
+    align_true_answers,
+    per_question_list_scores,
+    per_question_open_scores,
+    metric_terms,
+)
+
+# Bump when the stored tables change so stale cache files are not reused.
+SCHEMA_VERSION = 1
+SOURCES = {"baseline": "Baseline Answer", "final": "Final Refined Answer"}
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ScoredRun:
+    """Per-question and per-entity scores of one result file.
+
+    `questions` has one row per question: dataset index, question text and,
+    for each source (baseline / final), the per-question metric arrays used by
+    evaluate.py. `entities` has one row per distinct entity (or answer token
+    for multispan_qa) of a question, with whether it is in the baseline, in
+    the final answer and in the ground truth. Entities added or removed by
+    CoVe are rows where the two membership columns differ.
+    """
+
+    def __init__(self, name: str, questions: Dict[str, np.ndarray], entities: Dict[str, np.ndarray]):
+        self.name = name
+        self.questions = questions
+        self.entities = entities
+
+    def __len__(self) -> int:
+        return len(self.questions["index"])
+
+    def scores(self, source: str = "final", indices: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """Per-question metric arrays for a source, optionally for the given dataset indices."""
+        prefix = f"{source}_"
+        scores = {
+            column[len(prefix):]: values
+            for column, values in self.questions.items()
+            if column.startswith(prefix)
+        }
+        if indices is not None:
+            order = np.argsort(self.questions["index"])
+            rows = order[np.searchsorted(self.questions["index"], indices, sorter=order)]
+            scores = {column: values[rows] for column, values in scores.items()}
+        return scores
+
+    def metric(self, metric: str, source: str = "final") -> float:
+        numerator, denominator = metric_terms(self.scores(source), metric)
+        return float(numerator.sum() / denominator.sum()) if denominator.sum() > 0 else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        summary = {"run": self.name, "questions": len(self)}
+        for source in SOURCES:
+            for metric in ["precision", "f1"]:
+                summary[f"{source}_{metric}"] = self.metric(metric, source)
+        removed = self.entities["in_baseline"] & ~self.entities["in_final"]
+        added = self.entities["in_final"] & ~self.entities["in_baseline"]
+        correct = self.entities["is_correct"]
+        summary["removed_hallucinations"] = int(np.sum(removed & ~correct))
+        summary["removed_correct"] = int(np.sum(removed & correct))
+        summary["added_correct"] = int(np.sum(added & correct))
+        summary["added_hallucinations"] = int(np.sum(added & ~correct))
+        return summary
+
+    def correction_examples(self, n_examples: int = 3) -> List[Dict]:
+        """Questions where CoVe removed the most baseline entities that were wrong."""
+        entities = self.entities
+        rows = entities["row"]
+        in_baseline, in_final, correct = (
+            entities["in_baseline"], entities["in_final"], entities["is_correct"]
+        )
+        n_rows = len(self)
+        corrected = np.bincount(rows, weights=in_baseline & ~in_final & ~correct, minlength=n_rows)
+        baseline_count = np.bincount(rows, weights=in_baseline, minlength=n_rows)
+        final_count = np.bincount(rows, weights=in_final, minlength=n_rows)
+        baseline_precision = np.divide(
+            np.bincount(rows, weights=in_baseline & correct, minlength=n_rows),
+            baseline_count, out=np.zeros(n_rows), where=baseline_count > 0,
+        )
+        final_precision = np.divide(
+            np.bincount(rows, weights=in_final & correct, minlength=n_rows),
+            final_count, out=np.zeros(n_rows), where=final_count > 0,
+        )
+
+        # Most corrections first, then the largest precision gain
+        order = np.lexsort((final_precision - baseline_precision, corrected))[::-1]
+        order = [row for row in order if corrected[row] > 0][:n_examples]
+
+        examples = []
+        for row in order:
+            mask = (rows == row) & in_baseline & ~in_final & ~correct
+            examples.append({
+                "question": str(self.questions["question"][row]),
+                "baseline_count": int(self.questions["baseline_tp"][row] + self.questions["baseline_fp"][row])
+                if "baseline_tp" in self.questions else int(baseline_count[row]),
+                "cove_count": int(self.questions["final_tp"][row] + self.questions["final_fp"][row])
+                if "final_tp" in self.questions else int(final_count[row]),
+                "corrected_hallucinations": [str(entity) for entity in entities["entity"][mask]],
+                "baseline_precision": float(baseline_precision[row]),
+                "cove_precision": float(final_precision[row]),
+                "index": int(self.questions["index"][row]),
+            })
+        return examples
+
+
+class EvaluationStore:
+    """Scores each result file once and persists the tables in a columnar .npz file.
+
+    Cache files are keyed by the content hash of the result file, the dataset
+    file and the dataset type, so edited or re-run results are rescored while
+    unchanged ones load instantly across notebook sessions.
+    """
+
+    def __init__(self, dataset_path: str, dataset_type: str, cache_dir: str = ".eval_cache"):
+        self.dataset_path = dataset_path
+        self.dataset_type = dataset_type
+        self.cache_dir = cache_dir
+        self._dataset_digest = file_digest(dataset_path)
+        self._true_answers = None
+        self._runs: Dict[str, ScoredRun] = {}
+
+    @property
+    def true_answers(self):
+        if self._true_answers is None:
+            self._true_answers = load_true_answers(self.dataset_path, self.dataset_type)
+        return self._true_answers
+
+    def cache_path(self, result_path: str) -> str:
+        key = hashlib.sha256(
+            f"{SCHEMA_VERSION}:{self.dataset_type}:{self._dataset_digest}:{file_digest(result_path)}".encode()
+        ).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def score(self, result_path: str, name: Optional[str] = None) -> ScoredRun:
+        name = name or os.path.splitext(os.path.basename(result_path))[0]
+        cache_path = self.cache_path(result_path)
+        if cache_path not in self._runs:
+            if os.path.exists(cache_path):
+                with np.load(cache_path, allow_pickle=False) as data:
+                    tables = {column: data[column] for column in data.files}
+            else:
+                tables = self._score(result_path)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                np.savez(cache_path, **tables)
+            questions = {k[2:]: v for k, v in tables.items() if k.startswith("q_")}
+            entities = {k[2:]: v for k, v in tables.items() if k.startswith("e_")}
+            self._runs[cache_path] = ScoredRun(name, questions, entities)
+        run = self._runs[cache_path]
+        return ScoredRun(name, run.questions, run.entities)
+
+    def _score(self, result_path: str) -> Dict[str, np.ndarray]:
+        results = read_json(result_path)
+        gold = align_true_answers(results, self.true_answers)
+        tables = {
+            "q_index": np.array([result.get("Index", i) for i, result in enumerate(results)]),
+            "q_question": np.array([result["Question"] for result in results], dtype=str),
+        }
+
+        answers = {}
+        for source, field in SOURCES.items():
+            if self.dataset_type == "multispan_qa":
+                raw = [result[field] for result in results]
+                scores = per_question_open_scores(raw, gold)
+                answers[source] = [set(answer.split(" ")) for answer in raw]
+            else:
+                cleaned = get_cleaned_final_answer(results, field)
+                scores = per_question_list_scores(cleaned, gold)
+                answers[source] = [set(answer) for answer in cleaned]
+            for metric, values in scores.items():
+                tables[f"q_{source}_{metric}"] = values
+
+        rows, entity_names, in_baseline, in_final, is_correct = [], [], [], [], []
+        for row, (baseline, final, true_answer) in enumerate(
+            zip(answers["baseline"], answers["final"], gold)
+        ):
+            true_set = set(true_answer.split(" ")) if self.dataset_type == "multispan_qa" else set(true_answer)
+            for entity in sorted(baseline | final):
+                rows.append(row)
+                entity_names.append(entity)
+                in_baseline.append(entity in baseline)
+                in_final.append(entity in final)
+                is_correct.append(entity in true_set)
+
+        tables["e_row"] = np.array(rows, dtype=np.int64)
+        tables["e_entity"] = np.array(entity_names, dtype=str)
+        tables["e_in_baseline"] = np.array(in_baseline, dtype=bool)
+        tables["e_in_final"] = np.array(in_final, dtype=bool)
+        tables["e_is_correct"] = np.array(is_correct, dtype=bool)
+        return tables
+
+    def compare(self, result_paths: List[str]) -> List[Dict[str, float]]:
+        """One summary row per run, e.g. for pandas.DataFrame(store.compare(paths))."""
+        return [self.score(path).summary() for path in result_paths]
@@ -0,0 +1,116 @@
+"""Save a HuggingFace model as a local, ready-to-load snapshot.
+
+Loads a MODEL_MAPPING entry once with a load profile (downloading and, for
+the bitsandbytes profiles, quantizing it) and saves the result as
+safetensors together with the tokenizer under models/. Later runs with the
+same model and profile memory-map the snapshot instead (see `load_model`):
+
+    python3 src/prepare_model.py --model llama2 --load-profile 8bit
+    python3 main.py --model=llama2 --task=wikidata --setting=joint --load-profile 8bit
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from src.utils import (
+    LOAD_PROFILES,
+    MODEL_MAPPING,
+    SNAPSHOT_MANIFEST,
+    get_absolute_path,
+    get_snapshot_path,
+    load_model,
+    load_tokenizer,
+    resolve_load_profile,
+)
+
+# Oldest transformers that can save bitsandbytes weights of each kind
+MIN_SERIALIZATION_VERSION = {"8bit": (4, 31), "4bit": (4, 37)}
+
+
+def check_serializable(quantization: str):
+    import transformers
+
+    required = MIN_SERIALIZATION_VERSION.get(quantization)
+    version = tuple(int(part) for part in transformers.__version__.split(".")[:2])
+    if required is not None and version < required:
+        print(
+            f"❌ transformers {transformers.__version__} cannot save {quantization} bitsandbytes weights "
+            f"(needs >= {'.'.join(map(str, required))}). Upgrade transformers, or prepare the 8bit or an "
+            f"unquantized profile instead."
+        )
+        sys.exit()
+
+
+def prepare_model(model_name: str, load_profile: str, access_token: str = None, force: bool = False) -> str:
+    model_config = MODEL_MAPPING[model_name]
+    name, profile = resolve_load_profile(model_config, load_profile)
+    if name != (load_profile or model_config.load_profile):
+        print(f"❌ Cannot prepare the {load_profile or model_config.load_profile} profile on this machine")
+        sys.exit()
+    check_serializable(profile.quantization)
+
+    path = get_snapshot_path(model_config, name)
+    if os.path.exists(path):
+        if not force:
+            print(f"✅ Snapshot already prepared at {path} (use --force to rebuild)")
+            return path
+        shutil.rmtree(path)
+
+    start = time.perf_counter()
+    model = load_model(model_config, access_token, name)
+    tokenizer = load_tokenizer(model_config)
+    load_seconds = time.perf_counter() - start
+
+    # Written to a temporary directory first, so an interrupted run never leaves a half snapshot
+    staging_path = path + ".tmp"
+    shutil.rmtree(staging_path, ignore_errors=True)
+    model.save_pretrained(staging_path, safe_serialization=True)
+    tokenizer.save_pretrained(staging_path)
+    manifest = {
+        "model": model_name,
+        "source_id": model_config.quantized_ids.get(profile.quantization, model_config.id),
+        "profile": name,
+        "created": time.time(),
+    }
+    with open(os.path.join(staging_path, SNAPSHOT_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(staging_path, path)
+
+    # Freed before the warm reload, so peak memory stays at one copy of the model
+    import torch
+
+    del model
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+    start = time.perf_counter()
+    load_model(model_config, access_token, name)
+    warm_seconds = time.perf_counter() - start
+    print(f"📁 Snapshot saved to: {path}")
+    print(f"⏱️ Load time: {load_seconds:.1f}s from the source, {warm_seconds:.1f}s from the snapshot")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, required=True, choices=[
+        model_id for model_id, config in MODEL_MAPPING.items() if config.backend == "hf"
+    ])
+    parser.add_argument(
+        "--load-profile", type=str, help="Profile to prepare, the model's default if unset.",
+        default=None, choices=list(LOAD_PROFILES),
+    )
+    parser.add_argument("--force", action="store_true", help="Rebuild an existing snapshot.")
+    args = parser.parse_args()
+
+    from dotenv import dotenv_values
+
+    access_token = dotenv_values(get_absolute_path(".env")).get("HF_API_KEY")
+    prepare_model(args.model, args.load_profile, access_token, args.force)
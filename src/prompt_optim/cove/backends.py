@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class BackendError(Exception):
+    """A request failed for good (non-retryable error or retries exhausted)."""
+
+
+class TransientError(Exception):
+    """A request failed in a way worth retrying, optionally after `retry_after` seconds."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitError(TransientError):
+    """The provider rejected the request for exceeding its rate limit or quota."""
+
+
+@dataclass
+class Completion:
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # Prompt tokens read from a context cache, included in prompt_tokens
+    cached_tokens: int = 0
+
+
+class LLMBackend:
+    """Transport a ChainOfVerification uses to reach a model.
+
+    A chain with a backend gets `call_llm` for free: the backend sends the
+    processed prompt with the chain's sampling parameters and returns the
+    text with its token counts. Subclasses implement `send`; a
+    `TransientError` from it is retried `max_retries` times with exponential
+    backoff and jitter, or after its `retry_after`. `on_throttle`, when set,
+    is called on every rate limited attempt.
+    """
+
+    def __init__(self, max_retries: int = 3, backoff: float = 0.5):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._counter_lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.on_throttle: Optional[Callable[[], None]] = None
+
+    def send(self, model: str, prompt: str, max_tokens: int, **params) -> Completion:
+        raise NotImplementedError("Backends must implement this method.")
+
+    def retry_delay(self, attempt: int, error: TransientError) -> float:
+        delay = min(self.backoff * 2 ** attempt, 30.0) * random.uniform(0.5, 1.0)
+        if error.retry_after is not None:
+            # Never earlier than asked, jittered so clients told the same wait do not retry together
+            delay = max(delay, error.retry_after * random.uniform(1.0, 1.5))
+        return delay
+
+    def complete(self, model: str, prompt: str, max_tokens: int, **params) -> Completion:
+        for attempt in range(self.max_retries + 1):
+            with self._counter_lock:
+                self.requests += 1
+            try:
+                return self.send(model, prompt, max_tokens, **params)
+            except TransientError as e:
+                error = e
+                with self._counter_lock:
+                    self.rate_limited += isinstance(e, RateLimitError)
+                if isinstance(e, RateLimitError) and self.on_throttle is not None:
+                    self.on_throttle()
+            if attempt == self.max_retries:
+                break
+            with self._counter_lock:
+                self.retries += 1
+            time.sleep(self.retry_delay(attempt, error))
+        raise BackendError(f"Request failed after {self.max_retries + 1} attempts: {error}")
+
+    def summary(self) -> str:
+        return f"{self.requests} requests, {self.retries} retries, {self.rate_limited} rate limited"
+
+    def close(self):
+        pass
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Chat completions over a pooled keep-alive HTTP client.
+
+    Works with any server exposing the OpenAI `/chat/completions` API (OpenAI,
+    vLLM, llama.cpp server, ...). At most `max_concurrency` requests are in
+    flight, each reusing one of as many pooled connections. Timeouts,
+    connection errors and retryable status codes are retried with backoff,
+    honouring `Retry-After`.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 8,
+        timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+    ):
+        import httpx
+
+        super().__init__(max_retries=max_retries, backoff=backoff)
+        self._httpx = httpx
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.client = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+        )
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+
+    def send(self, model: str, prompt: str, max_tokens: int, **params) -> Completion:
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            **params,
+        }
+        with self._slots:
+            try:
+                response = self.client.post("/chat/completions", json=payload)
+            except self._httpx.TransportError as e:
+                raise TransientError(f"{type(e).__name__}: {e}")
+
+        if response.status_code != 200:
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                raise BackendError(error)
+            retry_after = response.headers.get("retry-after")
+            try:
+                retry_after = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                retry_after = None
+            error_type = RateLimitError if response.status_code == 429 else TransientError
+            raise error_type(error, retry_after)
+
+        body = response.json()
+        usage = body.get("usage") or {}
+        return Completion(
+            text=(body["choices"][0]["message"]["content"] or "").strip(),
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+        )
+
+    def summary(self) -> str:
+        return f"{super().summary()} (max {self.max_concurrency} in flight)"
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,237 @@
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import List, Optional
+
+import torch
+
+
+@dataclass
+class GenerationOutput:
+    tokens: List[int]
+    mean_logprob: float
+
+
+class _Sequence:
+    def __init__(self, prompt_ids: List[int], max_new_tokens: int, future: Future):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.future = future
+        self.tokens: List[int] = []
+        self.logprobs: List[float] = []
+        # Legacy per-layer ((key, value), ...) cache of this sequence alone, batch size 1
+        self.past = None
+        self.length = 0
+
+    def done(self, eos_token_id: Optional[int]) -> bool:
+        return len(self.tokens) >= self.max_new_tokens or (
+            eos_token_id is not None and self.tokens[-1] == eos_token_id
+        )
+
+
+class ContinuousBatchingEngine:
+    """Iteration-level batching of generation requests on one HF causal LM.
+
+    Requests are queued with `submit` from any thread and served by a single
+    scheduler thread. Each decode step runs every active sequence one token
+    forward in one batch; sequences that hit EOS or their token limit leave
+    right away and queued requests are prefilled and join at the next step,
+    so short executes never wait for a long plan to finish.
+
+    The KV cache is kept per sequence and left-padded into a batch only when
+    the batch changes; in between, the batched cache returned by the model is
+    reused as is. Sampling follows `generate(do_sample=True)` with temperature
+    and top-p.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size: int = 8,
+        temperature: float = 1.0,
+        top_p: float = 1.0,
+        eos_token_id: Optional[int] = None,
+        do_sample: bool = True,
+        seed: Optional[int] = None,
+    ):
+        self.model = model
+        self.device = next(model.parameters()).device
+        self.max_batch_size = max_batch_size
+        self.temperature = temperature
+        self.top_p = top_p
+        self.eos_token_id = eos_token_id
+        self.do_sample = do_sample
+        self.generator = (
+            torch.Generator(device=self.device).manual_seed(seed) if seed is not None else None
+        )
+
+        self._queue: "queue.Queue[Optional[_Sequence]]" = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        # Batched cache of the current members, and the cache length of each row
+        self._members: List[_Sequence] = []
+        self._batch_past = None
+        self._batch_length = 0
+
+        self.steps = 0
+        self.batched_tokens = 0
+
+    def submit(self, prompt_ids: List[int], max_new_tokens: int) -> Future:
+        future = Future()
+        if max_new_tokens <= 0:
+            future.set_result(GenerationOutput([], 0.0))
+            return future
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+        self._queue.put(_Sequence(list(prompt_ids), max_new_tokens, future))
+        return future
+
+    def generate(self, prompt_ids: List[int], max_new_tokens: int) -> GenerationOutput:
+        return self.submit(prompt_ids, max_new_tokens).result()
+
+    def close(self):
+        with self._thread_lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.batched_tokens / self.steps if self.steps else 0.0
+
+    def _loop(self):
+        active: List[_Sequence] = []
+        while True:
+            waiting = [self._queue.get()] if not active else []
+            while len(active) + len(waiting) < self.max_batch_size:
+                try:
+                    waiting.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in waiting:
+                for sequence in active + [s for s in waiting if s is not None]:
+                    sequence.future.set_exception(RuntimeError("Engine closed"))
+                return
+
+            try:
+                with torch.inference_mode():
+                    for sequence in waiting:
+                        self._prefill(sequence)
+                    active += [s for s in waiting if not self._finish_if_done(s)]
+                    if active:
+                        self._decode_step(active)
+                        active = [s for s in active if not self._finish_if_done(s)]
+            except BaseException as e:
+                for sequence in active + waiting:
+                    if not sequence.future.done():
+                        sequence.future.set_exception(e)
+                active, self._members, self._batch_past = [], [], None
+
+    def _finish_if_done(self, sequence: _Sequence) -> bool:
+        if not sequence.done(self.eos_token_id):
+            return False
+        mean_logprob = sum(sequence.logprobs) / len(sequence.logprobs)
+        sequence.future.set_result(GenerationOutput(sequence.tokens, mean_logprob))
+        sequence.past = None
+        return True
+
+    def _sample(self, logits: torch.Tensor):
+        """Next token and its log-probability for each row of `logits` [batch, vocab].
+
+        The log-probability is the model's own, before temperature and top-p.
+        """
+        logits = logits.float()
+        raw_logprobs = torch.log_softmax(logits, dim=-1)
+        if self.do_sample:
+            logits = logits / self.temperature
+            if self.top_p < 1.0:
+                sorted_logits, sorted_indices = torch.sort(logits, descending=False)
+                cumulative_probs = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+                sorted_to_remove = cumulative_probs <= (1 - self.top_p)
+                sorted_to_remove[..., -1:] = False
+                to_remove = sorted_to_remove.scatter(1, sorted_indices, sorted_to_remove)
+                logits = logits.masked_fill(to_remove, -float("inf"))
+        logprobs = torch.log_softmax(logits, dim=-1)
+        if self.do_sample:
+            next_tokens = torch.multinomial(
+                logprobs.exp(), num_samples=1, generator=self.generator
+            ).squeeze(1)
+        else:
+            next_tokens = torch.argmax(logprobs, dim=-1)
+        return next_tokens, raw_logprobs.gather(1, next_tokens[:, None]).squeeze(1)
+
+    def _append(self, sequence: _Sequence, token: int, logprob: float):
+        sequence.tokens.append(token)
+        sequence.logprobs.append(logprob)
+
+    def _prefill(self, sequence: _Sequence):
+        input_ids = torch.tensor([sequence.prompt_ids], device=self.device)
+        outputs = self.model(input_ids=input_ids, use_cache=True)
+        sequence.past = tuple(tuple(layer) for layer in outputs.past_key_values)
+        sequence.length = len(sequence.prompt_ids)
+        next_tokens, logprobs = self._sample(outputs.logits[:, -1, :])
+        self._append(sequence, next_tokens[0].item(), logprobs[0].item())
+
+    def _split_batch(self):
+        """Move each current member's rows out of the batched cache, without padding."""
+        for row, sequence in enumerate(self._members):
+            if sequence.past is not None or sequence.future.done():
+                continue
+            start = self._batch_length - sequence.length
+            sequence.past = tuple(
+                (key[row : row + 1, :, start:], value[row : row + 1, :, start:])
+                for key, value in self._batch_past
+            )
+        self._members, self._batch_past = [], None
+
+    def _build_batch(self, active: List[_Sequence]):
+        length = max(sequence.length for sequence in active)
+        layers = []
+        for layer in range(len(active[0].past)):
+            keys, values = [], []
+            for sequence in active:
+                key, value = sequence.past[layer]
+                pad = length - sequence.length
+                if pad:
+                    key = torch.nn.functional.pad(key, (0, 0, pad, 0))
+                    value = torch.nn.functional.pad(value, (0, 0, pad, 0))
+                keys.append(key)
+                values.append(value)
+            layers.append((torch.cat(keys), torch.cat(values)))
+        for sequence in active:
+            sequence.past = None
+        self._members = list(active)
+        self._batch_past = tuple(layers)
+        self._batch_length = length
+
+    def _decode_step(self, active: List[_Sequence]):
+        if self._members != active:
+            self._split_batch()
+            self._build_batch(active)
+
+        lengths = torch.tensor([sequence.length for sequence in active], device=self.device)
+        positions = torch.arange(self._batch_length + 1, device=self.device)
+        # Left padding is masked out; the new token attends to its own cache only
+        attention_mask = (positions[None, :] >= (self._batch_length - lengths)[:, None]).long()
+        input_ids = torch.tensor([[sequence.tokens[-1]] for sequence in active], device=self.device)
+
+        outputs = self.model(
+            input_ids=input_ids,
+            past_key_values=self._batch_past,
+            attention_mask=attention_mask,
+            position_ids=lengths[:, None],
+            use_cache=True,
+        )
+        self._batch_past = tuple(tuple(layer) for layer in outputs.past_key_values)
+        self._batch_length += 1
+        next_tokens, logprobs = self._sample(outputs.logits[:, -1, :])
+        for sequence, token, logprob in zip(active, next_tokens.tolist(), logprobs.tolist()):
+            sequence.length += 1
+            self._append(sequence, token, logprob)
+
+        self.steps += 1
+        self.batched_tokens += len(active)
@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+
+class CheckpointMixin:
+    """Resumable runs for a ChainOfVerification: results are saved after every question.
+
+    Call `init_checkpoint()` after `ChainOfVerification.__init__`; it loads any
+    checkpoint of the same model, task, setting and selection, and sets
+    `start_question_index` to the first question still to run. Checkpoint
+    writes are counted (`checkpoint_writes`, `checkpoint_bytes`,
+    `checkpoint_seconds`) so their I/O cost can be benchmarked.
+    """
+
+    def init_checkpoint(self, checkpoint_dir: str = None):
+        self.checkpoint_dir = checkpoint_dir or os.path.join(os.getcwd(), "checkpoints")
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self.checkpoint_file = os.path.join(
+            self.checkpoint_dir,
+            f"{self.model_id}_{self.task}_{self.setting}{self.run_tag}_checkpoint.json"
+        )
+        self.checkpoint_writes = 0
+        self.checkpoint_bytes = 0
+        self.checkpoint_seconds = 0.0
+
+        self.checkpoint_data = self.load_checkpoint()
+        self.start_question_index = self.checkpoint_data.get("last_completed_index", -1) + 1
+
+    def load_checkpoint(self) -> Dict[str, Any]:
+        """Load checkpoint data if exists."""
+        if os.path.exists(self.checkpoint_file):
+            try:
+                with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"⚠️ Error loading checkpoint: {e}")
+                return {}
+        return {}
+
+    def save_checkpoint(self, question_index: int, results: List[Dict[str, str]]):
+        """Save current progress to checkpoint file."""
+        start = time.perf_counter()
+        try:
+            checkpoint_data = {
+                "model_id": self.model_id,
+                "task": self.task,
+                "setting": self.setting,
+                "last_completed_index": question_index,
+                "total_questions": len(self.questions),
+                "completed_results": results,
+                "timestamp": time.time()
+            }
+            with open(self.checkpoint_file, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint_data, f, indent=2, ensure_ascii=False)
+                self.checkpoint_bytes += f.tell()
+            self.checkpoint_writes += 1
+            print(f"✅ Checkpoint saved ({question_index + 1}/{len(self.questions)} completed)")
+        except Exception as e:
+            print(f"⚠️ Error saving checkpoint: {e}")
+        self.checkpoint_seconds += time.perf_counter() - start
+
+    def cleanup_checkpoint(self):
+        """Remove checkpoint file after successful completion."""
+        try:
+            if os.path.exists(self.checkpoint_file):
+                os.remove(self.checkpoint_file)
+                print("🧹 Checkpoint cleaned up")
+        except Exception as e:
+            print(f"⚠️ Error cleaning up checkpoint: {e}")
@@ -0,0 +1,105 @@
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the number of LLM calls in flight.
+
+    Every call holds a slot while it runs. While the limit is in use and
+    latency stays flat, it grows by one per `limit` successful calls
+    (additive increase). A throttled call (rate limit / quota error), or a
+    stage whose median latency over its last `window` calls exceeds
+    `latency_tolerance` times the lowest median seen so far, multiplies it by
+    `backoff` (multiplicative decrease), at most once per typical call
+    latency so a single burst of errors counts once.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 2,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+        window: int = 10,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.window = window
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._condition = threading.Condition()
+        self._latencies: Dict[str, deque] = {}
+        # Lowest median latency of each stage, the estimate of its unloaded latency
+        self._baselines: Dict[str, float] = {}
+        self._typical_latency = 0.0
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self.peak_limit = int(self._limit)
+        self.decreases = 0
+        self.throttled = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @contextmanager
+    def slot(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+            saturated = self.in_flight >= self.limit
+        try:
+            yield saturated
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self, stage: str, seconds: float, saturated: bool = True):
+        """Record a completed call; `saturated` if the limit was in use when it started."""
+        with self._condition:
+            latencies = self._latencies.setdefault(stage, deque(maxlen=self.window))
+            latencies.append(seconds)
+            self._typical_latency = 0.9 * self._typical_latency + 0.1 * seconds if self._typical_latency else seconds
+            inflated = False
+            if len(latencies) == self.window:
+                median = statistics.median(latencies)
+                baseline = min(self._baselines.get(stage, median), median)
+                self._baselines[stage] = baseline
+                inflated = median > baseline * self.latency_tolerance
+            if inflated:
+                self._decrease()
+            elif saturated and self._limit < self.max_limit:
+                # +1 per `limit` calls, only when the limit is actually the bottleneck
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+                self.peak_limit = max(self.peak_limit, self.limit)
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            self.throttled += 1
+            self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self._typical_latency:
+            return
+        self._last_decrease = now
+        self._limit = max(self.min_limit, self._limit * self.backoff)
+        self.decreases += 1
+        # Latencies of calls made at the old limit say nothing about the new one
+        for latencies in self._latencies.values():
+            latencies.clear()
+
+    def summary(self) -> str:
+        return (
+            f"limit {self.limit} (peak {self.peak_limit}, max {self.max_limit}), "
+            f"{self.decreases} backoffs, {self.throttled} throttled calls"
+        )
@@ -0,0 +1,97 @@
+from typing import List, Optional
+
+import torch
+from transformers import LogitsProcessor
+
+NUMBERING_CHARACTERS = set(" .0123456789")
+
+
+def token_texts(tokenizer, vocab_size: int) -> List[Optional[str]]:
+    """Text each token id adds when decoded after other text, None for special and unused ids.
+
+    Decoded after an anchor token, so SentencePiece word-start spaces are kept.
+    """
+    anchor = tokenizer("a", add_special_tokens=False).input_ids[-1:]
+    anchor_text = tokenizer.decode(anchor)
+    special = set(tokenizer.all_special_ids)
+    texts = []
+    for token_id in range(vocab_size):
+        if token_id >= len(tokenizer) or token_id in special:
+            texts.append(None)
+        else:
+            texts.append(tokenizer.decode(anchor + [token_id])[len(anchor_text):])
+    return texts
+
+
+class ListVocabulary:
+    """The token classes a numbered list constraint needs, computed once per tokenizer."""
+
+    def __init__(self, tokenizer, vocab_size: int):
+        texts = token_texts(tokenizer, vocab_size)
+        self.tokenizer = tokenizer
+        self.size = vocab_size
+        self.eos_token_id = tokenizer.eos_token_id
+        # Tokens that can spell "12. " at the start of a line
+        self.numbering = [
+            (token_id, text)
+            for token_id, text in enumerate(texts)
+            if text and set(text) <= NUMBERING_CHARACTERS
+        ]
+        # The first token of an item, after "12."
+        self.item_start = torch.tensor(
+            [text is not None and text.startswith(" ") and "\n" not in text for text in texts]
+        )
+        # Item text, ending the line at most at its end: a token cannot start the next line
+        self.item_text = torch.tensor(
+            [text is not None and "\n" not in text.rstrip("\n") and text.count("\n") <= 1 for text in texts]
+        )
+
+
+class NumberedListLogitsProcessor(LogitsProcessor):
+    """Constrain generation to a numbered list of at most `max_items` items.
+
+    Every line is "k. item", k counting from 1, and the list ends with the EOS
+    token after at least one item, forced once `max_items` lines are complete. A preamble ("Sure!
+    Here is ..."), blank lines and trailing paragraphs cannot be generated, so
+    the response parses as a list by construction.
+    """
+
+    def __init__(self, vocabulary: ListVocabulary, prompt_length: int, max_items: int):
+        self.vocabulary = vocabulary
+        self.prompt_length = prompt_length
+        self.max_items = max_items
+        self.capped = False
+
+    def allowed(self, text: str) -> torch.Tensor:
+        vocabulary = self.vocabulary
+        allowed = torch.zeros(vocabulary.size, dtype=torch.bool)
+        *complete, line = text.split("\n")
+        if len(complete) >= self.max_items:
+            self.capped = True
+            allowed[vocabulary.eos_token_id] = True
+            return allowed
+        numbering = f"{len(complete) + 1}."
+        stripped = line.lstrip(" ")
+        if len(stripped) < len(numbering):
+            # The list ends at a line start, after at least one item
+            if not stripped and complete:
+                allowed[vocabulary.eos_token_id] = True
+            # The first line may start with spaces (SentencePiece word starts), once
+            leading_space = not complete and not stripped
+            for token_id, token_text in vocabulary.numbering:
+                piece = token_text.lstrip(" ") if leading_space else token_text
+                if (not piece and not line) or (piece and numbering.startswith(stripped + piece)):
+                    allowed[token_id] = True
+            return allowed
+        if stripped == numbering:
+            return vocabulary.item_start.clone()
+        allowed = vocabulary.item_text.clone()
+        allowed[vocabulary.eos_token_id] = True
+        return allowed
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        for row in range(input_ids.shape[0]):
+            text = self.vocabulary.tokenizer.decode(input_ids[row, self.prompt_length:], skip_special_tokens=True)
+            allowed = self.allowed(text).to(scores.device)
+            scores[row] = scores[row].masked_fill(~allowed, float("-inf"))
+        return scores
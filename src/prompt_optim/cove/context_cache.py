@@ -0,0 +1,132 @@
+import itertools
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+
+class CacheNotFoundError(Exception):
+    """The provider no longer has a cached content (expired or deleted)."""
+
+
+@dataclass
+class CacheHandle:
+    name: str
+    model: str
+    prefix_tokens: int
+    # Monotonic time the provider drops the cached content
+    expires_at: float
+
+
+class LocalCacheProvider:
+    """In-process stand-in for a provider's cached-content API, for offline runs.
+
+    Implements the provider interface `ContextCache` uses (`create`,
+    `refresh`, `delete`) and `resolve`, which a simulated server calls to
+    turn a cache name back into the prefix it stands for.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # name -> (prefix, monotonic expiry)
+        self._contents: Dict[str, Tuple[str, float]] = {}
+
+    def create(self, model: str, prefix: str, ttl: float) -> str:
+        with self._lock:
+            name = f"cachedContents/local-{next(self._ids)}"
+            self._contents[name] = (prefix, time.monotonic() + ttl)
+        return name
+
+    def refresh(self, name: str, ttl: float):
+        with self._lock:
+            prefix, _ = self._lookup(name)
+            self._contents[name] = (prefix, time.monotonic() + ttl)
+
+    def delete(self, name: str):
+        with self._lock:
+            self._contents.pop(name, None)
+
+    def resolve(self, name: str) -> str:
+        with self._lock:
+            return self._lookup(name)[0]
+
+    def _lookup(self, name: str) -> Tuple[str, float]:
+        content = self._contents.get(name)
+        if content is None or content[1] <= time.monotonic():
+            self._contents.pop(name, None)
+            raise CacheNotFoundError(f"{name} not found")
+        return content
+
+
+class ContextCache:
+    """Provider-side cached contents of static prompt prefixes.
+
+    A prefix of at least `min_tokens` gets one cached content per model,
+    created on first use with a `ttl` second lifetime. A handle within
+    `refresh_margin` (a fraction of the ttl) of expiring is extended before
+    it is used; one the provider lost is created again. `counts` tracks
+    calls sent with a cached prefix ("hits"), calls whose prefix is too short
+    to cache ("short"), and created, refreshed and expired caches.
+    """
+
+    def __init__(
+        self,
+        provider,
+        ttl: float = 3600.0,
+        min_tokens: int = 1024,
+        refresh_margin: float = 0.1,
+        counts: Optional[Counter] = None,
+    ):
+        self.provider = provider
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.refresh_margin = refresh_margin
+        self.counts = counts if counts is not None else Counter()
+        self._lock = threading.Lock()
+        self._handles: Dict[Tuple[str, str], CacheHandle] = {}
+
+    def handle(self, model: str, prefix: str, prefix_tokens: int) -> Optional[CacheHandle]:
+        """The live cached content of `prefix`, None when it is too short to cache."""
+        # Held while creating, so concurrent first calls share one cached content
+        with self._lock:
+            if prefix_tokens < self.min_tokens:
+                self.counts["short"] += 1
+                return None
+            handle = self._handles.get((model, prefix))
+            now = time.monotonic()
+            if handle is not None and handle.expires_at - now < self.ttl * self.refresh_margin:
+                try:
+                    self.provider.refresh(handle.name, self.ttl)
+                    handle.expires_at = now + self.ttl
+                    self.counts["refreshed"] += 1
+                except CacheNotFoundError:
+                    handle = None
+                    self.counts["expired"] += 1
+            if handle is None:
+                handle = CacheHandle(
+                    self.provider.create(model, prefix, self.ttl), model, prefix_tokens, now + self.ttl
+                )
+                self._handles[model, prefix] = handle
+                self.counts["created"] += 1
+            self.counts["hits"] += 1
+        return handle
+
+    def invalidate(self, handle: CacheHandle):
+        """Forget a handle the provider rejected, the next call creates it again."""
+        with self._lock:
+            for key, cached in list(self._handles.items()):
+                if cached is handle:
+                    del self._handles[key]
+                    self.counts["expired"] += 1
+
+    def close(self):
+        """Delete every cached content, providers bill them while they live."""
+        with self._lock:
+            handles, self._handles = list(self._handles.values()), {}
+        for handle in handles:
+            try:
+                self.provider.delete(handle.name)
+            except Exception as e:
+                print(f"⚠️ Could not delete cached content {handle.name}: {e}")
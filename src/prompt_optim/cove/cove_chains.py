@@ -1,18 +1,99 @@
 import json
+import math
+import os
+import random
 import sys
-from typing import Dict
-from ...data.data_processor import get_items_from_answer
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+from ...data.data_processor import (
+    IncrementalListParser,
+    get_items_from_answer,
+    parse_fused_response,
+    parse_list_response,
+)
+from .backends import BackendError, LLMBackend, RateLimitError
+from .concurrency import AdaptiveConcurrencyLimiter
+from .context_cache import CacheHandle, ContextCache
+from .hedging import HedgingPolicy
+from .prompts import FUSED_RESPONSE_SCHEMA, LIST_RESPONSE_SCHEMA
+from .replay import ReplayRecorder
+from .request_coalescer import RequestCoalescer
+from .templates import compile_stage_prompts, estimate_tokens
+from .usage import UsageTracker
 from ...utils import (
     TaskConfig,
     MODEL_MAPPING,
     ModelConfig,
     TASK_MAPPING,
     SETTINGS,
+    STAGES,
+    DEFAULT_EMBEDDING_MODEL,
 )
 
+CONFIDENCE_METHODS = ["logprob", "self_consistency"]
+# Retries of a rate limited call that reaches the adaptive concurrency limiter
+RATE_LIMIT_RETRIES = 5
+
+# Intermediate result fields written by each setting, left empty on early exit.
+INTERMEDIATE_RESULT_KEYS = {
+    "two_step": ["Verification Questions", "Execute Plan"],
+    "joint": ["Plan and Execution"],
+    "factored": ["Verification Questions", "Execute Plan"],
+    "fused": ["Plan and Execution"],
+}
+
 
 class ChainOfVerification:
-    def __init__(self, model_id, task, setting, questions):
+    supports_logprobs = False
+    # Chains whose stream_llm delivers the response while it is generated
+    supports_streaming = False
+    # Chains that can send static prompt prefixes as provider-side cached contents
+    supports_context_cache = False
+    # Chains that can constrain list stages to a list while decoding
+    supports_constrained_lists = False
+    # Chains whose backend answers with JSON when given a `response_schema`
+    structured_output = False
+    # Set by chains that reach their models through a shared transport
+    backend: Optional[LLMBackend] = None
+    # Questions run at once by run_chain; backends that batch or pool requests raise it
+    question_workers = 1
+
+    def __init__(
+        self,
+        model_id,
+        task,
+        setting,
+        questions,
+        question_indices=None,
+        run_tag="",
+        dedupe_prompts=True,
+        confidence_method=None,
+        confidence_threshold=None,
+        consistency_samples=2,
+        stage_models=None,
+        prompt_budgets=None,
+        seed=None,
+        record_path=None,
+        stream=False,
+        call_timeouts=None,
+        hedge_quantile=None,
+        adaptive_concurrency=False,
+        max_in_flight=32,
+        context_cache=False,
+        cache_ttl=3600.0,
+        cache_min_tokens=1024,
+        semantic_cache=False,
+        semantic_cache_path=None,
+        semantic_threshold=0.9,
+        semantic_cache_size=10000,
+        embedding_model=None,
+        fact_store=None,
+        constrained_lists=False,
+    ):
         self.model_id = model_id
         self.model_config: ModelConfig = MODEL_MAPPING.get(model_id, None)
         if self.model_config is None:
@@ -36,65 +117,509 @@ class ChainOfVerification:
             sys.exit()
 
         self.questions = questions
+        # Dataset index of each question, so results of a subset or shard can be
+        # evaluated and merged back in order.
+        self.question_indices = (
+            list(question_indices) if question_indices is not None else list(range(len(questions)))
+        )
+        self.run_tag = run_tag
+        self.result_file_path = (
+            f"./result/{self.model_id}_{self.task}_{self.setting}{self.run_tag}_results.json"
+        )
 
-    def call_llm(self, prompt: str, max_tokens: int) -> str:
-        raise NotImplementedError("Subclasses must implement this method.")
+        # Identical prompts (e.g. the same factored verification question for
+        # several questions) share a single LLM call.
+        self.coalescer = RequestCoalescer() if dedupe_prompts else None
+
+        # Adaptive mode: score the baseline and skip verification above the threshold.
+        self.confidence_method = confidence_method
+        self.confidence_threshold = confidence_threshold
+        self.consistency_samples = consistency_samples
+        if self.confidence_method is not None and self.confidence_method not in CONFIDENCE_METHODS:
+            print(f"Invalid confidence method. Valid methods are: {', '.join(CONFIDENCE_METHODS)}")
+            sys.exit()
+        if self.confidence_threshold is not None and self.confidence_method is None:
+            print("A confidence threshold needs a confidence method to score the baseline.")
+            sys.exit()
+        if self.confidence_method is not None and self.setting == "fused":
+            print("The fused setting answers in a single call, it has no baseline to score before verifying.")
+            sys.exit()
+        if self.confidence_method == "logprob" and not self.supports_logprobs:
+            print(f"Model {self.model_id} does not expose token log-probabilities, use self_consistency.")
+            sys.exit()
+        self.path_counts = Counter()
+        self._path_lock = threading.Lock()
+        # Fused responses by parse status: json, repaired (truncated or incomplete) or failed
+        self.fused_counts = Counter()
+
+        # Per-stage model routing, e.g. {"execute": "llama2", "verify": "llama2_70b"}.
+        # Stages without a route use `model_id`.
+        self.stage_models = dict(stage_models or {})
+        for stage, routed_model_id in self.stage_models.items():
+            if stage not in STAGES:
+                print(f"Invalid stage {stage}. Valid stages are: {', '.join(STAGES)}")
+                sys.exit()
+            routed_config = MODEL_MAPPING.get(routed_model_id, None)
+            if routed_config is None:
+                print(f"Invalid model {routed_model_id} for stage {stage}. Valid models are: {', '.join(MODEL_MAPPING.keys())}")
+                sys.exit()
+            if routed_config.backend != self.model_config.backend:
+                print(
+                    f"Cannot route stage {stage} to {routed_model_id}: it runs on the {routed_config.backend} backend, "
+                    f"but {self.model_id} runs on {self.model_config.backend}."
+                )
+                sys.exit()
+        self.routed_model_ids = [self.model_id] + sorted(
+            set(self.stage_models.values()) - {self.model_id}
+        )
+
+        self.usage = UsageTracker()
+        self._call_usage = threading.local()
+        self.usage_file_path = self.result_file_path.replace("_results.json", "_usage.json")
+
+        # Templates are fused with their model's prompt format and validated up
+        # front, so a bad placeholder fails here instead of mid-run.
+        try:
+            self.prompts = compile_stage_prompts(
+                self.task_config,
+                self.setting,
+                {stage: self.stage_model(stage) for stage in STAGES},
+            )
+        except ValueError as e:
+            print(f"Invalid prompt template: {e}")
+            sys.exit()
+
+        # Seed for backends that support seeded sampling, for reproducible runs
+        self.seed = seed
+        # Every call (stage, prompt, params -> response, timing) is recorded for replay
+        self.recorder = ReplayRecorder(record_path) if record_path else None
+
+        # Optional per-stage caps on prompt tokens, below the context window budget
+        self.prompt_budgets = dict(prompt_budgets or {})
+        for stage, budget in self.prompt_budgets.items():
+            if stage not in STAGES:
+                print(f"Invalid stage {stage}. Valid stages are: {', '.join(STAGES)}")
+                sys.exit()
+            if budget <= 0:
+                print(f"Invalid prompt budget {budget} for stage {stage}, it must be positive.")
+                sys.exit()
+
+        # Factored runs can stream the plan and execute its questions as they are generated
+        self.stream = stream
+        if self.stream and self.setting != "factored":
+            print("Streaming only applies to the factored setting.")
+            sys.exit()
+        if self.stream and not self.supports_streaming:
+            print(f"Model {self.model_id} does not support streaming.")
+            sys.exit()
+        self.stream_counts = Counter()
+
+        # List stages constrained to at most `max_list_items` items while decoding
+        self.constrained_lists = constrained_lists
+        if self.constrained_lists and not self.supports_constrained_lists:
+            print(f"Model {self.model_id} does not support constrained lists.")
+            sys.exit()
+        if self.constrained_lists and self.stream and self.structured_output:
+            print(f"Model {self.model_id} answers constrained lists with JSON, which cannot stream a plan.")
+            sys.exit()
+        # Constrained list responses by how they parsed, and lists cut at the item cap
+        self.list_counts = Counter()
+
+        # Per-stage call deadlines and hedged duplicates of slow calls
+        self.call_timeouts = dict(call_timeouts or {})
+        for stage, timeout in self.call_timeouts.items():
+            if stage not in STAGES:
+                print(f"Invalid stage {stage}. Valid stages are: {', '.join(STAGES)}")
+                sys.exit()
+            if timeout <= 0:
+                print(f"Invalid timeout {timeout} for stage {stage}, it must be positive.")
+                sys.exit()
+        if hedge_quantile is not None and not 0 < hedge_quantile < 1:
+            print(f"Invalid hedge quantile {hedge_quantile}, it must be between 0 and 1.")
+            sys.exit()
+        self.hedging = (
+            HedgingPolicy(self.call_timeouts, hedge_quantile)
+            if self.call_timeouts or hedge_quantile is not None
+            else None
+        )
+
+        # Adaptive concurrency: up to `max_in_flight` questions run at once and
+        # an AIMD limiter decides how many of their calls are in flight.
+        if adaptive_concurrency and max_in_flight < 1:
+            print(f"Invalid maximum in-flight calls {max_in_flight}, it must be positive.")
+            sys.exit()
+        self.limiter = AdaptiveConcurrencyLimiter(max_limit=max_in_flight) if adaptive_concurrency else None
+
+        # Static prompt prefixes cached provider-side, so calls send only the rest of the prompt
+        self.context_cache = context_cache
+        if self.context_cache and not self.supports_context_cache:
+            print(f"Model {self.model_id} does not support context caching.")
+            sys.exit()
+        if cache_ttl <= 0:
+            print(f"Invalid cache ttl {cache_ttl}, it must be positive.")
+            sys.exit()
+        self.cache_ttl = cache_ttl
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_counts = Counter()
+        self.context_caches: List[ContextCache] = []
+
+        # Factored runs can answer a verification question from the answer of
+        # a similar one asked before, in this run or one persisted to the path
+        self.semantic_cache = None
+        if semantic_cache:
+            if self.setting != "factored":
+                print("The semantic cache only applies to the factored setting.")
+                sys.exit()
+            if not 0 < semantic_threshold <= 1:
+                print(f"Invalid semantic threshold {semantic_threshold}, it must be in (0, 1].")
+                sys.exit()
+            if semantic_cache_size < 1:
+                print(f"Invalid semantic cache size {semantic_cache_size}, it must be positive.")
+                sys.exit()
+            # Imported here, numpy and the encoder are only loaded by runs that use the cache
+            from .semantic_cache import QuestionEmbedder, SemanticCache
+
+            try:
+                self.semantic_cache = SemanticCache(
+                    QuestionEmbedder(embedding_model or DEFAULT_EMBEDDING_MODEL),
+                    semantic_threshold,
+                    semantic_cache_size,
+                    semantic_cache_path,
+                    namespace=f"{self.task}|{self.stage_model('execute')}",
+                )
+            except ValueError as e:
+                print(f"Invalid semantic cache: {e}")
+                sys.exit()
+
+        # Factored runs can answer templated verification questions from a local fact store
+        self.fact_verifier = None
+        if fact_store:
+            if self.setting != "factored":
+                print("The fact store only applies to the factored setting.")
+                sys.exit()
+            if not os.path.exists(fact_store):
+                print(f"Fact store not found: {fact_store}")
+                print("   Create it with: python3 src/data/fact_store.py, or src/data/generate_wikidata.py")
+                sys.exit()
+            from ...data.fact_store import FactStore
+            from .fact_verifier import FactVerifier
 
-    def process_prompt(self, prompt, command) -> str:
+            self.fact_verifier = FactVerifier(FactStore(fact_store))
+
+    def call_llm(self, prompt: str, max_tokens: int, model_id: Optional[str] = None) -> str:
+        if self.backend is None:
+            raise NotImplementedError("Subclasses must implement this method or set a backend.")
+        completion = self.backend.complete(
+            self.api_model_name(model_id or self.model_id),
+            prompt,
+            max_tokens,
+            **self.sampling_params(),
+            **self.structured_output_params(),
+        )
+        self.report_usage(completion.prompt_tokens, completion.completion_tokens)
+        return completion.text
+
+    def stream_llm(
+        self, prompt: str, max_tokens: int, on_text: Callable[[str], None], model_id: Optional[str] = None
+    ) -> str:
+        """Like call_llm, also passing each chunk of text to `on_text` as it is generated."""
+        response = self.call_llm(prompt, max_tokens, model_id)
+        on_text(response)
+        return response
+
+    def set_backend(self, backend: LLMBackend):
+        """Use `backend` for call_llm, reporting its rate limits to the concurrency limiter."""
+        self.backend = backend
+        if self.limiter is not None:
+            backend.on_throttle = self.limiter.on_throttle
+
+    def limited_call(self, stage: str, call):
+        """Run `call` in a slot of the concurrency limiter, retrying it when rate limited."""
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            with self.limiter.slot() as saturated:
+                start = time.perf_counter()
+                try:
+                    response = call()
+                except RateLimitError as e:
+                    self.limiter.on_throttle()
+                    error = e
+                else:
+                    self.limiter.on_success(stage, time.perf_counter() - start, saturated)
+                    return response
+            # Waits outside the slot, so other calls can run at the lowered limit
+            delay = min(2 ** attempt, 30.0) * random.uniform(0.5, 1.0)
+            time.sleep(max(delay, error.retry_after or 0.0))
+        raise BackendError(f"Rate limited {RATE_LIMIT_RETRIES + 1} times: {error}")
+
+    def new_context_cache(self, provider) -> ContextCache:
+        """A context cache over `provider`, counted in the run's cache stats."""
+        cache = ContextCache(provider, self.cache_ttl, self.cache_min_tokens, counts=self.cache_counts)
+        self.context_caches.append(cache)
+        return cache
+
+    def split_cached_prompt(
+        self, cache: ContextCache, prompt: str, model_id: str
+    ) -> Tuple[Optional[CacheHandle], str]:
+        """The cached content of the prompt's static prefix and the rest of the prompt.
+
+        The prefix is the text before the first placeholder of the stage's
+        compiled prompt; without a usable cached content the whole prompt is
+        returned.
+        """
+        compiled = self.prompts.get(getattr(self._call_usage, "stage", None))
+        prefix = compiled.static_prefix if compiled is not None else ""
+        if not self.context_cache or not prefix or not prompt.startswith(prefix) or prompt == prefix:
+            return None, prompt
+        handle = cache.handle(MODEL_MAPPING[model_id].id, prefix, self.count_tokens(prefix, model_id))
+        if handle is None:
+            return None, prompt
+        return handle, prompt[len(prefix):]
+
+    def release_context_caches(self):
+        for cache in self.context_caches:
+            cache.close()
+
+    def concurrent_questions(self) -> int:
+        """Questions run at once; the limiter needs enough of them to probe its maximum."""
+        if self.limiter is not None:
+            return max(self.question_workers, self.limiter.max_limit)
+        return self.question_workers
+
+    def api_model_name(self, model_id: str) -> str:
+        """Name the backend knows the model by."""
+        return MODEL_MAPPING[model_id].id
+
+    def call_llm_with_logprobs(
+        self, prompt: str, max_tokens: int, model_id: Optional[str] = None
+    ) -> Tuple[str, float]:
+        """Return the response and the mean log-probability of its tokens."""
+        raise NotImplementedError("This backend does not expose token log-probabilities.")
+
+    def process_prompt(self, prompt, command, model_id: Optional[str] = None) -> str:
         raise NotImplementedError("Subclasses must implement this method.")
 
-    def generate_response(self, prompt: str, max_tokens: int, command) -> str:
-        processed_prompt = self.process_prompt(prompt, command)
-        return self.call_llm(processed_prompt, max_tokens)
+    def stage_model(self, stage: str) -> str:
+        return self.stage_models.get(stage, self.model_id)
+
+    def count_tokens(self, text: str, model_id: Optional[str] = None) -> int:
+        """Prompt tokens of `text`; backends with a local tokenizer count exactly."""
+        return estimate_tokens(text)
+
+    def prompt_budget(self, stage: str, max_tokens: int) -> int:
+        """Prompt tokens a stage may use: the context window left after its output."""
+        budget = MODEL_MAPPING[self.stage_model(stage)].context_window - max_tokens
+        return min(budget, self.prompt_budgets.get(stage, budget))
+
+    def report_usage(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0):
+        """Called by backends from call_llm with the token counts of the call.
+
+        `prompt_tokens` includes the `cached_tokens` read from a context cache.
+        """
+        self._call_usage.tokens = (prompt_tokens, completion_tokens)
+        self._call_usage.cached_tokens = cached_tokens
+
+    def call_timeout(self) -> Optional[float]:
+        """Deadline of the stage being called, for backends to pass to their transport."""
+        return self.call_timeouts.get(getattr(self._call_usage, "stage", None))
+
+    def invoke_llm(
+        self, stage: str, model_id: str, prompt: str, max_tokens: int, with_logprobs=False, on_text=None
+    ):
+        self._call_usage.tokens = (0, 0)
+        self._call_usage.cached_tokens = 0
+        self._call_usage.stage = stage
+        start = time.perf_counter()
+        if with_logprobs:
+            call = partial(self.call_llm_with_logprobs, prompt, max_tokens, model_id)
+        elif on_text is not None:
+            call = partial(self.stream_llm, prompt, max_tokens, on_text, model_id)
+        else:
+            call = partial(self.call_llm, prompt, max_tokens, model_id)
+        if self.limiter is not None:
+            call = partial(self.limited_call, stage, call)
+        # A streamed call is never duplicated or restarted, its chunks are already consumed
+        if self.hedging is None or on_text is not None:
+            response = call()
+        else:
+            def attempt():
+                # Runs in its own thread, so the usage it reports is passed back
+                self._call_usage.tokens = (0, 0)
+                self._call_usage.cached_tokens = 0
+                self._call_usage.stage = stage
+                return call(), self._call_usage.tokens, self._call_usage.cached_tokens
+
+            response, self._call_usage.tokens, self._call_usage.cached_tokens = self.hedging.call(stage, attempt)
+        max_items = self.list_item_cap(stage)
+        if max_items is not None and not with_logprobs:
+            response = self.constrained_list_response(response, max_items)
+        seconds = time.perf_counter() - start
+        self.usage.record(stage, model_id, *self._call_usage.tokens, seconds)
+        if self._call_usage.cached_tokens:
+            self.usage.record_cached(stage, model_id, self._call_usage.cached_tokens)
+        if self.recorder is not None:
+            self.recorder.record(
+                stage, model_id, prompt, max_tokens, self.sampling_params(), with_logprobs,
+                response, *self._call_usage.tokens, seconds,
+            )
+        return response
+
+    def sampling_params(self) -> Dict[str, float]:
+        """Sampling parameters that, with the prompt, determine a call's output."""
+        return {}
+
+    def response_schema(self) -> Optional[Dict]:
+        """JSON schema the response of the stage being called must follow, if any."""
+        stage = getattr(self._call_usage, "stage", None)
+        if stage == "fused":
+            return FUSED_RESPONSE_SCHEMA
+        if self.structured_output and self.list_item_cap(stage) is not None:
+            return LIST_RESPONSE_SCHEMA
+        return None
+
+    def list_item_cap(self, stage: Optional[str] = None) -> Optional[int]:
+        """Most items of a constrained list stage, None for stages that are not constrained."""
+        stage = stage or getattr(self._call_usage, "stage", None)
+        if self.constrained_lists and stage in self.task_config.list_stages:
+            return self.task_config.max_list_items
+        return None
+
+    def constrained_list_response(self, response: str, max_items: int) -> str:
+        """A constrained list response as a numbered list of at most `max_items` items.
+
+        Structured output backends answer with JSON, parsed here; decoding
+        constraints already produce the numbered list.
+        """
+        if self.structured_output:
+            items, status = parse_list_response(response)
+        else:
+            items, status = [item for item in get_items_from_answer(response.strip()) if item.strip()], "decoded"
+        with self._path_lock:
+            self.list_counts[status] += 1
+            self.list_counts["capped"] += len(items) >= max_items
+        return "\n".join(f"{i + 1}. {item}" for i, item in enumerate(items[:max_items]))
+
+    def structured_output_params(self) -> Dict:
+        """Backend parameters constraining the response to `response_schema`.
+
+        None by default: the prompt asks for the format and the response is
+        parsed leniently. Backends with structured outputs override it.
+        """
+        return {}
+
+    def generate_response(
+        self, prompt: str, max_tokens: int, command, stage: str = "baseline"
+    ) -> str:
+        """Generate from an already formatted task prompt, wrapped by process_prompt."""
+        model_id = self.stage_model(stage)
+        processed_prompt = self.process_prompt(prompt, command, model_id)
+        return self.generate_processed(processed_prompt, max_tokens, stage, model_id)
+
+    def generate_stage_response(
+        self, stage: str, max_tokens: int, on_text: Optional[Callable[[str], None]] = None, **values
+    ) -> str:
+        """Render the stage's compiled prompt within its token budget and generate from it.
+
+        With `on_text`, the response is streamed to it as it is generated.
+        """
+        model_id = self.stage_model(stage)
+        processed_prompt, _, trimmed_tokens = self.prompts[stage].render_within_budget(
+            self.prompt_budget(stage, max_tokens),
+            lambda text: self.count_tokens(text, model_id),
+            **values,
+        )
+        if trimmed_tokens:
+            self.usage.record_trim(stage, model_id, trimmed_tokens)
+        return self.generate_processed(processed_prompt, max_tokens, stage, model_id, on_text)
+
+    def generate_processed(
+        self, processed_prompt: str, max_tokens: int, stage: str, model_id: str, on_text=None
+    ) -> str:
+        # A streamed call is never shared: only its caller would see the chunks
+        if self.coalescer is None or on_text is not None:
+            return self.invoke_llm(stage, model_id, processed_prompt, max_tokens, on_text=on_text)
+
+        key = (
+            model_id,
+            processed_prompt,
+            max_tokens,
+            tuple(sorted(self.sampling_params().items())),
+        )
+        return self.coalescer.call(
+            key, lambda: self.invoke_llm(stage, model_id, processed_prompt, max_tokens)
+        )
 
     def get_baseline_response(self, question: str) -> str:
-        baseline_prompt = self.task_config.baseline_prompt.format(
-            original_question=question
+        return self.generate_stage_response(
+            "baseline", self.task_config.max_tokens, original_question=question
         )
-        return self.generate_response(
-            prompt=baseline_prompt,
-            max_tokens=self.task_config.max_tokens,
-            command=self.task_config.baseline_command,
+
+    def format_answer(self, items: List[str]) -> str:
+        """Answer items in the format of the task's baseline responses."""
+        if self.task == "multispanqa":
+            return ", ".join(items)
+        return "\n".join(f"{i + 1}. {item}" for i, item in enumerate(items))
+
+    def answer_set(self, response: str) -> frozenset:
+        if self.task == "multispanqa":
+            return frozenset(response.lower().split())
+        return frozenset(
+            item.strip().lower() for item in get_items_from_answer(response) if item.strip()
         )
 
+    def get_scored_baseline_response(self, question: str) -> Tuple[str, float]:
+        """Baseline response with a confidence score in [0, 1].
+
+        `logprob` uses the mean token probability of the baseline itself, at no
+        extra cost. `self_consistency` samples the baseline prompt again and
+        averages the Jaccard overlap of the answers with the baseline.
+        """
+        model_id = self.stage_model("baseline")
+        processed_prompt = self.prompts["baseline"].render(original_question=question)
+        max_tokens = self.task_config.max_tokens
+        if self.confidence_method == "logprob":
+            baseline_response, mean_logprob = self.invoke_llm(
+                "baseline", model_id, processed_prompt, max_tokens, with_logprobs=True
+            )
+            return baseline_response, math.exp(mean_logprob)
+
+        baseline_response = self.invoke_llm("baseline", model_id, processed_prompt, max_tokens)
+        baseline_answers = self.answer_set(baseline_response)
+        overlaps = []
+        for _ in range(self.consistency_samples):
+            # Bypass the coalescer, the samples must be independent calls.
+            sample_answers = self.answer_set(
+                self.invoke_llm("baseline", model_id, processed_prompt, max_tokens)
+            )
+            union = baseline_answers | sample_answers
+            overlaps.append(len(baseline_answers & sample_answers) / len(union) if union else 1.0)
+        return baseline_response, sum(overlaps) / len(overlaps) if overlaps else 1.0
+
     def run_two_step_chain(self, question: str, baseline_response: str):
         # Create Plan
-        plan_prompt = self.task_config.two_step.plan_prompt.format(
+        plan_response = self.generate_stage_response(
+            "plan",
+            self.task_config.two_step.max_tokens_plan,
             original_question=question,
             baseline_response=baseline_response,
         )
 
-        plan_response = self.generate_response(
-            prompt=plan_prompt,
-            max_tokens=self.task_config.two_step.max_tokens_plan,
-            command=self.task_config.two_step.plan_command,
-        )
-
         ## Execute Plan
-        execute_prompt = self.task_config.two_step.execute_prompt.format(
-            verification_questions=plan_response
-        )
-
-        execute_response = self.generate_response(
-            prompt=execute_prompt,
-            max_tokens=self.task_config.two_step.max_tokens_execute,
-            command=self.task_config.two_step.execute_command,
+        execute_response = self.generate_stage_response(
+            "execute",
+            self.task_config.two_step.max_tokens_execute,
+            verification_questions=plan_response,
         )
 
         ## Verify
-        verify_prompt = self.task_config.two_step.verify_prompt.format(
+        verify_response = self.generate_stage_response(
+            "verify",
+            self.task_config.two_step.max_tokens_verify,
             original_question=question,
             baseline_response=baseline_response,
             verification_questions=plan_response,
             verification_answers=execute_response,
         )
 
-        verify_response = self.generate_response(
-            prompt=verify_prompt,
-            max_tokens=self.task_config.two_step.max_tokens_verify,
-            command=self.task_config.two_step.verify_command,
-        )
-
         return (
             plan_response,
             execute_response,
@@ -103,59 +628,112 @@ class ChainOfVerification:
 
     def run_joint_chain(self, question: str, baseline_response: str):
         ## Create and Execute Plan
-        plan_and_execution_prompt = (
-            self.task_config.joint.plan_and_execute_prompt.format(
-                original_question=question,
-                baseline_response=baseline_response,
-            )
-        )
-
-        plan_and_execution_response = self.generate_response(
-            prompt=plan_and_execution_prompt,
-            max_tokens=self.task_config.joint.max_tokens_plan_and_execute,
-            command=self.task_config.joint.plan_and_execute_command,
+        plan_and_execution_response = self.generate_stage_response(
+            "plan_and_execute",
+            self.task_config.joint.max_tokens_plan_and_execute,
+            original_question=question,
+            baseline_response=baseline_response,
         )
 
         ## Verify
-        verify_prompt = self.task_config.joint.verify_prompt.format(
+        verify_response = self.generate_stage_response(
+            "verify",
+            self.task_config.joint.max_tokens_verify,
             original_question=question,
             baseline_response=baseline_response,
             verification_questions_and_answers=plan_and_execution_response,
         )
 
-        verify_response = self.generate_response(
-            prompt=verify_prompt,
-            max_tokens=self.task_config.joint.max_tokens_verify,
-            command=self.task_config.joint.verify_command,
-        )
-
         return plan_and_execution_response, verify_response
 
-    def run_factored_chain(self, question: str, baseline_response: str):
-        ## Create Plan
-        plan_prompt = self.task_config.factored.plan_prompt.format(
-            original_question=question,
-            baseline_response=baseline_response,
-        )
-        plan_response = self.generate_response(
-            prompt=plan_prompt,
-            max_tokens=self.task_config.factored.max_tokens_plan,
-            command=self.task_config.factored.plan_command,
+    def execute_verification_question(self, planned_question: str) -> str:
+        start = time.perf_counter()
+        if self.fact_verifier is not None:
+            answer = self.fact_verifier.answer(planned_question)
+            if answer is not None:
+                self.record_lookup("fact_store", planned_question, answer, start)
+                return answer
+        if self.semantic_cache is not None:
+            answer, vector = self.semantic_cache.lookup(planned_question)
+            if answer is not None:
+                self.record_lookup("semantic_cache", planned_question, answer, start)
+                return answer
+        start = time.perf_counter()
+        answer = self.generate_stage_response(
+            "execute",
+            self.task_config.factored.max_tokens_execute,
+            verification_question=planned_question,
         )
+        if self.semantic_cache is not None:
+            self.semantic_cache.store(vector, planned_question, answer, time.perf_counter() - start)
+        return answer
 
-        ## Execute Plan
-        planned_questions = get_items_from_answer(plan_response)
-        execute_responses = []
-        for planned_question in planned_questions:
-            execute_prompt = self.task_config.factored.execute_prompt.format(
-                verification_question=planned_question
+    def record_lookup(self, source: str, question: str, answer: str, start: float):
+        if self.recorder is not None:
+            self.recorder.record_lookup(source, question, answer, time.perf_counter() - start)
+
+    def run_streamed_plan(self, question: str, baseline_response: str) -> Tuple[str, List[str]]:
+        """Plan and execute, executing each verification question as soon as its line is streamed.
+
+        Questions are dispatched speculatively from the stream and matched
+        against the final plan afterwards: a question the final plan does not
+        contain is cancelled or discarded, one the stream missed is executed then.
+        """
+        parser = IncrementalListParser()
+        dispatched = {}
+        executor = ThreadPoolExecutor(max_workers=self.concurrent_questions())
+        try:
+            def on_text(text: str):
+                for planned_question in parser.feed(text):
+                    future = executor.submit(self.execute_verification_question, planned_question)
+                    dispatched.setdefault(planned_question, []).append(future)
+
+            plan_response = self.generate_stage_response(
+                "plan",
+                self.task_config.factored.max_tokens_plan,
+                on_text=on_text,
+                original_question=question,
+                baseline_response=baseline_response,
             )
-            execute_response = self.generate_response(
-                prompt=execute_prompt,
-                max_tokens=self.task_config.factored.max_tokens_execute,
-                command=self.task_config.factored.execute_command,
+            futures = []
+            early = 0
+            for planned_question in get_items_from_answer(plan_response):
+                if dispatched.get(planned_question):
+                    futures.append(dispatched[planned_question].pop(0))
+                    early += 1
+                else:
+                    futures.append(executor.submit(self.execute_verification_question, planned_question))
+            discarded = [future for pending in dispatched.values() for future in pending]
+            for future in discarded:
+                future.cancel()
+            execute_responses = [future.result() for future in futures]
+        finally:
+            # Discarded questions already running are left to finish on their own
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        with self._path_lock:
+            self.stream_counts["early"] += early
+            self.stream_counts["total"] += len(futures)
+            self.stream_counts["discarded"] += len(discarded)
+        return plan_response, execute_responses
+
+    def run_factored_chain(self, question: str, baseline_response: str):
+        if self.stream:
+            plan_response, execute_responses = self.run_streamed_plan(question, baseline_response)
+        else:
+            ## Create Plan
+            plan_response = self.generate_stage_response(
+                "plan",
+                self.task_config.factored.max_tokens_plan,
+                original_question=question,
+                baseline_response=baseline_response,
             )
-            execute_responses.append(execute_response)
+
+            ## Execute Plan
+            planned_questions = get_items_from_answer(plan_response)
+            execute_responses = []
+            for planned_question in planned_questions:
+                execute_responses.append(self.execute_verification_question(planned_question))
         execute_response = "\n".join(
             [
                 f"{i+1}. {execute_response}"
@@ -164,17 +742,14 @@ class ChainOfVerification:
         )
 
         ## Verify
-        verify_prompt = self.task_config.factored.verify_prompt.format(
+        verify_response = self.generate_stage_response(
+            "verify",
+            self.task_config.factored.max_tokens_verify,
             original_question=question,
             baseline_response=baseline_response,
             verification_questions=plan_response,
             verification_answers=execute_response,
         )
-        verify_response = self.generate_response(
-            prompt=verify_prompt,
-            max_tokens=self.task_config.factored.max_tokens_verify,
-            command=self.task_config.factored.verify_command,
-        )
 
         return (
             plan_response,
@@ -182,62 +757,195 @@ class ChainOfVerification:
             verify_response,
         )
 
+    def run_fused_chain(self, question: str):
+        """Baseline, verification and refined answer from a single structured response."""
+        fused_response = self.generate_stage_response(
+            "fused", self.task_config.fused.max_tokens_fused, original_question=question
+        )
+        baseline, verification, verified, status = parse_fused_response(fused_response)
+        with self._path_lock:
+            self.fused_counts[status] += 1
+        plan_and_execution = "\n".join(
+            f"{i + 1}. {planned_question} {answer}" for i, (planned_question, answer) in enumerate(verification)
+        )
+        return self.format_answer(baseline), plan_and_execution, self.format_answer(verified), status
+
     def print_result(self, result: Dict[str, str]):
         for key, value in result.items():
             print(f"{key}: {value}")
             print("----------------------\n")
         print("=========================================\n")
 
-    def run_chain(self):
-        all_results = []
-        for question in self.questions:
+    def run_question(self, index: int, question: str) -> Dict[str, str]:
+        if self.setting == "fused":
+            baseline_response, plan_and_execution, final_verified, status = self.run_fused_chain(question)
+            return {
+                "Index": index,
+                "Question": question,
+                "Baseline Answer": baseline_response,
+                "Plan and Execution": plan_and_execution,
+                "Final Refined Answer": final_verified,
+                "Response Format": status,
+            }
+        if self.confidence_method is None:
             baseline_response = self.get_baseline_response(question)
-            if self.setting == "two_step":
-                (
-                    plan_verification_tokens,
-                    execute_verification_tokens,
-                    final_verified_tokens,
-                ) = self.run_two_step_chain(question, baseline_response)
-                result = {
-                    "Question": question,
-                    "Baseline Answer": baseline_response,
-                    "Verification Questions": plan_verification_tokens,
-                    "Execute Plan": execute_verification_tokens,
-                    "Final Refined Answer": final_verified_tokens,
-                }
-                self.print_result(result)
-                all_results.append(result)
-            elif self.setting == "joint":
-                (
-                    plan_and_execution_tokens,
-                    final_verified_tokens,
-                ) = self.run_joint_chain(question, baseline_response)
-                result = {
-                    "Question": question,
-                    "Baseline Answer": baseline_response,
-                    "Plan and Execution": plan_and_execution_tokens,
-                    "Final Refined Answer": final_verified_tokens,
-                }
-                self.print_result(result)
-                all_results.append(result)
-            elif self.setting == "factored":
-                (
-                    plan_verification_tokens,
-                    execute_verification_tokens,
-                    final_verified_tokens,
-                ) = self.run_factored_chain(question, baseline_response)
-                result = {
-                    "Question": question,
-                    "Baseline Answer": baseline_response,
-                    "Verification Questions": plan_verification_tokens,
-                    "Execute Plan": execute_verification_tokens,
-                    "Final Refined Answer": final_verified_tokens,
-                }
+            return self.run_verification(index, question, baseline_response)
+
+        baseline_response, confidence = self.get_scored_baseline_response(question)
+        if self.confidence_threshold is not None and confidence >= self.confidence_threshold:
+            path = "early_exit"
+            result = {"Index": index, "Question": question, "Baseline Answer": baseline_response}
+            result.update({key: "" for key in INTERMEDIATE_RESULT_KEYS[self.setting]})
+            result["Final Refined Answer"] = baseline_response
+        else:
+            path = "verified"
+            result = self.run_verification(index, question, baseline_response)
+        with self._path_lock:
+            self.path_counts[path] += 1
+        result["Baseline Confidence"] = round(confidence, 4)
+        result["Path"] = path
+        return result
+
+    def run_verification(
+        self, index: int, question: str, baseline_response: str
+    ) -> Dict[str, str]:
+        if self.setting == "two_step":
+            (
+                plan_verification_tokens,
+                execute_verification_tokens,
+                final_verified_tokens,
+            ) = self.run_two_step_chain(question, baseline_response)
+            result = {
+                "Index": index,
+                "Question": question,
+                "Baseline Answer": baseline_response,
+                "Verification Questions": plan_verification_tokens,
+                "Execute Plan": execute_verification_tokens,
+                "Final Refined Answer": final_verified_tokens,
+            }
+        elif self.setting == "joint":
+            (
+                plan_and_execution_tokens,
+                final_verified_tokens,
+            ) = self.run_joint_chain(question, baseline_response)
+            result = {
+                "Index": index,
+                "Question": question,
+                "Baseline Answer": baseline_response,
+                "Plan and Execution": plan_and_execution_tokens,
+                "Final Refined Answer": final_verified_tokens,
+            }
+        elif self.setting == "factored":
+            (
+                plan_verification_tokens,
+                execute_verification_tokens,
+                final_verified_tokens,
+            ) = self.run_factored_chain(question, baseline_response)
+            result = {
+                "Index": index,
+                "Question": question,
+                "Baseline Answer": baseline_response,
+                "Verification Questions": plan_verification_tokens,
+                "Execute Plan": execute_verification_tokens,
+                "Final Refined Answer": final_verified_tokens,
+            }
+        return result
+
+    def print_stats(self):
+        print(f"💰 Usage by stage:\n{self.usage.report()}")
+        if self.coalescer is not None:
+            print(f"♻️ Prompt deduplication: {self.coalescer.summary()}")
+        if self.confidence_threshold is not None:
+            total = sum(self.path_counts.values())
+            print(
+                f"⏩ Early exit: {self.path_counts['early_exit']}/{total} questions skipped verification "
+                f"(confidence >= {self.confidence_threshold}, method: {self.confidence_method})"
+            )
+        if self.setting == "fused":
+            total = sum(self.fused_counts.values())
+            print(
+                f"🧩 Fused responses: {self.fused_counts['json']}/{total} valid JSON, "
+                f"{self.fused_counts['repaired']} repaired, {self.fused_counts['failed']} unparseable"
+            )
+        if self.constrained_lists:
+            counts = self.list_counts
+            total = sum(counts.values()) - counts["capped"]
+            parsed = (
+                f"{counts['json']} valid JSON, {counts['repaired']} repaired, {counts['failed']} unparseable"
+                if self.structured_output
+                else "all decoded as numbered lists"
+            )
+            print(
+                f"📋 Constrained lists: {total} responses, {parsed}; "
+                f"{counts['capped']} reached the {self.task_config.max_list_items} item cap"
+            )
+        if self.limiter is not None:
+            print(f"🎚️ Adaptive concurrency: {self.limiter.summary()}")
+        if self.hedging is not None:
+            print(f"🛡️ Deadlines and hedging:\n{self.hedging.summary()}")
+        if self.fact_verifier is not None:
+            print(f"📚 Fact store: {self.fact_verifier.summary()}")
+        if self.semantic_cache is not None:
+            print(f"🧠 Semantic cache: {self.semantic_cache.summary()}")
+        if self.context_cache:
+            rows = self.usage.rows()
+            prompt_tokens = sum(row["prompt_tokens"] for row in rows)
+            cached_tokens = sum(row["cached_tokens"] for row in rows)
+            counts = self.cache_counts
+            print(
+                f"🗃️ Context cache: {cached_tokens} of {prompt_tokens} input tokens cached, "
+                f"{prompt_tokens - cached_tokens} uncached; {counts['hits']} calls used a cached prefix, "
+                f"{counts['short']} had a prefix under {self.cache_min_tokens} tokens; "
+                f"{counts['created']} caches created, {counts['refreshed']} refreshed, {counts['expired']} expired"
+            )
+        if self.stream:
+            print(
+                f"🌊 Streamed plans: {self.stream_counts['early']}/{self.stream_counts['total']} verification "
+                f"questions started before their plan finished, {self.stream_counts['discarded']} discarded"
+            )
+
+    def save_results(self, all_results):
+        os.makedirs(os.path.dirname(self.result_file_path), exist_ok=True)
+        with open(self.result_file_path, "w", encoding="utf-8") as json_file:
+            json.dump(all_results, json_file, indent=2, ensure_ascii=False)
+        if self.semantic_cache is not None:
+            self.semantic_cache.save()
+        # Usage lives next to the results so routed runs keep the same result schema
+        with open(self.usage_file_path, "w", encoding="utf-8") as json_file:
+            json.dump(
+                {"stage_models": self.stage_models, "usage": self.usage.rows()},
+                json_file,
+                indent=2,
+            )
+
+    def run_questions(self) -> List[Dict[str, str]]:
+        """Results of all questions in order, `question_workers` questions at a time."""
+        if self.concurrent_questions() == 1:
+            all_results = []
+            for index, question in zip(self.question_indices, self.questions):
+                result = self.run_question(index, question)
                 self.print_result(result)
                 all_results.append(result)
+            return all_results
 
-        result_file_path = (
-            f"./result/{self.model_id}_{self.task}_{self.setting}_results.json"
-        )
-        with open(result_file_path, "w", encoding="utf-8") as json_file:
-            json.dump(all_results, json_file, indent=2, ensure_ascii=False)
+        with ThreadPoolExecutor(max_workers=self.concurrent_questions()) as executor:
+            all_results = list(
+                executor.map(self.run_question, self.question_indices, self.questions)
+            )
+        for result in all_results:
+            self.print_result(result)
+        return all_results
+
+    def close(self):
+        """Release what a run holds open: cached contents, billed while they live, and the recording."""
+        self.release_context_caches()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def run_chain(self):
+        try:
+            all_results = self.run_questions()
+            self.save_results(all_results)
+            self.print_stats()
+        finally:
+            self.close()
@@ -1,133 +1,264 @@
 import os
+import copy
+import datetime
 import json
 import time
 import sys
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional, TypeVar
 import google.generativeai as genai
+from .backends import RateLimitError
+from .checkpoint import CheckpointMixin
+from .context_cache import CacheNotFoundError
 from .cove_chains import ChainOfVerification
-from ...utils import get_absolute_path
+from .key_pool import KeyPool
+from ...utils import MODEL_MAPPING, get_absolute_path
 
+T = TypeVar("T")
+
+
+class StreamInterruptedError(Exception):
+    """A streamed response failed after part of it was passed on."""
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    error_msg = str(e).lower()
+    return "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg
+
+
+def is_cache_not_found_error(e: Exception) -> bool:
+    error_msg = str(e).lower()
+    return "cachedcontent" in error_msg.replace(" ", "") and (
+        "not found" in error_msg or "404" in error_msg or "403" in error_msg
+    )
+
+
+class GeminiCacheProvider:
+    """Cached contents of one API key, which only that key's project can read."""
+
+    def __init__(self, api_key: str):
+        from google.ai import generativelanguage as glm
+
+        self.glm = glm
+        self.client = glm.CacheServiceClient(client_options={"api_key": api_key})
+
+    def create(self, model: str, prefix: str, ttl: float) -> str:
+        cached_content = self.glm.CachedContent(
+            model=f"models/{model}",
+            contents=[self.glm.Content(role="user", parts=[self.glm.Part(text=prefix)])],
+            ttl=datetime.timedelta(seconds=ttl),
+        )
+        return self.client.create_cached_content(cached_content=cached_content).name
+
+    def refresh(self, name: str, ttl: float):
+        from google.protobuf import field_mask_pb2
+
+        try:
+            self.client.update_cached_content(
+                cached_content=self.glm.CachedContent(name=name, ttl=datetime.timedelta(seconds=ttl)),
+                update_mask=field_mask_pb2.FieldMask(paths=["ttl"]),
+            )
+        except Exception as e:
+            if is_cache_not_found_error(e):
+                raise CacheNotFoundError(str(e)) from e
+            raise
+
+    def delete(self, name: str):
+        self.client.delete_cached_content(name=name)
+
+
+class ChainOfVerificationGoogle(CheckpointMixin, ChainOfVerification):
+    supports_streaming = True
+    supports_context_cache = True
+    supports_constrained_lists = True
+    structured_output = True
 
-class ChainOfVerificationGoogle(ChainOfVerification):
     def __init__(
-        self, model_id, temperature, task, setting, questions, google_access_token
+        self,
+        model_id,
+        temperature,
+        task,
+        setting,
+        questions,
+        google_access_token,
+        google_access_tokens=None,
+        **kwargs,
     ):
-        super().__init__(model_id, task, setting, questions)
+        super().__init__(model_id, task, setting, questions, **kwargs)
         self.google_access_token = google_access_token
         self.temperature = temperature
         
         # Configure Google AI
-        genai.configure(api_key=google_access_token)
-        self.model = genai.GenerativeModel(self.model_config.id)
+        api_keys = list(google_access_tokens or [google_access_token])
+        genai.configure(api_key=api_keys[0])
         
-        # Rate limiting: 15 requests per minute = 4 seconds between requests
-        self.min_request_interval = 4.0
-        self.last_request_time = 0
+        # Rate limiting: 15 requests per minute = 4 seconds between requests, per key.
+        # With adaptive concurrency the limiter finds the rate the quota allows instead.
+        self.min_request_interval = 0.0 if self.limiter is not None else 4.0
+        # Requests go to whichever key can send soonest; a throttled key sits out a cooldown
+        self.key_pool = KeyPool(api_keys, self.min_request_interval)
+        self.key_models = {key.label: self.make_models(key.api_key) for key in self.key_pool.keys}
+        # Static prompt prefixes are cached once per key, model and stage
+        self.key_caches = {}
+        if self.context_cache:
+            if not hasattr(genai.GenerativeModel(self.model_config.id), "_cached_content"):
+                print("Context caching needs google-generativeai >= 0.7, upgrade it or run without it.")
+                sys.exit()
+            self.key_caches = {
+                key.label: self.new_context_cache(GeminiCacheProvider(key.api_key)) for key in self.key_pool.keys
+            }
         
         # Checkpoint setup - use current working directory
-        self.checkpoint_dir = os.path.join(os.getcwd(), "checkpoints")
-        os.makedirs(self.checkpoint_dir, exist_ok=True)
-        self.checkpoint_file = os.path.join(
-            self.checkpoint_dir,
-            f"{self.model_id}_{self.task}_{self.setting}_checkpoint.json"
-        )
-        
-        # Load checkpoint if exists
-        self.checkpoint_data = self.load_checkpoint()
-        self.start_question_index = self.checkpoint_data.get("last_completed_index", -1) + 1
+        self.init_checkpoint()
         
         if self.start_question_index > 0:
             print(f"🔄 Resuming from question {self.start_question_index + 1}/{len(questions)}")
             print(f"   Checkpoint: {self.checkpoint_file}")
         else:
             print(f"🆕 Starting fresh experiment with {len(questions)} questions")
+        if len(self.key_pool.keys) > 1:
+            print(f"🔑 Pooling {len(self.key_pool.keys)} API keys")
+
+    def make_models(self, api_key: str) -> Dict[str, Any]:
+        """A GenerativeModel per routed model, bound to its own client for `api_key`."""
+        from google.ai import generativelanguage as glm
 
-    def load_checkpoint(self) -> Dict[str, Any]:
-        """Load checkpoint data if exists."""
-        if os.path.exists(self.checkpoint_file):
+        client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+        models = {}
+        for routed_model_id in self.routed_model_ids:
+            model = genai.GenerativeModel(MODEL_MAPPING[routed_model_id].id)
+            # genai.configure is process-wide, so each key's models get their own client
+            model._client = client
+            models[routed_model_id] = model
+        return models
+
+    def call_with_key(self, request: Callable[[str], T]) -> T:
+        """Run `request` with the label of the pooled key that can send soonest.
+
+        A rate limited request is retried on the next available key; only when
+        every key keeps being throttled is the error handled as before. With
+        adaptive concurrency the throttle is left to `limited_call`, which
+        lowers the limit once and retries, by then on another key.
+        """
+        while True:
+            key = self.key_pool.acquire()
             try:
-                with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                result = request(key.label)
             except Exception as e:
-                print(f"⚠️ Error loading checkpoint: {e}")
-                return {}
-        return {}
+                if isinstance(e, StreamInterruptedError) or not is_rate_limit_error(e):
+                    self.handle_api_error(e)
+                self.key_pool.report_throttle(key)
+                if self.limiter is not None or self.key_pool.exhausted:
+                    self.handle_api_error(e)
+                continue
+            self.key_pool.report_success(key)
+            return result
 
-    def save_checkpoint(self, question_index: int, results: List[Dict[str, str]]):
-        """Save current progress to checkpoint file."""
-        try:
-            checkpoint_data = {
-                "model_id": self.model_id,
-                "task": self.task,
-                "setting": self.setting,
-                "last_completed_index": question_index,
-                "total_questions": len(self.questions),
-                "completed_results": results,
-                "timestamp": time.time()
-            }
-            with open(self.checkpoint_file, 'w', encoding='utf-8') as f:
-                json.dump(checkpoint_data, f, indent=2, ensure_ascii=False)
-            print(f"✅ Checkpoint saved ({question_index + 1}/{len(self.questions)} completed)")
-        except Exception as e:
-            print(f"⚠️ Error saving checkpoint: {e}")
+    def call_llm(self, prompt: str, max_tokens: int, model_id: Optional[str] = None) -> str:
+        """Call Google Gemini API with rate limiting and error handling."""
+        response = self.call_with_key(
+            lambda key_label: self.generate(key_label, prompt, max_tokens, model_id or self.model_id)
+        )
+        self.report_response_usage(response)
 
-    def cleanup_checkpoint(self):
-        """Remove checkpoint file after successful completion."""
+        # Extract text from response
+        if response.candidates and response.candidates[0].content.parts:
+            return response.candidates[0].content.parts[0].text.strip()
+        else:
+            return "No response generated"
+
+    def stream_llm(
+        self, prompt: str, max_tokens: int, on_text: Callable[[str], None], model_id: Optional[str] = None
+    ) -> str:
+        """Call Gemini with a streamed response, passing each chunk to `on_text`."""
+        def request(key_label):
+            response = self.generate(key_label, prompt, max_tokens, model_id or self.model_id, stream=True)
+            chunks = []
+            try:
+                for chunk in response:
+                    if chunk.candidates and chunk.candidates[0].content.parts:
+                        text = chunk.candidates[0].content.parts[0].text
+                        chunks.append(text)
+                        on_text(text)
+            except Exception as e:
+                if chunks:
+                    # Text was already passed on, the request cannot be retried on another key
+                    raise StreamInterruptedError(f"Stream interrupted: {e}") from e
+                raise
+            return response, chunks
+
+        response, chunks = self.call_with_key(request)
+        # Usage is known once the stream is consumed
+        self.report_response_usage(response)
+        return "".join(chunks).strip() or "No response generated"
+
+    def generate(self, key_label: str, prompt: str, max_tokens: int, model_id: str, **kwargs):
+        """generate_content with the key's model, sending the static prefix as a cached content."""
+        model = self.key_models[key_label][model_id]
+        options = dict(
+            generation_config=self.generation_config(max_tokens),
+            request_options=self.request_options(),
+            **kwargs,
+        )
+        cache = self.key_caches.get(key_label)
+        handle, contents = self.split_cached_prompt(cache, prompt, model_id) if cache else (None, prompt)
+        if handle is None:
+            return model.generate_content(prompt, **options)
+        cached_model = copy.copy(model)
+        cached_model._cached_content = handle.name
         try:
-            if os.path.exists(self.checkpoint_file):
-                os.remove(self.checkpoint_file)
-                print("🧹 Checkpoint cleaned up")
+            return cached_model.generate_content(contents, **options)
         except Exception as e:
-            print(f"⚠️ Error cleaning up checkpoint: {e}")
+            if not is_cache_not_found_error(e):
+                raise
+            # Dropped provider-side before its ttl: sent in full, cached again by the next call
+            cache.invalidate(handle)
+            return model.generate_content(prompt, **options)
 
-    def enforce_rate_limit(self):
-        """Ensure we don't exceed 15 requests per minute."""
-        current_time = time.time()
-        time_since_last_request = current_time - self.last_request_time
-        
-        if time_since_last_request < self.min_request_interval:
-            sleep_time = self.min_request_interval - time_since_last_request
-            print(f"⏱️ Rate limiting: waiting {sleep_time:.1f}s...")
-            time.sleep(sleep_time)
-        
-        self.last_request_time = time.time()
+    def generation_config(self, max_tokens: int):
+        schema = self.response_schema()
+        # Controlled generation (google-generativeai >= 0.6): the response is JSON of the schema
+        structured = dict(response_mime_type="application/json", response_schema=schema) if schema else {}
+        return genai.types.GenerationConfig(
+            temperature=self.temperature,
+            max_output_tokens=max_tokens,
+            **structured,
+        )
 
-    def call_llm(self, prompt: str, max_tokens: int) -> str:
-        """Call Google Gemini API with rate limiting and error handling."""
-        self.enforce_rate_limit()
-        
-        try:
-            # Configure generation parameters
-            generation_config = genai.types.GenerationConfig(
-                temperature=self.temperature,
-                max_output_tokens=max_tokens,
-            )
-            
-            # Generate response
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config,
+    def request_options(self) -> Optional[Dict[str, float]]:
+        # The stage deadline also bounds the HTTP request, so an abandoned call ends
+        timeout = self.call_timeout()
+        return {"timeout": timeout} if timeout is not None else None
+
+    def report_response_usage(self, response):
+        usage_metadata = getattr(response, "usage_metadata", None)
+        if usage_metadata is not None:
+            self.report_usage(
+                usage_metadata.prompt_token_count or 0,
+                usage_metadata.candidates_token_count or 0,
+                getattr(usage_metadata, "cached_content_token_count", 0) or 0,
             )
-            
-            # Extract text from response
-            if response.candidates and response.candidates[0].content.parts:
-                return response.candidates[0].content.parts[0].text.strip()
-            else:
-                return "No response generated"
-                
-        except Exception as e:
-            error_msg = str(e).lower()
-            if "quota" in error_msg or "rate limit" in error_msg or "429" in error_msg:
-                print(f"\n❌ API quota exceeded: {e}")
-                print(f"💾 Progress saved to checkpoint: {self.checkpoint_file}")
-                print(f"⏰ Please wait and retry with the same command later")
-                print(f"   The experiment will automatically resume from where it left off")
-                sys.exit(1)
-            else:
-                print(f"⚠️ API Error: {e}")
-                raise e
 
-    def process_prompt(self, prompt: str, command: str) -> str:
+    def handle_api_error(self, e: Exception):
+        """Exit with the checkpoint kept on quota errors, re-raise anything else."""
+        is_rate_limited = is_rate_limit_error(e)
+        if is_rate_limited and self.limiter is not None:
+            # The limiter backs off and retries the call
+            raise RateLimitError(str(e))
+        if is_rate_limited:
+            print(f"\n❌ API quota exceeded: {e}")
+            print(f"💾 Progress saved to checkpoint: {self.checkpoint_file}")
+            print(f"⏰ Please wait and retry with the same command later")
+            print(f"   The experiment will automatically resume from where it left off")
+            sys.exit(1)
+        else:
+            print(f"⚠️ API Error: {e}")
+            raise e
+
+    def sampling_params(self) -> Dict[str, float]:
+        return {"temperature": self.temperature}
+
+    def process_prompt(self, prompt: str, command: str, model_id: Optional[str] = None) -> str:
         """Process prompt for Google Gemini (no special formatting needed)."""
         return prompt
 
@@ -140,14 +271,30 @@ class ChainOfVerificationGoogle(ChainOfVerification):
         api_calls_per_question = {
             "joint": 2,      # baseline + joint verification
             "two_step": 3,   # baseline + plan + execute + verify
-            "factored": 4    # baseline + plan + multiple executes + verify (approximate)
+            "factored": 4,   # baseline + plan + multiple executes + verify (approximate)
+            "fused": 1       # baseline, plan, answers and verification in one call
         }.get(self.setting, 3)
         
-        estimated_minutes = (remaining * api_calls_per_question * 4) / 60
+        # Each pooled key sends its own 4 seconds apart
+        estimated_minutes = (remaining * api_calls_per_question * 4 / len(self.key_pool.keys)) / 60
         
         print(f"\n📊 Progress: {current_index + 1}/{total} ({progress:.1f}%)")
         print(f"🔄 Current question: {question[:60]}...")
         print(f"⏱️ Estimated time remaining: {estimated_minutes:.1f} minutes")
+        if self.limiter is not None:
+            print(f"🎚️ Concurrency limit: {self.limiter.limit} ({self.limiter.in_flight} calls in flight)")
+
+    def print_stats(self):
+        super().print_stats()
+        if len(self.key_pool.keys) > 1:
+            print(f"🔑 API keys:\n{self.key_pool.summary()}")
+
+    def complete_question(self, i: int, result: Dict[str, str], all_results: List[Dict[str, str]]):
+        all_results.append(result)
+        self.print_result(result)
+
+        # Save checkpoint after each question
+        self.save_checkpoint(i, all_results)
 
     def run_chain(self):
         """Run the chain of verification with checkpointing support."""
@@ -155,73 +302,35 @@ class ChainOfVerificationGoogle(ChainOfVerification):
         all_results = self.checkpoint_data.get("completed_results", [])
         
         try:
-            for i in range(self.start_question_index, len(self.questions)):
-                question = self.questions[i]
-                
-                self.print_progress(i, len(self.questions), question)
-                
-                # Get baseline response
-                print("🤖 Generating baseline response...")
-                baseline_response = self.get_baseline_response(question)
-                
-                # Run verification based on setting
-                if self.setting == "two_step":
-                    print("🔍 Running two-step verification...")
-                    (
-                        plan_verification_tokens,
-                        execute_verification_tokens,
-                        final_verified_tokens,
-                    ) = self.run_two_step_chain(question, baseline_response)
-                    result = {
-                        "Question": question,
-                        "Baseline Answer": baseline_response,
-                        "Verification Questions": plan_verification_tokens,
-                        "Execute Plan": execute_verification_tokens,
-                        "Final Refined Answer": final_verified_tokens,
-                    }
-                elif self.setting == "joint":
-                    print("🔍 Running joint verification...")
-                    (
-                        plan_and_execution_tokens,
-                        final_verified_tokens,
-                    ) = self.run_joint_chain(question, baseline_response)
-                    result = {
-                        "Question": question,
-                        "Baseline Answer": baseline_response,
-                        "Plan and Execution": plan_and_execution_tokens,
-                        "Final Refined Answer": final_verified_tokens,
-                    }
-                elif self.setting == "factored":
-                    print("🔍 Running factored verification...")
-                    (
-                        plan_verification_tokens,
-                        execute_verification_tokens,
-                        final_verified_tokens,
-                    ) = self.run_factored_chain(question, baseline_response)
-                    result = {
-                        "Question": question,
-                        "Baseline Answer": baseline_response,
-                        "Verification Questions": plan_verification_tokens,
-                        "Execute Plan": execute_verification_tokens,
-                        "Final Refined Answer": final_verified_tokens,
-                    }
-                
-                all_results.append(result)
-                self.print_result(result)
-                
-                # Save checkpoint after each question
-                self.save_checkpoint(i, all_results)
+            remaining = range(self.start_question_index, len(self.questions))
+            if self.concurrent_questions() == 1:
+                for i in remaining:
+                    question = self.questions[i]
+
+                    self.print_progress(i, len(self.questions), question)
+
+                    print(f"🔍 Running {self.setting.replace('_', '-')} verification...")
+                    result = self.run_question(self.question_indices[i], question)
+                    self.complete_question(i, result, all_results)
+            else:
+                # Questions run concurrently, results are still checkpointed in order
+                executor = ThreadPoolExecutor(max_workers=self.concurrent_questions())
+                try:
+                    results = executor.map(
+                        lambda i: self.run_question(self.question_indices[i], self.questions[i]), remaining
+                    )
+                    for i, result in zip(remaining, results):
+                        self.print_progress(i, len(self.questions), self.questions[i])
+                        self.complete_question(i, result, all_results)
+                finally:
+                    executor.shutdown(wait=False, cancel_futures=True)
             
             # Save final results
-            result_file_path = (
-                f"result/{self.model_id}_{self.task}_{self.setting}_results.json"
-            )
-            os.makedirs('result', exist_ok=True)
-            with open(result_file_path, "w", encoding="utf-8") as json_file:
-                json.dump(all_results, json_file, indent=2, ensure_ascii=False)
+            self.save_results(all_results)
             
             print(f"\n🎉 Experiment completed successfully!")
-            print(f"📁 Results saved to: {result_file_path}")
+            print(f"📁 Results saved to: {self.result_file_path}")
+            self.print_stats()
             
             # Clean up checkpoint
             # self.cleanup_checkpoint()
@@ -234,4 +343,10 @@ class ChainOfVerificationGoogle(ChainOfVerification):
         except Exception as e:
             print(f"\n❌ Unexpected error: {e}")
             print(f"💾 Progress saved to checkpoint: {self.checkpoint_file}")
-            raise e
\ No newline at end of file
+            raise e
+        finally:
+            # Cached contents are billed while they live, a resumed run creates them again
+            self.close()
+            if self.semantic_cache is not None:
+                # Kept for the resumed run, which usually follows a quota stop
+                self.semantic_cache.save()
\ No newline at end of file
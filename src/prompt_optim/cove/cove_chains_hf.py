@@ -1,35 +1,186 @@
+import sys
+import threading
+from typing import Callable, Dict, Optional, Tuple
+import torch
+from transformers import LogitsProcessorList, TextIteratorStreamer, set_seed
+from .batching import ContinuousBatchingEngine
+from .constrained_decoding import ListVocabulary, NumberedListLogitsProcessor
 from .cove_chains import ChainOfVerification
-from ...utils import import_model_and_tokenizer
+from .speculative import SpeculativeDecoder
+from ...utils import MODEL_MAPPING, import_model_and_tokenizer
 
 
 class ChainOfVerificationHuggingFace(ChainOfVerification):
+    supports_logprobs = True
+    supports_streaming = True
+    supports_constrained_lists = True
+
     def __init__(
-        self, model_id, top_p, temperature, task, setting, questions, hf_access_token
+        self,
+        model_id,
+        top_p,
+        temperature,
+        task,
+        setting,
+        questions,
+        hf_access_token,
+        continuous_batching=False,
+        max_batch_size=8,
+        load_profile=None,
+        speculative=False,
+        **kwargs,
     ):
-        super().__init__(model_id, task, setting, questions)
+        super().__init__(model_id, task, setting, questions, **kwargs)
         self.hf_access_token = hf_access_token
         self.top_p = top_p
         self.temperature = temperature
 
-        self.model, self.tokenizer = import_model_and_tokenizer(
-            self.model_config, access_token=self.hf_access_token
-        )
+        # Every model used by a stage route is loaded once and kept warm
+        self.models = {
+            routed_model_id: import_model_and_tokenizer(
+                MODEL_MAPPING[routed_model_id],
+                access_token=self.hf_access_token,
+                load_profile=load_profile,
+            )
+            for routed_model_id in self.routed_model_ids
+        }
+        self.model, self.tokenizer = self.models[self.model_id]
+        if self.seed is not None:
+            set_seed(self.seed)
+
+        # Continuous batching: questions run concurrently and every model call
+        # goes through the model's engine, which batches them per decode step.
+        self.engines = {}
+        if continuous_batching and self.constrained_lists:
+            print("Constrained lists need model.generate, they do not run on continuous batching engines.")
+            sys.exit()
+        if continuous_batching:
+            self.engines = {
+                routed_model_id: ContinuousBatchingEngine(
+                    model,
+                    max_batch_size=max_batch_size,
+                    temperature=self.temperature,
+                    top_p=self.top_p,
+                    eos_token_id=tokenizer.eos_token_id,
+                    seed=self.seed,
+                )
+                for routed_model_id, (model, tokenizer) in self.models.items()
+            }
+            self.question_workers = max_batch_size
+
+        # Speculative decoding: routed models with a draft model generate through
+        # a decoder that lets the draft propose tokens for the target to verify
+        self.decoders: Dict[str, SpeculativeDecoder] = {}
+        if speculative and continuous_batching:
+            print("Speculative decoding and continuous batching cannot be combined.")
+            sys.exit()
+        if speculative:
+            for routed_model_id in self.routed_model_ids:
+                model_config = MODEL_MAPPING[routed_model_id]
+                if model_config.draft_model is None:
+                    continue
+                # A draft that is itself a routed model is shared, not loaded twice
+                if model_config.draft_model not in self.models:
+                    self.models[model_config.draft_model] = import_model_and_tokenizer(
+                        MODEL_MAPPING[model_config.draft_model],
+                        access_token=self.hf_access_token,
+                        load_profile=load_profile,
+                    )
+                model, _ = self.models[routed_model_id]
+                draft_model, _ = self.models[model_config.draft_model]
+                self.decoders[routed_model_id] = SpeculativeDecoder(
+                    model,
+                    draft_model,
+                    draft_tokens=model_config.draft_tokens,
+                    temperature=self.temperature,
+                    top_p=self.top_p,
+                    top_k=model.generation_config.top_k,
+                )
+            if not self.decoders:
+                print(f"None of the models {self.routed_model_ids} has a draft model (ModelConfig.draft_model).")
+                sys.exit()
+
+        # Token classes of each model's vocabulary, built on the first constrained call
+        self.list_vocabularies: Dict[str, ListVocabulary] = {}
+        self._vocabulary_lock = threading.Lock()
+
+    def list_vocabulary(self, model_id: str) -> ListVocabulary:
+        with self._vocabulary_lock:
+            if model_id not in self.list_vocabularies:
+                model, tokenizer = self.models[model_id]
+                self.list_vocabularies[model_id] = ListVocabulary(tokenizer, model.config.vocab_size)
+            return self.list_vocabularies[model_id]
 
-    def call_llm(self, prompt: str, max_tokens: int) -> str:
-        if self.model_config.is_llama:
-            input_ids = self.tokenizer(
-                prompt, return_tensors="pt", truncation=True
-            ).input_ids.cuda()
-
-            outputs = self.model.generate(
-                input_ids=input_ids,
-                max_new_tokens=max_tokens,
-                do_sample=True,
-                top_p=self.top_p,
-                temperature=self.temperature,
+    def encode(self, prompt: str, max_tokens: int, model_id: str):
+        _, tokenizer = self.models[model_id]
+        # Prompts are assembled within budget; this only guards against overflow
+        return tokenizer(
+            prompt,
+            return_tensors="pt",
+            truncation=True,
+            max_length=MODEL_MAPPING[model_id].context_window - max_tokens,
+        ).input_ids
+
+    def generate(
+        self,
+        prompt: str,
+        max_tokens: int,
+        model_id: Optional[str] = None,
+        max_items: Optional[int] = None,
+        **generate_kwargs,
+    ):
+        """Prompt plus generated ids; `max_items` constrains the response to a numbered list."""
+        model_id = model_id or self.model_id
+        model, _ = self.models[model_id]
+        input_ids = self.encode(prompt, max_tokens, model_id).to(model.device)
+        if max_items is not None:
+            vocabulary = self.list_vocabulary(model_id)
+            generate_kwargs["logits_processor"] = LogitsProcessorList(
+                [NumberedListLogitsProcessor(vocabulary, input_ids.shape[1], max_items)]
+            )
+            # Stop on the EOS token the processor ends the list with
+            generate_kwargs["eos_token_id"] = vocabulary.eos_token_id
+
+        decoder = self.decoders.get(model_id)
+        if decoder is not None:
+            outputs = decoder.generate(
+                input_ids,
+                max_tokens,
+                eos_token_id=generate_kwargs.get("eos_token_id", model.generation_config.eos_token_id),
+                logits_processor=generate_kwargs.get("logits_processor"),
+                streamer=generate_kwargs.get("streamer"),
             )
-            tokens = self.tokenizer.batch_decode(
-                outputs.detach().cpu().numpy(), skip_special_tokens=True
+            self.report_usage(input_ids.shape[1], outputs.shape[1] - input_ids.shape[1])
+            return outputs
+
+        outputs = model.generate(
+            input_ids=input_ids,
+            max_new_tokens=max_tokens,
+            do_sample=True,
+            top_p=self.top_p,
+            temperature=self.temperature,
+            **generate_kwargs,
+        )
+        self.report_usage(input_ids.shape[1], outputs.shape[1] - input_ids.shape[1])
+        return outputs
+
+    def generate_continuous(self, prompt: str, max_tokens: int, model_id: str):
+        """Prompt plus generated ids, like `generate`, and the mean token log-probability."""
+        prompt_ids = self.encode(prompt, max_tokens, model_id)[0].tolist()
+        output = self.engines[model_id].generate(prompt_ids, max_tokens)
+        self.report_usage(len(prompt_ids), len(output.tokens))
+        return torch.tensor([prompt_ids + output.tokens]), output.mean_logprob
+
+    def count_tokens(self, text: str, model_id: Optional[str] = None) -> int:
+        _, tokenizer = self.models[model_id or self.model_id]
+        return len(tokenizer(text).input_ids)
+
+    def decode_response(self, sequences, model_id: Optional[str] = None) -> str:
+        model_id = model_id or self.model_id
+        _, tokenizer = self.models[model_id]
+        if MODEL_MAPPING[model_id].is_llama:
+            tokens = tokenizer.batch_decode(
+                sequences.detach().cpu().numpy(), skip_special_tokens=True
             )[0][0:]
             tokens = tokens.split("[/INST]")[1]
         
@@ -38,5 +189,93 @@ class ChainOfVerificationHuggingFace(ChainOfVerification):
         else:
             return tokens
 
-    def process_prompt(self, prompt, command) -> str:
-        return self.model_config.prompt_format.format(prompt=prompt, command=command)
+    def call_llm(self, prompt: str, max_tokens: int, model_id: Optional[str] = None) -> str:
+        if self.engines:
+            return self.call_llm_with_logprobs(prompt, max_tokens, model_id)[0]
+        outputs = self.generate(prompt, max_tokens, model_id, self.list_item_cap())
+        return self.decode_response(outputs, model_id)
+
+    def stream_llm(
+        self, prompt: str, max_tokens: int, on_text: Callable[[str], None], model_id: Optional[str] = None
+    ) -> str:
+        """Generate in a background thread, passing the decoded text to `on_text` as tokens arrive.
+
+        Continuous batching engines decode step by step for many sequences, so
+        with them the response is passed on whole.
+        """
+        if self.engines:
+            return super().stream_llm(prompt, max_tokens, on_text, model_id)
+        model_id = model_id or self.model_id
+        _, tokenizer = self.models[model_id]
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        # The stage is thread-local, so the list cap is read here and not in the generating thread
+        max_items = self.list_item_cap()
+        result = {}
+
+        def generate():
+            try:
+                result["outputs"] = self.generate(prompt, max_tokens, model_id, max_items, streamer=streamer)
+                # Token counts are reported per thread, pass them back to the caller's
+                result["usage"] = self._call_usage.tokens
+            except BaseException as e:
+                result["error"] = e
+                streamer.end()
+
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+        streamed, passed = "", 0
+        for text in streamer:
+            streamed += text
+            paragraphs = streamed.split("\n\n")
+            # Like decode_response, only the paragraph after the model's preamble is passed on
+            if len(paragraphs) > 1 and len(paragraphs[1]) > passed:
+                on_text(paragraphs[1][passed:])
+                passed = len(paragraphs[1])
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+        self.report_usage(*result["usage"])
+        return self.decode_response(result["outputs"], model_id)
+
+    def call_llm_with_logprobs(
+        self, prompt: str, max_tokens: int, model_id: Optional[str] = None
+    ) -> Tuple[str, float]:
+        model_id = model_id or self.model_id
+        if self.engines:
+            sequences, mean_logprob = self.generate_continuous(prompt, max_tokens, model_id)
+            return self.decode_response(sequences, model_id), mean_logprob
+        model, _ = self.models[model_id]
+        prompt_length = self.encode(prompt, max_tokens, model_id).shape[1]
+        sequences = self.generate(prompt, max_tokens, model_id, self.list_item_cap())
+        # generate's scores are warped by temperature and top-p, which puts nearly
+        # all the mass on the sampled token; score the response with the raw logits
+        with torch.inference_mode():
+            logits = model(sequences).logits[0, prompt_length - 1 : -1].float()
+        logprobs = torch.log_softmax(logits, dim=-1).gather(1, sequences[0, prompt_length:, None])
+        mean_logprob = logprobs.mean().item()
+        return self.decode_response(sequences, model_id), mean_logprob
+
+    def sampling_params(self) -> Dict[str, float]:
+        return {"temperature": self.temperature, "top_p": self.top_p}
+
+    def process_prompt(self, prompt, command, model_id: Optional[str] = None) -> str:
+        model_config = MODEL_MAPPING[model_id or self.model_id]
+        return model_config.prompt_format.format(prompt=prompt, command=command)
+
+    def print_stats(self):
+        super().print_stats()
+        for model_id, engine in self.engines.items():
+            print(
+                f"🧮 Continuous batching ({model_id}): {engine.steps} decode steps, "
+                f"mean batch size {engine.mean_batch_size:.2f}"
+            )
+        for model_id, decoder in self.decoders.items():
+            print(
+                f"🎯 Speculative decoding ({model_id}, draft {MODEL_MAPPING[model_id].draft_model}): "
+                f"{decoder.summary()}"
+            )
+
+    def close(self):
+        super().close()
+        for engine in self.engines.values():
+            engine.close()
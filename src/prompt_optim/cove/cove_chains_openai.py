@@ -0,0 +1,99 @@
+import sys
+from typing import Dict, Optional
+from .backends import OpenAICompatibleBackend
+from .cove_chains import ChainOfVerification
+from ...utils import MODEL_MAPPING
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+
+class ChainOfVerificationOpenAI(ChainOfVerification):
+    """CoVe over an OpenAI-compatible chat completions endpoint.
+
+    `base_url` may point to OpenAI or to a self-hosted server (vLLM,
+    llama.cpp server, ...), in which case `served_model` is the name the
+    server knows the model by. Up to `max_concurrency` questions run at once
+    over the backend's connection pool; results keep the question order.
+    """
+
+    supports_constrained_lists = True
+    structured_output = True
+
+    def __init__(
+        self,
+        model_id,
+        temperature,
+        top_p,
+        task,
+        setting,
+        questions,
+        openai_access_token=None,
+        base_url=None,
+        served_model=None,
+        max_concurrency=8,
+        timeout=60.0,
+        max_retries=3,
+        **kwargs,
+    ):
+        super().__init__(model_id, task, setting, questions, **kwargs)
+        self.temperature = temperature
+        self.top_p = top_p
+        self.served_model = served_model
+        self.max_concurrency = max_concurrency
+        self.question_workers = max_concurrency
+
+        self.base_url = base_url or OPENAI_BASE_URL
+        if self.base_url == OPENAI_BASE_URL and not openai_access_token:
+            print("❌ OPENAI_API_KEY is missing from .env (pass --base-url for a self-hosted server)")
+            sys.exit(1)
+        self.set_backend(OpenAICompatibleBackend(
+            self.base_url,
+            api_key=openai_access_token,
+            max_concurrency=max_concurrency,
+            timeout=timeout,
+            max_retries=max_retries,
+        ))
+
+    def api_model_name(self, model_id: str) -> str:
+        if model_id == self.model_id and self.served_model:
+            return self.served_model
+        return MODEL_MAPPING[model_id].id
+
+    def sampling_params(self) -> Dict[str, float]:
+        params = {"temperature": self.temperature, "top_p": self.top_p}
+        if self.seed is not None:
+            params["seed"] = self.seed
+        return params
+
+    def structured_output_params(self) -> Dict:
+        schema = self.response_schema()
+        if schema is None:
+            return {}
+        # Structured outputs: OpenAI and vLLM constrain decoding to the schema
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": f"cove_{self._call_usage.stage}", "schema": schema},
+            }
+        }
+
+    def process_prompt(self, prompt: str, command: str, model_id: Optional[str] = None) -> str:
+        return MODEL_MAPPING[model_id or self.model_id].prompt_format.format(
+            prompt=prompt, command=command
+        )
+
+    def print_stats(self):
+        super().print_stats()
+        print(f"🌐 {self.base_url}: {self.backend.summary()}")
+
+    def save_results(self, all_results):
+        super().save_results(all_results)
+        print(f"📁 Results saved to: {self.result_file_path}")
+
+    def close(self):
+        super().close()
+        self.backend.close()
+
+    def run_chain(self):
+        print(f"🌐 Running {len(self.questions)} questions on {self.base_url} ({self.max_concurrency} concurrent)")
+        super().run_chain()
@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Optional
+from .cove_chains import ChainOfVerification
+from .replay import replay_key
+from ...utils import MODEL_MAPPING
+
+REPLAY_LATENCIES = ["recorded", "zero"]
+
+
+class ChainOfVerificationReplay(ChainOfVerification):
+    """Replays a recorded run without any model or network.
+
+    Each call is answered with the recorded response of the same stage,
+    model, prompt, max tokens and sampling parameters, after the recorded
+    latency or none at all. Identical calls are answered in recorded order
+    (e.g. self-consistency samples); once those run out, the last one is
+    reused. Verification questions the recorded run answered from its fact
+    store or semantic cache get the recorded lookup answers, in the same way.
+    Since responses are identical, every replay does exactly the same work as
+    the recorded run, which makes it a stable benchmark of the chain itself.
+    Results are written with a `_replay` tag next to the originals.
+    """
+
+    # Recorded logprob calls are answered with their (response, mean logprob)
+    supports_logprobs = True
+
+    def __init__(
+        self, model_id, task, setting, questions, replay_path, latency="recorded", question_workers=1, **kwargs
+    ):
+        kwargs["run_tag"] = kwargs.get("run_tag", "") + "_replay"
+        super().__init__(model_id, task, setting, questions, **kwargs)
+        self.question_workers = question_workers
+        if latency not in REPLAY_LATENCIES:
+            raise ValueError(f"Invalid replay latency {latency}, use one of {REPLAY_LATENCIES}")
+        self.replay_path = replay_path
+        self.latency = latency
+
+        self.entries = defaultdict(deque)
+        self.lookups = defaultdict(deque)
+        self.params = {}
+        with open(replay_path, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if "lookup" in entry:
+                    self.lookups[entry["question"]].append(entry)
+                    continue
+                self.params = entry["params"]
+                key = replay_key(
+                    entry["stage"], entry["model"], entry["prompt"], entry["max_tokens"],
+                    entry["params"], entry["with_logprobs"],
+                )
+                self.entries[key].append(entry)
+        self.last = {}
+        self._lock = threading.Lock()
+        self.replayed = 0
+        self.reused = 0
+        self.looked_up = 0
+
+    def sampling_params(self) -> Dict[str, float]:
+        return dict(self.params)
+
+    def process_prompt(self, prompt, command, model_id: Optional[str] = None) -> str:
+        model_config = MODEL_MAPPING[model_id or self.model_id]
+        return model_config.prompt_format.format(prompt=prompt, command=command)
+
+    def invoke_llm(
+        self, stage: str, model_id: str, prompt: str, max_tokens: int, with_logprobs=False, on_text=None
+    ):
+        key = replay_key(stage, model_id, prompt, max_tokens, self.params, with_logprobs)
+        with self._lock:
+            if self.entries.get(key):
+                entry = self.last[key] = self.entries[key].popleft()
+            elif key in self.last:
+                entry = self.last[key]
+                self.reused += 1
+            else:
+                raise KeyError(
+                    f"No recorded {stage} call of {model_id} for this prompt in {self.replay_path}; "
+                    "replay with the same task, setting, selection and options as the recording."
+                )
+            self.replayed += 1
+
+        start = time.perf_counter()
+        if self.latency == "recorded":
+            time.sleep(entry["seconds"])
+        self.usage.record(
+            stage, model_id, entry["prompt_tokens"], entry["completion_tokens"],
+            time.perf_counter() - start,
+        )
+        response = entry["response"]
+        # A streamed call is passed on whole, as by backends that cannot stream
+        if on_text is not None:
+            on_text(response)
+        return tuple(response) if with_logprobs else response
+
+    def execute_verification_question(self, planned_question: str) -> str:
+        with self._lock:
+            entry = self.lookups[planned_question].popleft() if self.lookups.get(planned_question) else None
+            if entry is not None:
+                self.looked_up += 1
+        if entry is None:
+            return super().execute_verification_question(planned_question)
+        if self.latency == "recorded":
+            time.sleep(entry["seconds"])
+        return entry["answer"]
+
+    def print_stats(self):
+        super().print_stats()
+        print(
+            f"📼 Replayed {self.replayed} calls from {self.replay_path} ({self.latency} latency, "
+            f"{self.reused} reused), {self.looked_up} fact store / semantic cache answers"
+        )
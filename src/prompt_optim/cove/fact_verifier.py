@@ -0,0 +1,90 @@
+import re
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from ...data.fact_store import FactStore, entity_key
+
+
+class FactVerifier:
+    """Answer templated verification questions from a FactStore, without an LLM call.
+
+    Recognises birthplace ("Where was X born?"), birth date ("When was X
+    born?") and confirmation ("Was X born in Y?", "Is X a Y?") questions.
+    Anything else, an unknown subject, conflicting facts (e.g. two people of
+    the same name) or a confirmation the facts cannot settle is a miss,
+    answered by the LLM as before. Only confirmations are answered, never
+    denials: a city list or profession missing from the store proves nothing.
+    """
+
+    def __init__(self, store: FactStore):
+        self.store = store
+        self.templates: List[Tuple[re.Pattern, Callable[[re.Match], Optional[str]]]] = [
+            (re.compile(r"(?:where|in which (?:city|town|place)) was (?P<subject>.+?) born", re.I), self.birthplace),
+            (re.compile(r"what (?:is|was) (?:the )?(?:birthplace|birth place|place of birth) of (?P<subject>.+?)", re.I), self.birthplace),
+            (re.compile(r"what (?:is|was) (?P<subject>.+?)'s (?:birthplace|birth place|place of birth)", re.I), self.birthplace),
+            (re.compile(r"when was (?P<subject>.+?) born", re.I), self.birthdate),
+            (re.compile(r"what (?:is|was) (?:the )?(?:birth ?date|date of birth) of (?P<subject>.+?)", re.I), self.birthdate),
+            (re.compile(r"was (?P<subject>.+?) born in (?P<object>.+?)", re.I), self.confirm_born_in),
+            (re.compile(r"is (?P<subject>.+?) (?P<article>an?) (?P<object>.+?)", re.I), self.confirm_occupation),
+        ]
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def single(self, subject: str, relation: str) -> Optional[str]:
+        values = self.store.lookup(subject, relation)
+        return values[0] if len(values) == 1 else None
+
+    def birthplace(self, match: re.Match) -> Optional[str]:
+        city = self.single(match["subject"], "born_in")
+        if city is None:
+            return None
+        birthplace = self.single(match["subject"], "birthplace")
+        # A birthplace within the city (e.g. a district) is followed by the city, like "Copacabana, Rio de Janeiro"
+        if birthplace is not None and entity_key(birthplace) not in entity_key(city):
+            return f"{birthplace}, {city}"
+        return city
+
+    def birthdate(self, match: re.Match) -> Optional[str]:
+        return self.single(match["subject"], "birthdate")
+
+    def confirm_born_in(self, match: re.Match) -> Optional[str]:
+        place = entity_key(match["object"])
+        places = self.store.lookup(match["subject"], "born_in") + self.store.lookup(match["subject"], "birthplace")
+        # Whole words of a known place, so "Rio de Janeiro" confirms "RJ, Rio de Janeiro"
+        if place and any(f" {place} " in f" {entity_key(known)} " for known in places):
+            return f"Yes, {match['subject']} was born in {match['object']}."
+        return None
+
+    def confirm_occupation(self, match: re.Match) -> Optional[str]:
+        occupation = entity_key(match["object"])
+        for known in self.store.lookup(match["subject"], "occupation"):
+            # Professions are stored in the plural of the dataset questions ("actors")
+            if occupation in [entity_key(known), re.sub(r"s$", "", entity_key(known))]:
+                return f"Yes, {match['subject']} is {match['article']} {match['object']}."
+        return None
+
+    def answer(self, question: str) -> Optional[str]:
+        start = time.perf_counter()
+        text = question.strip().rstrip("?.! ").strip()
+        answer = None
+        for pattern, resolve in self.templates:
+            match = pattern.fullmatch(text)
+            if match is not None:
+                answer = resolve(match)
+                break
+        with self._lock:
+            self.lookups += 1
+            self.hits += answer is not None
+            self.seconds += time.perf_counter() - start
+        return answer
+
+    def summary(self) -> str:
+        hit_rate = self.hits / self.lookups * 100 if self.lookups else 0.0
+        mean_us = self.seconds / self.lookups * 1e6 if self.lookups else 0.0
+        return (
+            f"{self.hits}/{self.lookups} verification questions answered from {self.store.path} "
+            f"({hit_rate:.1f}%, {mean_us:.0f}µs per lookup)"
+        )
@@ -0,0 +1,142 @@
+import math
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CallTimeoutError(Exception):
+    """An LLM call missed its stage deadline on every attempt."""
+
+
+class LatencyWindow:
+    """Rolling window of a stage's successful call latencies."""
+
+    def __init__(self, size: int = 200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+class HedgingPolicy:
+    """Per-stage deadlines and hedged requests for LLM calls.
+
+    A call gets `timeouts[stage]` seconds; when it misses the deadline it is
+    abandoned (its thread runs on, the transport's own timeout should end it)
+    and retried `timeout_retries` times before `CallTimeoutError` is raised.
+    With `hedge_quantile`, a call still running after that quantile of its
+    stage's recent latencies gets a duplicate, and whichever returns first
+    is kept. Duplicates go through the same call, so they share the
+    backend's rate limits and retries. Hedging starts once a stage has
+    `min_samples` latencies.
+    """
+
+    def __init__(
+        self,
+        timeouts: Optional[Dict[str, float]] = None,
+        hedge_quantile: Optional[float] = None,
+        timeout_retries: int = 1,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        self.timeouts = dict(timeouts or {})
+        self.hedge_quantile = hedge_quantile
+        self.timeout_retries = timeout_retries
+        self.min_samples = min_samples
+        self.window = window
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, LatencyWindow] = {}
+        # (stage, event) -> count, events: calls, hedges, hedge_wins, timeouts
+        self.counts = Counter()
+
+    def hedge_delay(self, stage: str) -> Optional[float]:
+        if self.hedge_quantile is None:
+            return None
+        with self._lock:
+            latencies = self._latencies.get(stage)
+            if latencies is None or len(latencies.samples) < self.min_samples:
+                return None
+            return latencies.quantile(self.hedge_quantile)
+
+    def record(self, stage: str, event: str):
+        with self._lock:
+            self.counts[(stage, event)] += 1
+
+    def record_latency(self, stage: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(stage, LatencyWindow(self.window)).add(seconds)
+
+    def _start(self, fn: Callable[[], T]) -> Future:
+        # Daemon threads, so an abandoned call never blocks the others or the exit
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def call(self, stage: str, fn: Callable[[], T]) -> T:
+        self.record(stage, "calls")
+        timeout = self.timeouts.get(stage)
+        for attempt in range(self.timeout_retries + 1):
+            start = time.monotonic()
+            hedge_delay = self.hedge_delay(stage)
+            primary = self._start(fn)
+            started = {primary: start}
+            pending = {primary}
+            while pending:
+                elapsed = time.monotonic() - start
+                wait_for = None if timeout is None else timeout - elapsed
+                if hedge_delay is not None and len(started) == 1:
+                    until_hedge = hedge_delay - elapsed
+                    wait_for = until_hedge if wait_for is None else min(wait_for, until_hedge)
+                if wait_for is not None and wait_for <= 0 and (timeout is None or timeout - elapsed > 0):
+                    # Past the hedge point, still within the deadline
+                    hedge = self._start(fn)
+                    started[hedge] = time.monotonic()
+                    pending.add(hedge)
+                    self.record(stage, "hedges")
+                    continue
+                if wait_for is not None and wait_for <= 0:
+                    break
+
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        self.record_latency(stage, time.monotonic() - started[future])
+                        if future is not primary:
+                            self.record(stage, "hedge_wins")
+                        return future.result()
+                # A failed call is not hedged: backends retry their own errors
+                if done and not pending:
+                    return next(iter(done)).result()
+            self.record(stage, "timeouts")
+            print(f"⏰ {stage} call exceeded its {timeout:.1f}s deadline (attempt {attempt + 1})")
+        raise CallTimeoutError(f"{stage} call exceeded its {timeout}s deadline {self.timeout_retries + 1} times")
+
+    def total(self, event: str) -> int:
+        return sum(count for (_, counted_event), count in self.counts.items() if counted_event == event)
+
+    def summary(self) -> str:
+        stages = sorted({stage for stage, _ in self.counts})
+        lines = []
+        for stage in stages:
+            delay = self.hedge_delay(stage)
+            lines.append(
+                f"{stage}: {self.counts[(stage, 'calls')]} calls, {self.counts[(stage, 'hedges')]} hedged "
+                f"({self.counts[(stage, 'hedge_wins')]} won), {self.counts[(stage, 'timeouts')]} timed out"
+                + (f", hedge after {delay:.2f}s" if delay is not None else "")
+            )
+        return "\n".join(lines)
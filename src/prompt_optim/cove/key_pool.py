@@ -0,0 +1,88 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass
+class PooledKey:
+    api_key: str
+    label: str
+    # Monotonic time the key may send its next request
+    next_request: float = 0.0
+    # Monotonic time a throttled key is enabled again
+    disabled_until: float = 0.0
+    consecutive_throttles: int = 0
+    requests: int = 0
+    throttles: int = 0
+
+    @property
+    def available_at(self) -> float:
+        return max(self.next_request, self.disabled_until)
+
+
+class KeyPool:
+    """Spread requests over several API keys, each with its own quota.
+
+    Every key has its own request spacing (`min_request_interval`) and health
+    state. `acquire` hands out the key that can send soonest, waiting for it if
+    needed. A throttled key is disabled for `cooldown` seconds (doubling on
+    each consecutive throttle); once every key has been throttled
+    `max_consecutive_throttles` times in a row the pool is exhausted.
+    """
+
+    def __init__(
+        self,
+        api_keys: List[str],
+        min_request_interval: float = 4.0,
+        cooldown: float = 60.0,
+        max_consecutive_throttles: int = 3,
+    ):
+        if not api_keys:
+            raise ValueError("A key pool needs at least one API key")
+        self.keys = [
+            PooledKey(api_key, f"key {i + 1} (...{api_key[-4:]})")
+            for i, api_key in enumerate(api_keys)
+        ]
+        self.min_request_interval = min_request_interval
+        self.cooldown = cooldown
+        self.max_consecutive_throttles = max_consecutive_throttles
+        self._lock = threading.Lock()
+
+    def acquire(self) -> PooledKey:
+        with self._lock:
+            key = min(self.keys, key=lambda pooled: pooled.available_at)
+            now = time.monotonic()
+            start = max(now, key.available_at)
+            # Reserved now, so concurrent callers are spread over the other keys
+            key.next_request = start + self.min_request_interval
+            key.requests += 1
+        wait = start - now
+        if wait > 0:
+            print(f"⏱️ Rate limiting: waiting {wait:.1f}s for {key.label}...")
+            time.sleep(wait)
+        return key
+
+    def report_success(self, key: PooledKey):
+        with self._lock:
+            key.consecutive_throttles = 0
+
+    def report_throttle(self, key: PooledKey, retry_after: Optional[float] = None):
+        with self._lock:
+            key.throttles += 1
+            key.consecutive_throttles += 1
+            disabled_for = retry_after or self.cooldown * 2 ** (key.consecutive_throttles - 1)
+            key.disabled_until = time.monotonic() + disabled_for
+        print(f"⚠️ {key.label} throttled, disabled for {disabled_for:.0f}s")
+
+    @property
+    def exhausted(self) -> bool:
+        with self._lock:
+            return all(key.consecutive_throttles >= self.max_consecutive_throttles for key in self.keys)
+
+    def summary(self) -> str:
+        return "\n".join(
+            f"{key.label}: {key.requests} requests, {key.throttles} throttled"
+            + (" (disabled)" if key.disabled_until > time.monotonic() else "")
+            for key in self.keys
+        )
@@ -175,6 +175,19 @@ Example Answer: Boston, Massachusetts
 
 Actual Question: {verification_question}"""
 
+######### WIKIDATA FUSED #############
+
+FUSED_PROMPT_WIKI = """Answer the below question which is asking for a list of persons, verify the answer and filter it, all in a single JSON object. NO ADDITIONAL DETAILS.
+`baseline_answer`: a list of maximum 10 persons answering the question.
+`verification`: for every person of `baseline_answer`, a verification question following the template and its answer.
+`verified_answer`: the persons of `baseline_answer` whose verification answer agrees with the question.
+
+Example Question: Who are some movie actors who were born in Boston?
+Example Verification Question Template: Where was [movie actor] born?
+Example JSON: {{"baseline_answer": ["Matt Damon", "Chris Evans", "Mark Wahlberg"], "verification": [{{"question": "Where was Matt Damon born?", "answer": "Cambridge, Massachusetts"}}, {{"question": "Where was Chris Evans born?", "answer": "Sudbury, Massachusetts"}}, {{"question": "Where was Mark Wahlberg born?", "answer": "Boston, Massachusetts"}}], "verified_answer": ["Mark Wahlberg"]}}
+
+Actual Question: {original_question}"""
+
 ######################################
 # WIKIDATA CATEGORY
 ######################################
@@ -347,6 +360,19 @@ Example Answer: No, TENET is directed by Christopher Nolan.
 
 Actual Question: {verification_question}"""
 
+######## WIKICATEGORY FUSED ##########
+
+FUSED_PROMPT_WIKI_CATEGORY = """Answer the below question which is asking for a list of entities (names, places, locations etc), verify the answer and filter it, all in a single JSON object. NO ADDITIONAL DETAILS.
+`baseline_answer`: a list of the relevant & concise entities answering the question.
+`verification`: for every entity of `baseline_answer`, a verification question following the template and its answer.
+`verified_answer`: the entities of `baseline_answer` whose verification answer agrees with the question.
+
+Example Question: Name some movies directed by Steven Spielberg.
+Example Verification Question Template: Is [movie] directed by [Steven Spielberg]?
+Example JSON: {{"baseline_answer": ["Jaws", "Jurassic Park", "TENET"], "verification": [{{"question": "Is Jaws directed by Steven Spielberg?", "answer": "Yes, Jaws is directed by Steven Spielberg."}}, {{"question": "Is Jurassic Park directed by Steven Spielberg?", "answer": "Yes, Jurassic Park is directed by Steven Spielberg."}}, {{"question": "Is TENET directed by Steven Spielberg?", "answer": "No, TENET is directed by Christopher Nolan."}}], "verified_answer": ["Jaws", "Jurassic Park"]}}
+
+Actual Question: {original_question}"""
+
 ######################################
 # MULTISPAN QA
 ######################################
@@ -436,4 +462,48 @@ Example Answer: Yes.
 Example Question: Did Johannes Gutenberg invent the first printing press in 1450? 
 Example Answer: Yes.
 
-Actual Questions: {verification_question}"""
\ No newline at end of file
+Actual Questions: {verification_question}"""
+
+######## MULTISPAN QA FUSED #########
+
+FUSED_PROMPT_MULTI_QA = """Answer the below question correctly and in a concise manner, verify the answer and refine it, all in a single JSON object. Only answer what the question is asked. NO ADDITIONAL DETAILS.
+`baseline_answer`: the parts of the answer.
+`verification`: for every part of `baseline_answer`, a verification question and its answer.
+`verified_answer`: the parts of `baseline_answer` the verification answers confirm.
+
+Example Question: Who invented the first printing press and in what year?
+Example JSON: {{"baseline_answer": ["Johannes Gutenberg", "1450"], "verification": [{{"question": "Did Johannes Gutenberg invent the first printing press?", "answer": "Yes, Johannes Gutenberg invented the first printing press."}}, {{"question": "Did Johannes Gutenberg invent the first printing press in 1450?", "answer": "Yes, Johannes Gutenberg invented the first printing press in 1450."}}], "verified_answer": ["Johannes Gutenberg", "1450"]}}
+
+Question: {original_question}"""
+
+######################################
+# FUSED RESPONSE FORMAT
+######################################
+
+# JSON schema of the fused setting's response, in the subset of JSON schema that
+# both OpenAI structured outputs and Gemini response schemas accept. Gemini emits
+# properties in alphabetical order, which the key names keep in CoVe order.
+FUSED_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "baseline_answer": {"type": "array", "items": {"type": "string"}},
+        "verification": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"question": {"type": "string"}, "answer": {"type": "string"}},
+                "required": ["question", "answer"],
+            },
+        },
+        "verified_answer": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["baseline_answer", "verification", "verified_answer"],
+}
+
+# JSON schema of a list stage's response with --constrained-lists. The item cap
+# is applied when parsing, maxItems is not supported by every provider.
+LIST_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {"items": {"type": "array", "items": {"type": "string"}}},
+    "required": ["items"],
+}
@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+from typing import Dict
+
+
+def replay_key(stage: str, model_id: str, prompt: str, max_tokens: int, params: Dict, with_logprobs: bool):
+    return (stage, model_id, prompt, max_tokens, json.dumps(params, sort_keys=True), with_logprobs)
+
+
+class ReplayRecorder:
+    """Appends every LLM call of a run to a JSONL file, one call per line.
+
+    Verification answers found without a call (fact store, semantic cache)
+    are recorded as lookups, so the replay needs neither.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def record(
+        self,
+        stage: str,
+        model_id: str,
+        prompt: str,
+        max_tokens: int,
+        params: Dict,
+        with_logprobs: bool,
+        response,
+        prompt_tokens: int,
+        completion_tokens: int,
+        seconds: float,
+    ):
+        line = json.dumps({
+            "stage": stage,
+            "model": model_id,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "params": params,
+            "with_logprobs": with_logprobs,
+            "response": response,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "seconds": round(seconds, 4),
+        }, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def record_lookup(self, source: str, question: str, answer: str, seconds: float):
+        line = json.dumps({
+            "lookup": source,
+            "question": question,
+            "answer": answer,
+            "seconds": round(seconds, 4),
+        }, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
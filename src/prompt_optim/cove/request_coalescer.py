@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable
+
+
+class RequestCoalescer:
+    """Share one LLM call between identical requests issued during a run.
+
+    The first request for a key performs the call; any later request with the
+    same key, whether the call is still pending or already completed, waits on
+    and reuses its result. Failed calls are forgotten so they can be retried.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._futures: Dict[Hashable, Future] = {}
+        self.requests = 0
+        self.duplicate_hits = 0
+
+    def call(self, key: Hashable, fn: Callable[[], str]) -> str:
+        with self._lock:
+            self.requests += 1
+            future = self._futures.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._futures[key] = future
+            else:
+                self.duplicate_hits += 1
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                del self._futures[key]
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    @property
+    def unique_calls(self) -> int:
+        return self.requests - self.duplicate_hits
+
+    def summary(self) -> str:
+        saved = self.duplicate_hits / self.requests * 100 if self.requests else 0.0
+        return (
+            f"{self.duplicate_hits}/{self.requests} requests were duplicates "
+            f"({saved:.1f}% of LLM calls saved, {self.unique_calls} unique calls)"
+        )
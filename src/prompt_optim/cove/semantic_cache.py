@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ...utils import DEFAULT_EMBEDDING_MODEL
+
+
+class QuestionEmbedder:
+    """Normalised sentence embeddings from a small transformers encoder on the CPU.
+
+    Mean-pools the last hidden state over the attention mask, the pooling
+    sentence-transformers checkpoints such as all-MiniLM-L6-v2 are trained with.
+    """
+
+    def __init__(self, model_id: str = DEFAULT_EMBEDDING_MODEL):
+        from transformers import AutoModel, AutoTokenizer
+
+        self.model_id = model_id
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        self.model = AutoModel.from_pretrained(model_id).eval()
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        import torch
+
+        inputs = self.tokenizer(texts, padding=True, truncation=True, max_length=128, return_tensors="pt")
+        with self._lock, torch.inference_mode():
+            hidden = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return torch.nn.functional.normalize(pooled, dim=-1).float().numpy()
+
+
+class SemanticCache:
+    """Answers of past verification questions, found again by embedding similarity.
+
+    A question whose embedding has a cosine similarity of at least
+    `threshold` with a stored one gets that question's answer. At most
+    `capacity` questions are kept; when full, the least recently used one is
+    replaced. Vectors live in one preallocated matrix, so a lookup is a
+    single matrix-vector product. `path` persists the cache across runs, for
+    the `namespace` (task and model) it was built for.
+    """
+
+    def __init__(
+        self,
+        embedder: QuestionEmbedder,
+        threshold: float = 0.9,
+        capacity: int = 10000,
+        path: Optional[str] = None,
+        namespace: str = "",
+    ):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.capacity = capacity
+        self.path = path
+        self.namespace = f"{namespace}|{embedder.model_id}"
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._questions: List[str] = []
+        self._answers: List[str] = []
+        # Seconds the call that produced each answer took, what a hit saves
+        self._seconds: List[float] = []
+        self._last_used: List[int] = []
+        self._slots: Dict[str, int] = {}
+        self._clock = 0
+        self.lookups = 0
+        self.hits = 0
+        self.seconds_saved = 0.0
+        self.embedding_seconds = 0.0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._questions)
+
+    def lookup(self, question: str) -> Tuple[Optional[str], np.ndarray]:
+        """The stored answer of the most similar question above the threshold, and the embedding."""
+        start = time.perf_counter()
+        vector = self.embedder.embed([question])[0]
+        with self._lock:
+            self.embedding_seconds += time.perf_counter() - start
+            self.lookups += 1
+            self._clock += 1
+            if not self._questions:
+                return None, vector
+            similarities = self._vectors[: len(self._questions)] @ vector
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                return None, vector
+            self.hits += 1
+            self.seconds_saved += self._seconds[slot]
+            self._last_used[slot] = self._clock
+            return self._answers[slot], vector
+
+    def store(self, vector: np.ndarray, question: str, answer: str, seconds: float):
+        with self._lock:
+            self._clock += 1
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            slot = self._slots.get(question)
+            if slot is None and len(self._questions) < self.capacity:
+                slot = len(self._questions)
+                self._questions.append(question)
+                self._answers.append(answer)
+                self._seconds.append(seconds)
+                self._last_used.append(self._clock)
+            else:
+                if slot is None:
+                    slot = int(np.argmin(self._last_used))
+                    del self._slots[self._questions[slot]]
+                self._questions[slot], self._answers[slot] = question, answer
+                self._seconds[slot], self._last_used[slot] = seconds, self._clock
+            self._slots[question] = slot
+            self._vectors[slot] = vector
+
+    def load(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["namespace"]) != self.namespace:
+                raise ValueError(
+                    f"Semantic cache {path} was built for {data['namespace']}, not {self.namespace}"
+                )
+            # The most recently used entries are kept when the capacity shrank
+            order = np.argsort(data["last_used"])[::-1][: self.capacity][::-1]
+            for i in order:
+                self.store(
+                    data["vectors"][i], str(data["questions"][i]), str(data["answers"][i]), float(data["seconds"][i])
+                )
+
+    def save(self):
+        if self.path is None or not self._questions:
+            return
+        with self._lock:
+            size = len(self._questions)
+            arrays = dict(
+                namespace=np.array(self.namespace),
+                vectors=self._vectors[:size].copy(),
+                questions=np.array(self._questions),
+                answers=np.array(self._answers),
+                seconds=np.array(self._seconds),
+                last_used=np.array(self._last_used),
+            )
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Written aside and moved into place, so an interrupted save keeps the old cache
+        with open(self.path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(self.path + ".tmp", self.path)
+
+    def summary(self) -> str:
+        hit_rate = self.hits / self.lookups * 100 if self.lookups else 0.0
+        return (
+            f"{self.hits}/{self.lookups} verification questions answered from the cache ({hit_rate:.1f}%), "
+            f"~{self.seconds_saved:.1f}s of LLM calls saved for {self.embedding_seconds:.1f}s of embedding, "
+            f"{len(self)}/{self.capacity} questions stored"
+        )
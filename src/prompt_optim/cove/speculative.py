@@ -0,0 +1,177 @@
+import threading
+from typing import List, Optional, Sequence, Union
+
+import torch
+
+
+def crop_cache(past, length: int):
+    """A legacy per-layer ((key, value), ...) cache cut back to its first `length` positions."""
+    return tuple(tuple(tensor[:, :, :length, :] for tensor in layer) for layer in past)
+
+
+def sampling_distribution(logits: torch.Tensor, temperature: float, top_k: int, top_p: float) -> torch.Tensor:
+    """Next-token probabilities after the temperature, top-k and top-p warpers of `generate(do_sample=True)`.
+
+    A temperature of 0 is greedy decoding, all probability on the argmax.
+    """
+    if temperature <= 0:
+        return torch.zeros_like(logits).scatter_(-1, logits.argmax(-1, keepdim=True), 1.0)
+    probs = torch.softmax(logits / temperature, dim=-1)
+    if 0 < top_k < probs.shape[-1]:
+        sorted_probs, indices = probs.topk(top_k)
+    else:
+        sorted_probs, indices = probs.sort(descending=True)
+    if top_p < 1.0:
+        # Tokens after the first ones holding top_p of the mass, always keeping the most likely one
+        sorted_probs[sorted_probs.cumsum(-1) - sorted_probs >= top_p] = 0
+    probs = torch.zeros_like(probs).scatter_(-1, indices, sorted_probs)
+    return probs / probs.sum(-1, keepdim=True)
+
+
+class SpeculativeDecoder:
+    """Speculative sampling of a target causal LM with a smaller draft model of the same tokenizer.
+
+    Each step the draft proposes `draft_tokens` tokens one by one and the
+    target scores all of them in a single forward pass. A proposal x is
+    accepted with probability min(1, p(x) / q(x)), p and q being the target's
+    and the draft's sampling distributions; the first rejected one is replaced
+    by a sample of max(0, p - q), renormalised, and when all are accepted the
+    target's distribution after them gives one more token. The output is thus
+    distributed exactly as the target's own samples (its argmax when greedy),
+    while the target runs once per accepted run instead of once per token.
+
+    Both models keep their KV cache between steps, cut back to the accepted
+    tokens. Batch size 1, like the chain's calls.
+    """
+
+    def __init__(
+        self,
+        model,
+        draft_model,
+        draft_tokens: int = 4,
+        temperature: float = 1.0,
+        top_p: float = 1.0,
+        top_k: int = 50,
+    ):
+        self.model = model
+        self.draft_model = draft_model
+        self.draft_tokens = draft_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self.proposed = 0
+        self.accepted = 0
+        self.generated = 0
+        self.target_passes = 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.proposed if self.proposed else 0.0
+
+    @property
+    def tokens_per_pass(self) -> float:
+        return self.generated / self.target_passes if self.target_passes else 0.0
+
+    def forward(self, model, token_ids: List[int], past):
+        device = next(model.parameters()).device
+        outputs = model(torch.tensor([token_ids], device=device), past_key_values=past, use_cache=True)
+        return outputs.logits[0].float(), outputs.past_key_values
+
+    def distribution(self, logits: torch.Tensor, context: List[int], logits_processor) -> torch.Tensor:
+        if logits_processor is not None:
+            logits = logits_processor(torch.tensor([context]), logits.unsqueeze(0).cpu().clone())[0]
+        return sampling_distribution(logits.cpu(), self.temperature, self.top_k, self.top_p)
+
+    def sample(self, probs: torch.Tensor) -> int:
+        if self.temperature <= 0:
+            return int(probs.argmax())
+        return int(torch.multinomial(probs, 1))
+
+    @torch.inference_mode()
+    def generate(
+        self,
+        input_ids: torch.LongTensor,
+        max_new_tokens: int,
+        eos_token_id: Optional[Union[int, Sequence[int]]] = None,
+        logits_processor=None,
+        streamer=None,
+    ) -> torch.LongTensor:
+        """Prompt plus generated ids, like `model.generate(input_ids, max_new_tokens=...)`."""
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+        stop = set(eos_token_id or [])
+        tokens = input_ids[0].tolist()
+        prompt_length = len(tokens)
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+        # Each cache holds every token but the last, which is fed at the next step
+        past, draft_past = None, None
+        cached, draft_cached = 0, 0
+        proposed = accepted = passes = 0
+        done = False
+        while not done and len(tokens) - prompt_length < max_new_tokens:
+            # Room for the proposals and the target's own token
+            k = min(self.draft_tokens, max_new_tokens - (len(tokens) - prompt_length) - 1)
+            proposals, draft_probs = [], []
+            for _ in range(k):
+                context = tokens + proposals
+                logits, draft_past = self.forward(self.draft_model, context[draft_cached:], draft_past)
+                draft_cached = len(context)
+                q = self.distribution(logits[-1], context, logits_processor)
+                proposals.append(self.sample(q))
+                draft_probs.append(q)
+                if proposals[-1] in stop:
+                    break
+
+            context = tokens + proposals
+            logits, past = self.forward(self.model, context[cached:], past)
+            passes += 1
+            # Rows predicting each proposal, then the token after the last one
+            logits = logits[-(len(proposals) + 1):]
+            new_tokens = []
+            for i, (token, q) in enumerate(zip(proposals, draft_probs)):
+                p = self.distribution(logits[i], tokens + new_tokens, logits_processor)
+                if self.temperature <= 0:
+                    keep = int(p.argmax()) == token
+                else:
+                    keep = bool(torch.rand(()) * q[token] < p[token])
+                if not keep:
+                    residual = (p - q).clamp(min=0)
+                    # Greedy: the residual of two one-hot distributions is the target's argmax
+                    new_tokens.append(self.sample(residual / residual.sum() if residual.sum() > 0 else p))
+                    break
+                new_tokens.append(token)
+                accepted += 1
+            else:
+                new_tokens.append(self.sample(self.distribution(logits[-1], context, logits_processor)))
+            proposed += len(proposals)
+
+            for position, token in enumerate(new_tokens):
+                if token in stop:
+                    new_tokens = new_tokens[: position + 1]
+                    done = True
+                    break
+            tokens += new_tokens
+            cached = len(tokens) - 1
+            past = crop_cache(past, cached)
+            draft_cached = min(draft_cached, cached)
+            if draft_past is not None:
+                draft_past = crop_cache(draft_past, draft_cached)
+            if streamer is not None:
+                streamer.put(torch.tensor(new_tokens))
+
+        if streamer is not None:
+            streamer.end()
+        with self._lock:
+            self.proposed += proposed
+            self.accepted += accepted
+            self.generated += len(tokens) - prompt_length
+            self.target_passes += passes
+        return torch.tensor([tokens], device=input_ids.device)
+
+    def summary(self) -> str:
+        return (
+            f"{self.acceptance_rate:.1%} of {self.proposed} draft tokens accepted (k={self.draft_tokens}), "
+            f"{self.tokens_per_pass:.2f} tokens per target forward pass"
+        )
@@ -0,0 +1,167 @@
+import re
+import string
+from typing import Callable, Dict, Set, Tuple
+
+from ...utils import MODEL_MAPPING, TaskConfig
+
+# Values the chain passes to each stage's template; a template may use any subset.
+STAGE_FIELDS = {
+    "baseline": {"original_question"},
+    "plan": {"original_question", "baseline_response"},
+    "plan_and_execute": {"original_question", "baseline_response"},
+    "execute": {"verification_questions", "verification_question"},
+    "verify": {
+        "original_question",
+        "baseline_response",
+        "verification_questions",
+        "verification_answers",
+        "verification_questions_and_answers",
+    },
+    "fused": {"original_question"},
+}
+
+# Intermediate CoVe outputs that may be compressed or trimmed to fit a prompt budget
+TRIMMABLE_FIELDS = [
+    "baseline_response",
+    "verification_questions",
+    "verification_answers",
+    "verification_questions_and_answers",
+]
+
+_FORMATTER = string.Formatter()
+
+
+def _escape(text: str) -> str:
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast tokenizer-free estimate (about 4 characters per token), rounded up."""
+    return (len(text) + 3) // 4
+
+
+def get_fields(template: str) -> Set[str]:
+    return {field for _, field, _, _ in _FORMATTER.parse(template) if field is not None}
+
+
+class CompiledPrompt:
+    """A task template fused with a model's prompt format, rendered in a single pass.
+
+    The model wrapper (e.g. LLAMA_PROMPT_FORMAT) is expanded once, with the
+    task template in place of `{prompt}` and the command as literal text, so
+    each call does one `format_map` instead of two `format` calls. Rendering
+    gives the same text as `prompt_format.format(prompt=template.format(...), command=...)`.
+    """
+
+    def __init__(self, name: str, template: str, prompt_format: str, command: str, allowed_fields: Set[str]):
+        self.name = name
+        self.fields = get_fields(template)
+        unknown = self.fields - allowed_fields
+        if unknown:
+            raise ValueError(
+                f"Template for stage '{name}' uses unknown placeholders {sorted(unknown)}; "
+                f"available: {sorted(allowed_fields)}"
+            )
+        wrapper_fields = get_fields(prompt_format)
+        if not wrapper_fields <= {"prompt", "command"}:
+            raise ValueError(
+                f"Prompt format uses unknown placeholders {sorted(wrapper_fields - {'prompt', 'command'})}"
+            )
+
+        fused = []
+        for literal, field, _, _ in _FORMATTER.parse(prompt_format):
+            fused.append(_escape(literal))
+            if field == "prompt":
+                fused.append(template)
+            elif field == "command":
+                fused.append(_escape(command))
+        self.template = "".join(fused)
+
+        # Text before the first placeholder, identical for every call of the stage
+        prefix = []
+        for literal, field, _, _ in _FORMATTER.parse(self.template):
+            prefix.append(literal)
+            if field is not None:
+                break
+        self.static_prefix = "".join(prefix)
+
+    def render(self, **values) -> str:
+        missing = self.fields - values.keys()
+        if missing:
+            raise ValueError(f"Missing values {sorted(missing)} for the '{self.name}' prompt")
+        return self.template.format_map(values)
+
+    def render_within_budget(
+        self, budget: int, count_tokens: Callable[[str], int], **values
+    ) -> Tuple[str, int, int]:
+        """Render, compressing and trimming intermediate outputs to fit `budget` tokens.
+
+        Blank lines are dropped first; then the last line of the longest
+        trimmable segment is removed until the prompt fits, so numbered lists
+        lose their tail items rather than being cut mid-item. Returns the
+        prompt, its token count and the number of tokens removed.
+        """
+        prompt = self.render(**values)
+        original_tokens = total = count_tokens(prompt)
+        if total <= budget:
+            return prompt, total, 0
+
+        trimmable = [field for field in TRIMMABLE_FIELDS if field in self.fields]
+        if not trimmable or count_tokens(self.render(**{**values, **dict.fromkeys(trimmable, "")})) > budget:
+            # The instructions alone do not fit, trimming cannot help
+            return prompt, total, 0
+        lines = {
+            field: re.sub(r"\n\s*\n", "\n", values[field]).strip().split("\n")
+            for field in trimmable
+        }
+        while True:
+            values.update({field: "\n".join(lines[field]) for field in trimmable})
+            prompt = self.render(**values)
+            total = count_tokens(prompt)
+            if total <= budget:
+                break
+            field = max(trimmable, key=lambda f: len(values[f]))
+            if len(lines[field]) > 1:
+                lines[field].pop()
+            else:
+                lines[field][0] = lines[field][0][: len(lines[field][0]) // 2]
+        return prompt, total, original_tokens - total
+
+
+def compile_stage_prompts(
+    task_config: TaskConfig, setting: str, stage_models: Dict[str, str]
+) -> Dict[str, CompiledPrompt]:
+    """Compile the baseline and `setting` templates of a task, one per stage.
+
+    `stage_models` maps every stage to the model that serves it, whose
+    prompt format wraps the stage template.
+    """
+    setting_config = getattr(task_config, setting)
+    if setting == "joint":
+        stages = {
+            "plan_and_execute": (
+                setting_config.plan_and_execute_prompt,
+                setting_config.plan_and_execute_command,
+            ),
+            "verify": (setting_config.verify_prompt, setting_config.verify_command),
+        }
+    elif setting == "fused":
+        stages = {"fused": (setting_config.fused_prompt, setting_config.fused_command)}
+    else:
+        stages = {
+            "plan": (setting_config.plan_prompt, setting_config.plan_command),
+            "execute": (setting_config.execute_prompt, setting_config.execute_command),
+            "verify": (setting_config.verify_prompt, setting_config.verify_command),
+        }
+    stages["baseline"] = (task_config.baseline_prompt, task_config.baseline_command)
+
+    return {
+        stage: CompiledPrompt(
+            stage,
+            template,
+            MODEL_MAPPING[stage_models[stage]].prompt_format,
+            command,
+            STAGE_FIELDS[stage],
+        )
+        for stage, (template, command) in stages.items()
+    }
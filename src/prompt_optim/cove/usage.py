@@ -0,0 +1,79 @@
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from ...utils import MODEL_MAPPING
+
+
+class UsageTracker:
+    """Per (stage, model) accounting of LLM calls, tokens, latency and cost."""
+
+    FIELDS = ["calls", "prompt_tokens", "completion_tokens", "seconds", "trimmed_prompts", "trimmed_tokens", "cached_tokens"]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage: Dict[Tuple[str, str], Dict[str, float]] = defaultdict(
+            lambda: dict.fromkeys(self.FIELDS, 0)
+        )
+
+    def record(
+        self,
+        stage: str,
+        model_id: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        seconds: float,
+    ):
+        with self._lock:
+            usage = self._usage[stage, model_id]
+            usage["calls"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["seconds"] += seconds
+
+    def record_trim(self, stage: str, model_id: str, trimmed_tokens: int):
+        """A prompt of the stage was trimmed by `trimmed_tokens` to fit its budget."""
+        with self._lock:
+            usage = self._usage[stage, model_id]
+            usage["trimmed_prompts"] += 1
+            usage["trimmed_tokens"] += trimmed_tokens
+
+    def record_cached(self, stage: str, model_id: str, cached_tokens: int):
+        """`cached_tokens` of a call's prompt tokens were read from a context cache."""
+        with self._lock:
+            self._usage[stage, model_id]["cached_tokens"] += cached_tokens
+
+    @staticmethod
+    def cost(model_id: str, prompt_tokens: int, completion_tokens: int) -> float:
+        model_config = MODEL_MAPPING[model_id]
+        return (
+            prompt_tokens * model_config.input_cost_per_1k
+            + completion_tokens * model_config.output_cost_per_1k
+        ) / 1000
+
+    def rows(self) -> List[Dict[str, float]]:
+        with self._lock:
+            items = sorted(self._usage.items())
+        rows = []
+        for (stage, model_id), usage in items:
+            row = {"stage": stage, "model": model_id, **usage}
+            row["seconds"] = round(row["seconds"], 3)
+            row["cost"] = round(
+                self.cost(model_id, usage["prompt_tokens"], usage["completion_tokens"]), 6
+            )
+            rows.append(row)
+        return rows
+
+    def report(self) -> str:
+        rows = self.rows()
+        header = f"{'stage':<18}{'model':<24}{'calls':>7}{'prompt tok':>12}{'output tok':>12}{'seconds':>10}{'cost $':>10}{'trimmed':>9}"
+        lines = [header]
+        for row in rows:
+            lines.append(
+                f"{row['stage']:<18}{row['model']:<24}{row['calls']:>7}{row['prompt_tokens']:>12}"
+                f"{row['completion_tokens']:>12}{row['seconds']:>10.1f}{row['cost']:>10.4f}{row['trimmed_prompts']:>9}"
+            )
+        total_cost = sum(row["cost"] for row in rows)
+        total_seconds = sum(row["seconds"] for row in rows)
+        lines.append(f"{'total':<42}{sum(row['calls'] for row in rows):>7}{'':>24}{total_seconds:>10.1f}{total_cost:>10.4f}")
+        return "\n".join(lines)
@@ -1,9 +1,9 @@
 import dataclasses
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
-from huggingface_hub import login
+import json
+import os
+from typing import Dict, List, Optional, Tuple
 
-from src.prompts import (
+from src.prompt_optim.cove.prompts import (
     BASELINE_PROMPT_WIKI,
     PLAN_VERIFICATION_TWO_STEP_PROMPT_WIKI,
     EXECUTE_VERIFICATION_TWO_STEP_PROMPT_WIKI,
@@ -14,6 +14,8 @@ from src.prompts import (
     ##
     EXECUTE_VERIFICATION_FACTORED_PROMPT_WIKI,
     ##
+    FUSED_PROMPT_WIKI,
+    ##
     BASELINE_PROMPT_WIKI_CATEGORY,
     PLAN_VERIFICATION_TWO_STEP_PROMPT_WIKI_CATEGORY,
     EXECUTE_VERIFICATION_TWO_STEP_PROMPT_WIKI_CATEGORY,
@@ -24,6 +26,8 @@ from src.prompts import (
     ##
     EXECUTE_VERIFICATION_FACTORED_PROMPT_WIKI_CATEGORY,
     ##
+    FUSED_PROMPT_WIKI_CATEGORY,
+    ##
     BASELINE_PROMPT_MULTI_QA,
     PLAN_VERIFICATION_TWO_STEP_PROMPT_MULTI_QA,
     EXECUTE_VERIFICATION_TWO_STEP_PROMPT_MULTI_QA,
@@ -33,9 +37,20 @@ from src.prompts import (
     FINAL_VERIFIED_JOINT_PROMPT_MULTI_QA,
     ##
     EXECUTE_VERIFICATION_FACTORED_PROMPT_MULTI_QA,
+    ##
+    FUSED_PROMPT_MULTI_QA,
 )
 
-SETTINGS = ["two_step", "joint", "factored"]
+SETTINGS = ["two_step", "joint", "factored", "fused"]
+
+# LLM calls made by the chains, used for per-stage model routing and usage reports
+STAGES = ["baseline", "plan", "execute", "plan_and_execute", "verify", "fused"]
+
+# Stages whose response is a numbered list, constrained to one with --constrained-lists
+LIST_STAGES = ["baseline", "plan", "verify"]
+
+# Sentence encoder of the semantic cache, run on the CPU
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
 @dataclasses.dataclass
 class FactoredConfig:
@@ -70,6 +85,13 @@ class JointConfig:
     plan_and_execute_command: str = " Verification Questions and Answers: "
     verify_command: str = " Final Refined Answer: "
 
+@dataclasses.dataclass
+class FusedConfig:
+    # Baseline, verification questions and answers and the refined answer, as one JSON response
+    max_tokens_fused: int
+    fused_prompt: str
+    fused_command: str = " JSON: "
+
 @dataclasses.dataclass
 class TaskConfig:
     id: str
@@ -78,7 +100,11 @@ class TaskConfig:
     two_step: TwoStepConfig
     joint: JointConfig
     factored: FactoredConfig
+    fused: FusedConfig
     baseline_command: str = " Answer: "
+    # Stages answering with a numbered list, and the most items such a list keeps
+    list_stages: List[str] = dataclasses.field(default_factory=lambda: list(LIST_STAGES))
+    max_list_items: int = 10
 
 
 TASK_MAPPING = {
@@ -108,6 +134,10 @@ TASK_MAPPING = {
             max_tokens_execute=70,
             max_tokens_verify=300,
         ),
+        fused=FusedConfig(
+            fused_prompt=FUSED_PROMPT_WIKI,
+            max_tokens_fused=900,
+        ),
     ),
     "multispanqa": TaskConfig(
         id="multispanqa",
@@ -135,6 +165,12 @@ TASK_MAPPING = {
             max_tokens_execute=90,
             max_tokens_verify=300,
         ),
+        fused=FusedConfig(
+            fused_prompt=FUSED_PROMPT_MULTI_QA,
+            max_tokens_fused=1100,
+        ),
+        # Answers are open text, only the verification questions are a list
+        list_stages=["plan"],
     ),
     "wikidata_category": TaskConfig(
         id="wikidata_category",
@@ -162,16 +198,71 @@ TASK_MAPPING = {
             max_tokens_execute=70,
             max_tokens_verify=150,
         ),
+        fused=FusedConfig(
+            fused_prompt=FUSED_PROMPT_WIKI_CATEGORY,
+            max_tokens_fused=700,
+        ),
     ),
 }
 
 
+@dataclasses.dataclass
+class LoadProfile:
+    """How a HuggingFace model is loaded: quantization, dtype, attention and device."""
+
+    # none, 8bit, 4bit (bitsandbytes NF4), or gptq/awq for pre-quantized checkpoints
+    quantization: str = "none"
+    # auto, float16, bfloat16 or float32; the compute dtype for 4bit
+    dtype: str = "auto"
+    # eager, sdpa or flash_attention_2; None leaves the choice to transformers (SDPA where supported)
+    attention: Optional[str] = None
+    # auto spreads the model over the available GPUs; cpu keeps it in RAM
+    device_map: str = "auto"
+
+    @property
+    def needs_cuda(self) -> bool:
+        return self.device_map != "cpu" and (
+            self.quantization != "none" or self.attention == "flash_attention_2"
+        )
+
+
+LOAD_PROFILES = {
+    "nf4": LoadProfile(quantization="4bit", dtype="bfloat16"),
+    "8bit": LoadProfile(quantization="8bit", dtype="float16"),
+    "fp16": LoadProfile(dtype="float16", attention="sdpa"),
+    "bf16": LoadProfile(dtype="bfloat16", attention="sdpa"),
+    "fp16_flash": LoadProfile(dtype="float16", attention="flash_attention_2"),
+    "gptq": LoadProfile(quantization="gptq", dtype="float16"),
+    "awq": LoadProfile(quantization="awq", dtype="float16"),
+    "cpu": LoadProfile(dtype="float32", attention="sdpa", device_map="cpu"),
+}
+# Used when a profile needs CUDA and no GPU is available
+CPU_FALLBACK_PROFILE = "cpu"
+# Local model snapshots written by src/prepare_model.py, relative to the project root
+SNAPSHOT_DIR = "models"
+SNAPSHOT_MANIFEST = "prepared.json"
+
+
 @dataclasses.dataclass
 class ModelConfig:
     id: str
     prompt_format: str
     is_llama: bool = False
     is_protected: bool = False
+    backend: str = "hf"
+    # Prompt + generated tokens the model can attend to
+    context_window: int = 4096
+    # USD per 1k tokens, 0 for self-hosted models
+    input_cost_per_1k: float = 0.0
+    output_cost_per_1k: float = 0.0
+    # Default LOAD_PROFILES entry for HuggingFace models
+    load_profile: str = "nf4"
+    # Pre-quantized checkpoints used by the gptq / awq profiles
+    quantized_ids: Dict[str, str] = dataclasses.field(default_factory=dict)
+    # MODEL_MAPPING key of a smaller model with the same tokenizer, drafting
+    # `draft_tokens` tokens per target forward pass with --speculative
+    draft_model: Optional[str] = None
+    draft_tokens: int = 4
 
 STD_PROMPT_FORMAT = """{prompt}"""
 GPT_PROMPT_FORMAT = """{prompt}\n\nAnswer:"""
@@ -184,30 +275,48 @@ MODEL_MAPPING = {
         prompt_format=GPT_PROMPT_FORMAT,
         is_llama=False,
         is_protected=False,
+        backend="openai",
+        context_window=4096,
+        input_cost_per_1k=0.0015,
+        output_cost_per_1k=0.002,
     ),
     "llama2": ModelConfig(
         id="meta-llama/Llama-2-13b-chat-hf",
         prompt_format=LLAMA_PROMPT_FORMAT,
         is_llama=True,
         is_protected=True,
+        quantized_ids={
+            "gptq": "TheBloke/Llama-2-13B-chat-GPTQ",
+            "awq": "TheBloke/Llama-2-13B-chat-AWQ",
+        },
     ),
     "llama2_70b": ModelConfig(
         id="meta-llama/Llama-2-70b-chat-hf",
         prompt_format=LLAMA_PROMPT_FORMAT,
         is_llama=True,
         is_protected=True,
+        quantized_ids={
+            "gptq": "TheBloke/Llama-2-70B-chat-GPTQ",
+            "awq": "TheBloke/Llama-2-70B-chat-AWQ",
+        },
+        draft_model="llama2",
     ),
     "llama-65b": ModelConfig(
         id="huggyllama/llama-65b",
         prompt_format=LLAMA_PROMPT_FORMAT,
         is_llama=True,
         is_protected=False,
+        context_window=2048,
     ),
     "gemini2.5_flash_lite": ModelConfig(
         id="gemini-2.5-flash-lite",
         prompt_format=STD_PROMPT_FORMAT,
         is_llama=False,
         is_protected=False,
+        backend="google",
+        context_window=1048576,
+        input_cost_per_1k=0.0001,
+        output_cost_per_1k=0.0004,
     ),
 }
 
@@ -223,30 +332,110 @@ def get_absolute_path(path_relative_to_project_root):
 
     return final_directory
 
-def import_model_and_tokenizer(model: ModelConfig, access_token: str = None):
-    bnb_config = BitsAndBytesConfig(
-        load_in_4bit=True,
-        bnb_4bit_use_double_quant=True,
-        bnb_4bit_quant_type="nf4",
-        bnb_4bit_compute_dtype=torch.bfloat16,
-    )
+def resolve_load_profile(model: ModelConfig, load_profile: Optional[str] = None) -> Tuple[str, LoadProfile]:
+    """The profile to load `model` with, falling back to CPU when it needs a missing GPU."""
+    import torch
 
-    if model.is_protected and access_token is not None:
-        login(token=access_token)
-        language_model = AutoModelForCausalLM.from_pretrained(
-            model.id,
-            quantization_config=bnb_config,
-            use_cache=True,
-            device_map="auto",
-            token=access_token,
+    name = load_profile or model.load_profile
+    if name not in LOAD_PROFILES:
+        raise ValueError(f"Invalid load profile {name}. Valid profiles are: {', '.join(LOAD_PROFILES)}")
+    profile = LOAD_PROFILES[name]
+    if profile.quantization in ["gptq", "awq"] and profile.quantization not in model.quantized_ids:
+        raise ValueError(f"Model {model.id} has no pre-quantized {profile.quantization} checkpoint")
+    if profile.needs_cuda and not torch.cuda.is_available():
+        print(f"⚠️ Load profile {name} needs a CUDA GPU, falling back to {CPU_FALLBACK_PROFILE}")
+        name = CPU_FALLBACK_PROFILE
+        profile = LOAD_PROFILES[name]
+    return name, profile
+
+
+def get_snapshot_path(model: ModelConfig, profile_name: str) -> str:
+    return get_absolute_path(os.path.join(SNAPSHOT_DIR, f"{model.id.replace('/', '--')}-{profile_name}"))
+
+
+def find_snapshot(model: ModelConfig, profile_name: str) -> Optional[str]:
+    """The prepared snapshot of `model` for a load profile, if src/prepare_model.py saved one."""
+    path = get_snapshot_path(model, profile_name)
+    manifest_path = os.path.join(path, SNAPSHOT_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    source_id = model.quantized_ids.get(LOAD_PROFILES[profile_name].quantization, model.id)
+    if manifest.get("source_id") != source_id or manifest.get("profile") != profile_name:
+        print(f"⚠️ Ignoring snapshot {path}: it was prepared from {manifest.get('source_id')} with {manifest.get('profile')}")
+        return None
+    return path
+
+
+def get_load_kwargs(profile: LoadProfile, prequantized: bool = False) -> Dict:
+    """from_pretrained keyword arguments of a load profile.
+
+    With `prequantized`, the checkpoint was saved already quantized and its
+    config carries the quantization_config, so none is passed.
+    """
+    import torch
+    import transformers
+    from transformers import BitsAndBytesConfig
+
+    dtype = "auto" if profile.dtype == "auto" else getattr(torch, profile.dtype)
+    kwargs = {"use_cache": True, "device_map": profile.device_map}
+    if profile.quantization not in ["4bit", "8bit"]:
+        kwargs["torch_dtype"] = dtype
+    if profile.quantization == "4bit" and not prequantized:
+        kwargs["quantization_config"] = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_use_double_quant=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=dtype if dtype != "auto" else torch.bfloat16,
         )
-    else:
-        language_model = AutoModelForCausalLM.from_pretrained(
-            model.id, quantization_config=bnb_config, use_cache=True, device_map="auto"
+    elif profile.quantization == "8bit" and not prequantized:
+        kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+    # gptq / awq checkpoints carry their own quantization_config
+
+    # `attn_implementation` exists from transformers 4.36; before, only flash attention 2 has a switch
+    major, minor = (int(part) for part in transformers.__version__.split(".")[:2])
+    if (major, minor) >= (4, 36) and profile.attention is not None:
+        kwargs["attn_implementation"] = profile.attention
+    elif profile.attention == "flash_attention_2":
+        kwargs["use_flash_attention_2"] = True
+    return kwargs
+
+
+def load_model(model: ModelConfig, access_token: str = None, load_profile: Optional[str] = None):
+    # Imported here so API-backed chains, evaluation and benchmarks run without torch
+    from transformers import AutoModelForCausalLM
+    from huggingface_hub import login
+
+    name, profile = resolve_load_profile(model, load_profile)
+    model_id = model.quantized_ids.get(profile.quantization, model.id)
+    snapshot = find_snapshot(model, name)
+    if snapshot is not None:
+        # Safetensors are memory-mapped: no download, conversion or quantization pass
+        print(f"📦 Loading {model_id} with the {name} profile from the prepared snapshot {snapshot}")
+        return AutoModelForCausalLM.from_pretrained(
+            snapshot, local_files_only=True, **get_load_kwargs(profile, prequantized=True)
         )
 
-    tokenizer = AutoTokenizer.from_pretrained(model.id)
+    kwargs = get_load_kwargs(profile)
+    if model.is_protected and access_token is not None:
+        login(token=access_token)
+        kwargs["token"] = access_token
+    print(f"📦 Loading {model_id} with the {name} profile")
+    return AutoModelForCausalLM.from_pretrained(model_id, **kwargs)
+
+
+def load_tokenizer(model: ModelConfig, snapshot: Optional[str] = None):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(snapshot or model.id)
     tokenizer.pad_token = tokenizer.eos_token
     tokenizer.padding_side = "right"
+    # Overlong prompts lose the start of the instructions, never the question
+    tokenizer.truncation_side = "left"
+    return tokenizer
+
 
-    return language_model, tokenizer
+def import_model_and_tokenizer(model: ModelConfig, access_token: str = None, load_profile: Optional[str] = None):
+    name, _ = resolve_load_profile(model, load_profile)
+    return load_model(model, access_token, name), load_tokenizer(model, find_snapshot(model, name))
@@ -0,0 +1,71 @@
+from concurrent.futures import wait
+
+import pytest
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from src.prompt_optim.cove.batching import ContinuousBatchingEngine
+
+PROMPT_LENGTHS = [3, 7, 12, 5]
+MAX_NEW_TOKENS = [10, 4, 7, 12]
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=128,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+@pytest.fixture(scope="module")
+def prompts():
+    generator = torch.Generator().manual_seed(1)
+    return [torch.randint(3, 128, (length,), generator=generator).tolist() for length in PROMPT_LENGTHS]
+
+
+def reference_tokens(model, prompt_ids, max_new_tokens, eos_token_id=None):
+    with torch.inference_mode():
+        output = model.generate(
+            input_ids=torch.tensor([prompt_ids]),
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            eos_token_id=eos_token_id,
+            pad_token_id=0,
+        )
+    return output[0, len(prompt_ids):].tolist()
+
+
+def test_greedy_batches_match_generate(model, prompts):
+    model.generation_config.eos_token_id = None
+    engine = ContinuousBatchingEngine(model, max_batch_size=3, do_sample=False)
+    try:
+        # Sequences of different lengths join and leave the batch at different steps
+        futures = [engine.submit(prompt, n) for prompt, n in zip(prompts, MAX_NEW_TOKENS)]
+        wait(futures)
+    finally:
+        engine.close()
+    for prompt, n, future in zip(prompts, MAX_NEW_TOKENS, futures):
+        assert future.result().tokens == reference_tokens(model, prompt, n)
+    assert engine.mean_batch_size > 1
+
+
+def test_greedy_batches_stop_at_eos_like_generate(model, prompts):
+    model.generation_config.eos_token_id = None
+    # A token the first sequence emits midway, which ends it there
+    eos_token_id = reference_tokens(model, prompts[0], 10)[4]
+    engine = ContinuousBatchingEngine(model, max_batch_size=4, do_sample=False, eos_token_id=eos_token_id)
+    try:
+        futures = [engine.submit(prompt, n) for prompt, n in zip(prompts, MAX_NEW_TOKENS)]
+        wait(futures)
+    finally:
+        engine.close()
+    for prompt, n, future in zip(prompts, MAX_NEW_TOKENS, futures):
+        assert future.result().tokens == reference_tokens(model, prompt, n, eos_token_id)
+    assert len(futures[0].result().tokens) <= 5
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from benchmarks.simulated_backend import ChainOfVerificationSimulated, SimulationConfig
+from src.prompt_optim.cove.context_cache import CacheNotFoundError, ContextCache, LocalCacheProvider
+
+QUESTIONS = ["Who are some politicians who were born in Boston?", "Who are some actors who were born in Paris?"]
+
+
+def test_local_provider_lifecycle():
+    provider = LocalCacheProvider()
+    name = provider.create("model", "prefix", ttl=60)
+    assert provider.resolve(name) == "prefix"
+    provider.refresh(name, ttl=60)
+    provider.delete(name)
+    with pytest.raises(CacheNotFoundError):
+        provider.resolve(name)
+
+
+def test_local_provider_expires_contents():
+    provider = LocalCacheProvider()
+    name = provider.create("model", "prefix", ttl=0.01)
+    time.sleep(0.02)
+    with pytest.raises(CacheNotFoundError):
+        provider.refresh(name, ttl=60)
+
+
+def test_short_prefixes_are_not_cached():
+    cache = ContextCache(LocalCacheProvider(), min_tokens=100)
+    assert cache.handle("model", "short prefix", 10) is None
+    assert cache.counts["short"] == 1
+
+
+def test_handles_are_shared_and_refreshed():
+    provider = LocalCacheProvider()
+    cache = ContextCache(provider, ttl=60, min_tokens=1)
+    handle = cache.handle("model", "prefix", 10)
+    assert cache.handle("model", "prefix", 10) is handle
+    assert cache.handle("other model", "prefix", 10) is not handle
+
+    handle.expires_at = time.monotonic() + 1  # within the refresh margin of 6s
+    assert cache.handle("model", "prefix", 10) is handle
+    assert handle.expires_at > time.monotonic() + 50
+    assert (cache.counts["created"], cache.counts["refreshed"], cache.counts["hits"]) == (2, 1, 4)
+
+
+def test_lost_contents_are_created_again():
+    provider = LocalCacheProvider()
+    cache = ContextCache(provider, ttl=60, min_tokens=1)
+    handle = cache.handle("model", "prefix", 10)
+    provider.delete(handle.name)
+    handle.expires_at = time.monotonic()
+    renewed = cache.handle("model", "prefix", 10)
+    assert renewed.name != handle.name
+    assert provider.resolve(renewed.name) == "prefix"
+    assert cache.counts["expired"] == 1
+
+
+def test_close_deletes_every_content():
+    provider = LocalCacheProvider()
+    cache = ContextCache(provider, min_tokens=1)
+    names = [cache.handle("model", prefix, 10).name for prefix in ["a", "b"]]
+    cache.close()
+    for name in names:
+        with pytest.raises(CacheNotFoundError):
+            provider.resolve(name)
+
+
+def test_run_releases_its_cached_contents(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chain = ChainOfVerificationSimulated(
+        "gemini2.5_flash_lite", "wikidata", "factored", QUESTIONS,
+        config=SimulationConfig(latency_mean=0.0), context_cache=True, cache_min_tokens=1,
+    )
+    chain.run_chain()
+    assert chain.cache_counts["created"] > 0
+    assert chain.backend.caches._contents == {}
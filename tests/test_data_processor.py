@@ -0,0 +1,138 @@
+import json
+import random
+
+import pytest
+
+from src.data.data_processor import (
+    IncrementalListParser,
+    _close_json,
+    _load_json_object,
+    get_items_from_answer,
+    parse_fraction,
+    parse_fused_response,
+    select_questions,
+)
+
+LIST_RESPONSES = [
+    "1. Barack Obama\n2. John F. Kennedy\n3. Mitt Romney",
+    "\n 1. First question?\n2. Second question?\n\n3. Third question?\n\n",
+    "1. Only one item",
+    "1. Trailing spaces   \n2. Last one \n  \n",
+]
+
+
+def parse_in_chunks(response, boundaries):
+    parser = IncrementalListParser()
+    items = []
+    starts = [0, *boundaries]
+    for start, end in zip(starts, [*boundaries, len(response)]):
+        items += parser.feed(response[start:end])
+    return items + parser.finish()
+
+
+@pytest.mark.parametrize("response", LIST_RESPONSES)
+def test_incremental_parser_matches_whole_response(response):
+    expected = get_items_from_answer(response.strip())
+    assert parse_in_chunks(response, []) == expected
+    assert parse_in_chunks(response, list(range(1, len(response)))) == expected
+    for split in range(1, len(response)):
+        assert parse_in_chunks(response, [split]) == expected
+    rng = random.Random(0)
+    for _ in range(50):
+        boundaries = sorted(rng.sample(range(1, len(response)), rng.randint(0, len(response) - 1)))
+        assert parse_in_chunks(response, boundaries) == expected
+
+FUSED_RESPONSE = json.dumps({
+    "baseline_answer": ["Barack Obama", "Mitt Romney"],
+    "verification": [
+        {"question": "Was Barack Obama born in Boston?", "answer": "No, in Honolulu."},
+        {"question": "Was Mitt Romney born in Boston?", "answer": "No, in Detroit."},
+    ],
+    "verified_answer": ["John F. Kennedy", "Michael Dukakis"],
+})
+
+
+def test_close_json_closes_open_containers_but_not_strings():
+    assert json.loads(_close_json('{"a": [1, {"b": [2')) == {"a": [1, {"b": [2]}]}
+    assert json.loads(_close_json('{"a": "x]}"')) == {"a": "x]}"}
+    with pytest.raises(ValueError):
+        json.loads(_close_json('{"a": ["cut off'))
+
+
+def test_fused_response_in_code_fence():
+    baseline, verification, verified, status = parse_fused_response(f"```json\n{FUSED_RESPONSE}\n```")
+    assert status == "json"
+    assert baseline == ["Barack Obama", "Mitt Romney"]
+    assert verification[1] == ("Was Mitt Romney born in Boston?", "No, in Detroit.")
+    assert verified == ["John F. Kennedy", "Michael Dukakis"]
+
+
+def test_fused_response_truncated_mid_array():
+    response = FUSED_RESPONSE[:FUSED_RESPONSE.index('{"question": "Was Mitt')]
+    data, status = _load_json_object(response)
+    assert status == "repaired" and len(data["verification"]) == 1
+    baseline, verification, verified, status = parse_fused_response(response)
+    assert status == "repaired"
+    assert verification == [("Was Barack Obama born in Boston?", "No, in Honolulu.")]
+    # No verified answer was written yet, so the baseline stands
+    assert verified == baseline == ["Barack Obama", "Mitt Romney"]
+
+
+def test_fused_response_truncated_mid_string_in_verified_answer():
+    response = FUSED_RESPONSE[:FUSED_RESPONSE.index("Dukakis")]
+    data, status = _load_json_object(response)
+    assert status == "repaired" and data["verified_answer"] == ["John F. Kennedy"]
+    baseline, verification, verified, status = parse_fused_response(response)
+    assert status == "repaired"
+    assert len(verification) == 2
+    # A shortened verified answer is never kept, half a name even less
+    assert verified == baseline == ["Barack Obama", "Mitt Romney"]
+
+
+def test_response_without_json_is_read_as_a_list():
+    assert _load_json_object("1. Barack Obama\n2. Mitt Romney") == (None, "failed")
+    baseline, verification, verified, status = parse_fused_response("1. Barack Obama\n2. Mitt Romney\n")
+    assert status == "failed"
+    assert baseline == verified == ["Barack Obama", "Mitt Romney"]
+    assert verification == []
+    assert parse_fused_response('{"baseline_answer": ["Barack') == ([], [], [], "failed")
+
+
+def test_select_questions_applies_window_then_sample_then_shard():
+    questions = [f"question {i}" for i in range(100)]
+    indices, selected = select_questions(questions, offset=10, limit=40)
+    assert indices == list(range(10, 50))
+    assert selected == [questions[i] for i in indices]
+
+    sample, _ = select_questions(questions, offset=10, limit=40, sample_seed=0, sample_fraction=0.25)
+    assert len(sample) == 10 and sample == sorted(sample)
+    assert set(sample) <= set(range(10, 50))
+    assert select_questions(questions, offset=10, limit=40, sample_seed=0, sample_fraction=0.25)[0] == sample
+
+    shards = [
+        select_questions(questions, offset=10, limit=40, sample_seed=0, sample_fraction=0.25, shard=(i, 3))[0]
+        for i in range(3)
+    ]
+    assert [len(shard) for shard in shards] == [3, 3, 4]
+    assert sum(shards, []) == sample
+
+
+def test_select_questions_rejects_invalid_selections():
+    questions = [f"question {i}" for i in range(10)]
+    with pytest.raises(ValueError):
+        select_questions(questions, offset=-1)
+    with pytest.raises(ValueError):
+        select_questions(questions, limit=-1)
+    with pytest.raises(ValueError):
+        select_questions(questions, sample_seed=0, sample_fraction=1.5)
+
+
+@pytest.mark.parametrize("value", ["0", "-0.1", "1.5", "nan"])
+def test_parse_fraction_rejects_values_outside_unit_interval(value):
+    with pytest.raises(ValueError):
+        parse_fraction(value)
+
+
+def test_parse_fraction_accepts_whole_dataset():
+    assert parse_fraction("1") == 1.0
+    assert parse_fraction("0.05") == 0.05
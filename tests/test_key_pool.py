@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from src.prompt_optim.cove.concurrency import AdaptiveConcurrencyLimiter
+from src.prompt_optim.cove.cove_chains_google import ChainOfVerificationGoogle
+from src.prompt_optim.cove.key_pool import KeyPool
+
+
+class FakeClient:
+    """Answers every request but the first `throttled` ones sent with `throttled_label`."""
+
+    def __init__(self, throttled_label, throttled=1):
+        self.throttled_label = throttled_label
+        self.throttled = throttled
+        self.requests = []
+
+    def request(self, key_label):
+        self.requests.append(key_label)
+        if key_label == self.throttled_label and self.throttled:
+            self.throttled -= 1
+            raise Exception("429 Resource has been exhausted (e.g. check quota).")
+        return "answer"
+
+
+def make_chain(api_keys, **pool_kwargs):
+    # No genai client is configured: only the pool and the limiter are exercised
+    chain = object.__new__(ChainOfVerificationGoogle)
+    chain.key_pool = KeyPool(api_keys, min_request_interval=0.0, **pool_kwargs)
+    chain.limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+    return chain
+
+
+def test_throttled_key_moves_request_and_lowers_limit_once(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    chain = make_chain(["key-aaaa", "key-bbbb"])
+    key_a, key_b = chain.key_pool.keys
+    client = FakeClient(key_a.label)
+
+    result = chain.limited_call("baseline", lambda: chain.call_with_key(client.request))
+
+    assert result == "answer"
+    assert client.requests == [key_a.label, key_b.label]
+    assert key_a.throttles == 1 and key_a.disabled_until > time.monotonic()
+    assert key_b.throttles == 0
+    assert chain.limiter.throttled == 1
+    assert chain.limiter.limit == 2
+
+
+def test_exhausted_pool_reports_each_throttle_once(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    chain = make_chain(["key-aaaa"], max_consecutive_throttles=1)
+    (key,) = chain.key_pool.keys
+    client = FakeClient(key.label)
+
+    result = chain.limited_call("baseline", lambda: chain.call_with_key(client.request))
+
+    assert result == "answer"
+    assert client.requests == [key.label, key.label]
+    assert chain.limiter.throttled == 1
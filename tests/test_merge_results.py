@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from src.data.data_processor import select_questions
+from src.data.merge_results import merge_results
+
+
+def write_shard(tmp_path, name, indices):
+    path = tmp_path / name
+    path.write_text(json.dumps([{"Index": index, "Question": f"question {index}"} for index in indices]))
+    return str(path)
+
+
+def test_merge_orders_results_by_index(tmp_path):
+    paths = [write_shard(tmp_path, "shard1.json", [3, 5]), write_shard(tmp_path, "shard0.json", [0, 1])]
+    merged = merge_results(paths, expected_indices=[0, 1, 3, 5])
+    assert [result["Index"] for result in merged] == [0, 1, 3, 5]
+
+
+def test_merge_checks_the_selection_of_the_shards(tmp_path):
+    expected, _ = select_questions(range(100), offset=10, limit=40, sample_seed=0, sample_fraction=0.25)
+    paths = [
+        write_shard(tmp_path, f"shard{i}.json", select_questions(
+            range(100), offset=10, limit=40, sample_seed=0, sample_fraction=0.25, shard=(i, 2)
+        )[0])
+        for i in range(2)
+    ]
+    assert [result["Index"] for result in merge_results(paths, expected)] == expected
+
+
+def test_merge_rejects_missing_indices(tmp_path):
+    paths = [write_shard(tmp_path, "shard0.json", [0, 1])]
+    with pytest.raises(ValueError, match="missing"):
+        merge_results(paths, expected_indices=[0, 1, 2])
+
+
+def test_merge_rejects_duplicate_indices(tmp_path):
+    paths = [write_shard(tmp_path, "shard0.json", [0, 1]), write_shard(tmp_path, "shard1.json", [1, 2])]
+    with pytest.raises(ValueError, match="more than one shard"):
+        merge_results(paths)
+
+
+def test_merge_rejects_unexpected_indices(tmp_path):
+    paths = [write_shard(tmp_path, "shard0.json", [0, 1, 7])]
+    with pytest.raises(ValueError, match="outside the selection"):
+        merge_results(paths, expected_indices=[0, 1])
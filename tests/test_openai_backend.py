@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from benchmarks.mock_openai_server import ANSWER, serve
+from src.prompt_optim.cove.backends import BackendError, OpenAICompatibleBackend
+from src.prompt_optim.cove.cove_chains_openai import ChainOfVerificationOpenAI
+
+QUESTIONS = ["Who are some politicians who were born in Boston?", "Who are some actors who were born in Paris?"]
+
+
+@pytest.fixture
+def server():
+    server = serve()
+    yield server
+    server.shutdown()
+
+
+def base_url(server) -> str:
+    return f"http://127.0.0.1:{server.server_port}/v1"
+
+
+def test_completion_and_usage(server):
+    backend = OpenAICompatibleBackend(base_url(server), max_concurrency=2)
+    completion = backend.complete("mock", "Who was born in Boston?", 50, temperature=0.0)
+    backend.close()
+    assert completion.text == ANSWER
+    assert completion.prompt_tokens > 0 and completion.completion_tokens > 0
+    assert (backend.requests, backend.retries) == (1, 0)
+
+
+def test_connections_are_reused(server):
+    backend = OpenAICompatibleBackend(base_url(server), max_concurrency=1)
+    for _ in range(5):
+        backend.complete("mock", "prompt", 10)
+    backend.close()
+    assert server.requests == 5
+    assert len(server.connections) == 1
+
+
+def test_failures_are_retried_then_raised(server):
+    server.failure_rate = 1.0
+    backend = OpenAICompatibleBackend(base_url(server), max_retries=2, backoff=0.0)
+    with pytest.raises(BackendError):
+        backend.complete("mock", "prompt", 10)
+    backend.close()
+    assert (server.requests, backend.retries) == (3, 2)
+
+
+def test_unknown_path_is_not_retried(server):
+    backend = OpenAICompatibleBackend(f"http://127.0.0.1:{server.server_port}/v2", max_retries=3, backoff=0.0)
+    with pytest.raises(BackendError, match="HTTP 404"):
+        backend.complete("mock", "prompt", 10)
+    backend.close()
+    assert (server.requests, backend.retries) == (1, 0)
+
+
+def test_chain_runs_and_closes_its_recording(server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    chain = ChainOfVerificationOpenAI(
+        "gpt3", 0.07, 0.9, "wikidata", "two_step", QUESTIONS,
+        base_url=base_url(server), max_concurrency=2, record_path=str(tmp_path / "recording.jsonl"),
+    )
+    chain.run_chain()
+
+    with open(chain.result_file_path, encoding="utf-8") as f:
+        results = json.load(f)
+    assert [result["Question"] for result in results] == QUESTIONS
+    assert chain.recorder._file.closed
+    with open(tmp_path / "recording.jsonl", encoding="utf-8") as f:
+        calls = [json.loads(line) for line in f]
+    assert len(calls) == server.requests == chain.backend.requests
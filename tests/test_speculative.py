@@ -0,0 +1,73 @@
+import pytest
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from src.prompt_optim.cove.speculative import SpeculativeDecoder
+
+DRAFT_LAYERS = 1
+
+
+@pytest.fixture(scope="module")
+def models():
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=128,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=3,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+    )
+    model = LlamaForCausalLM(config).eval()
+    model.generation_config.eos_token_id = None
+    # The target only refines the draft's residual stream, so some proposals are accepted
+    with torch.no_grad():
+        for layer in model.model.layers[DRAFT_LAYERS:]:
+            layer.self_attn.o_proj.weight.mul_(0.1)
+            layer.mlp.down_proj.weight.mul_(0.1)
+    draft_config = LlamaConfig(**{**config.to_dict(), "num_hidden_layers": DRAFT_LAYERS})
+    draft_model = LlamaForCausalLM(draft_config).eval()
+    draft_model.load_state_dict({
+        name: weight
+        for name, weight in model.state_dict().items()
+        if not name.startswith("model.layers.") or int(name.split(".")[2]) < DRAFT_LAYERS
+    })
+    return model, draft_model
+
+
+@pytest.fixture(scope="module")
+def prompts():
+    generator = torch.Generator().manual_seed(1)
+    return [torch.randint(3, 128, (1, length), generator=generator) for length in [4, 9, 15]]
+
+
+def reference(model, prompt_ids, max_new_tokens, eos_token_id=None):
+    with torch.inference_mode():
+        return model.generate(
+            input_ids=prompt_ids,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            eos_token_id=eos_token_id,
+            pad_token_id=0,
+        )
+
+
+@pytest.mark.parametrize("draft_tokens", [1, 3, 5])
+def test_greedy_speculation_matches_generate(models, prompts, draft_tokens):
+    model, draft_model = models
+    decoder = SpeculativeDecoder(model, draft_model, draft_tokens=draft_tokens, temperature=0)
+    for prompt_ids in prompts:
+        assert torch.equal(decoder.generate(prompt_ids, 16), reference(model, prompt_ids, 16))
+    assert 0 < decoder.acceptance_rate < 1
+    assert decoder.tokens_per_pass > 1
+
+
+def test_greedy_speculation_stops_at_eos_like_generate(models, prompts):
+    model, draft_model = models
+    decoder = SpeculativeDecoder(model, draft_model, draft_tokens=4, temperature=0)
+    prompt_ids = prompts[1]
+    # A token generated midway, which ends the output there
+    eos_token_id = int(reference(model, prompt_ids, 16)[0, prompt_ids.shape[1] + 6])
+    output = decoder.generate(prompt_ids, 16, eos_token_id=eos_token_id)
+    assert torch.equal(output, reference(model, prompt_ids, 16, eos_token_id))
+    assert output[0, -1] == eos_token_id and output.shape[1] <= prompt_ids.shape[1] + 7